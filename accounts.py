@@ -0,0 +1,103 @@
+import sqlite3
+
+from auth import conflict_field, hash_password, identity_conflict
+from database import get_connection
+
+# Сообщения о занятых контактах: при редактировании профиля и при регистрации
+PROFILE_CONFLICTS = {
+    'email': "Данный адрес электронной почты уже занят.",
+    'phone': "Данный номер телефона уже занят.",
+}
+REGISTRATION_CONFLICTS = {
+    'email': "Электронная почта уже используется другим пользователем.",
+    'phone': "Номер телефона уже используется другим пользователем.",
+}
+
+INSERT_BUYER = "INSERT INTO users (first_name, last_name, email, phone_number, password_hash) VALUES (?,?,?,?,?)"
+INSERT_SELLER = """ INSERT INTO sellers (organization_name, business_email, business_phone, legal_address, password_hash)
+    VALUES (?,?,?,?,?) """
+
+BUYER_PROFILE = "SELECT first_name, last_name, email, phone_number FROM users WHERE id=?"
+SELLER_PROFILE = "SELECT organization_name, business_email, business_phone, legal_address FROM sellers WHERE id=?"
+UPDATE_BUYER = "UPDATE users SET first_name=?, last_name=?, email=?, phone_number=?"
+UPDATE_SELLER = "UPDATE sellers SET organization_name=?, business_email=?, business_phone=?, legal_address=?"
+
+# Все функции сообщают об ошибках ввода и занятых контактах через ValueError с текстом для пользователя.
+# Контакты проверяются поиском по identities; если их успели занять после проверки, вставку или изменение
+# отменяет уникальный индекс identities (триггеры учётных записей), и это тоже превращается в ValueError.
+
+
+def register_buyer(first_name, last_name, email, phone, password):
+    # Возвращает id покупателя
+    _check_fields([first_name, last_name, email, phone, password], "Все поля должны быть заполнены.", phone)
+    return _register(INSERT_BUYER, (first_name, last_name, email, phone), email, phone, password)
+
+
+def register_seller(organization_name, legal_address, email, phone, password):
+    # Возвращает id продавца
+    _check_fields([organization_name, legal_address, email, phone, password], "Все поля должны быть заполнены.", phone)
+    return _register(INSERT_SELLER, (organization_name, email, phone, legal_address), email, phone, password)
+
+
+def buyer_profile(user_id):
+    # (имя, фамилия, email, телефон) или None
+    return get_connection().execute(BUYER_PROFILE, (user_id,)).fetchone()
+
+
+def seller_profile(seller_id):
+    # (организация, email, телефон, юридический адрес) или None
+    return get_connection().execute(SELLER_PROFILE, (seller_id,)).fetchone()
+
+
+def update_buyer_profile(user_id, first_name, last_name, email, phone, new_password=None):
+    # Пустой new_password оставляет прежний пароль
+    _check_fields([first_name, last_name, email, phone], "Все поля должны быть заполнены.", phone)
+    _update_profile(UPDATE_BUYER, ('buyer', user_id), [first_name, last_name, email, phone], email, phone, new_password)
+
+
+def update_seller_profile(seller_id, organization_name, email, phone, legal_address, new_password=None):
+    _check_fields([organization_name, email, phone], "Необходимо заполнить обязательные поля.", phone)
+    _update_profile(UPDATE_SELLER, ('seller', seller_id), [organization_name, email, phone, legal_address],
+                    email, phone, new_password)
+
+
+def _check_fields(required, missing_message, phone):
+    if not all(required):
+        raise ValueError(missing_message)
+    if not phone.isdigit():
+        raise ValueError("Номер телефона должен содержать только цифры.")
+
+
+def _register(sql, values, email, phone, password):
+    conflict = identity_conflict(email, phone)
+    if conflict:
+        raise ValueError(REGISTRATION_CONFLICTS[conflict])
+
+    hashed_password = hash_password(password)
+    conn = get_connection()
+    try:
+        with conn:
+            cursor = conn.execute(sql, (*values, hashed_password))
+    except sqlite3.IntegrityError as e:
+        raise ValueError(REGISTRATION_CONFLICTS.get(conflict_field(e), str(e)))
+    return cursor.lastrowid
+
+
+def _update_profile(sql, account, values, email, phone, new_password):
+    conflict = identity_conflict(email, phone, account)
+    if conflict:
+        raise ValueError(PROFILE_CONFLICTS[conflict])
+
+    params = list(values)
+    if new_password:
+        sql += ", password_hash=?"
+        params.append(hash_password(new_password))
+    sql += " WHERE id=?"
+    params.append(account[1])
+
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute(sql, params)
+    except sqlite3.IntegrityError as e:
+        raise ValueError(PROFILE_CONFLICTS.get(conflict_field(e), str(e)))
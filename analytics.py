@@ -0,0 +1,81 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from database import get_connection
+
+# Периоды аналитики продавца: название и число последних дней, включая сегодняшний
+PERIODS = (("Неделя", 7), ("Месяц", 30), ("Год", 365))
+
+# Сколько товаров показывать в рейтинге
+TOP_PRODUCTS_LIMIT = 10
+
+# Дневные итоги оформленного заказа добавляются к сводным таблицам в транзакции оформления (checkout.place_order).
+# seller_id продаж к этому моменту уже заполнен триггером trg_sales_seller; заказ считается один раз на продавца и товар.
+ROLLUP_SELLER_DAY = """ INSERT INTO seller_daily_sales (seller_id, day, revenue, commission, units, orders_count)
+    SELECT seller_id, date(sale_date), SUM(sale_price * sold_quantity), SUM(COALESCE(commission, 0)), SUM(sold_quantity), 1
+    FROM sales WHERE order_id = ? GROUP BY seller_id, date(sale_date)
+    ON CONFLICT (seller_id, day) DO UPDATE SET revenue = revenue + excluded.revenue, commission = commission + excluded.commission,
+        units = units + excluded.units, orders_count = orders_count + 1 """
+
+ROLLUP_PRODUCT_DAY = """ INSERT INTO product_daily_sales (seller_id, day, product_id, revenue, commission, units, orders_count)
+    SELECT seller_id, date(sale_date), product_id, SUM(sale_price * sold_quantity), SUM(COALESCE(commission, 0)), SUM(sold_quantity), 1
+    FROM sales WHERE order_id = ? GROUP BY seller_id, date(sale_date), product_id
+    ON CONFLICT (seller_id, day, product_id) DO UPDATE SET revenue = revenue + excluded.revenue,
+        commission = commission + excluded.commission, units = units + excluded.units, orders_count = orders_count + 1 """
+
+# Пересчёт сводных таблиц по всем продажам (миграция и загрузка сгенерированных данных);
+# продажа без заказа считается отдельным заказом
+REBUILD_SELLER_DAYS = """ INSERT INTO seller_daily_sales (seller_id, day, revenue, commission, units, orders_count)
+    SELECT seller_id, date(sale_date), SUM(sale_price * sold_quantity), SUM(COALESCE(commission, 0)), SUM(sold_quantity),
+        COUNT(DISTINCT COALESCE(order_id, -id))
+    FROM sales WHERE seller_id IS NOT NULL GROUP BY seller_id, date(sale_date) """
+REBUILD_PRODUCT_DAYS = """ INSERT INTO product_daily_sales (seller_id, day, product_id, revenue, commission, units, orders_count)
+    SELECT seller_id, date(sale_date), product_id, SUM(sale_price * sold_quantity), SUM(COALESCE(commission, 0)), SUM(sold_quantity),
+        COUNT(DISTINCT COALESCE(order_id, -id))
+    FROM sales WHERE seller_id IS NOT NULL GROUP BY seller_id, date(sale_date), product_id """
+
+# Итоги продавца с указанного дня — сумма не более чем 365 строк по первичному ключу
+SELLER_TOTALS = """ SELECT COALESCE(SUM(revenue), 0), COALESCE(SUM(revenue - commission), 0), COALESCE(SUM(units), 0),
+    COALESCE(SUM(orders_count), 0) FROM seller_daily_sales WHERE seller_id = ? AND day >= ? """
+
+TOP_PRODUCTS = """ SELECT r.product_id, p.title, SUM(r.units), SUM(r.revenue), SUM(r.orders_count) FROM product_daily_sales r
+    LEFT JOIN products p ON p.id = r.product_id WHERE r.seller_id = ? AND r.day >= ?
+    GROUP BY r.product_id ORDER BY SUM(r.revenue) DESC LIMIT ? """
+
+# Итоги за период: выручка, доход за вычетом комиссии, продано штук, заказов
+PeriodTotals = namedtuple("PeriodTotals", ["name", "revenue", "net_revenue", "units", "orders"])
+TopProduct = namedtuple("TopProduct", ["product_id", "title", "units", "revenue", "orders"])
+
+
+def update_rollups(cursor, order_id):
+    # Вызывается внутри транзакции оформления заказа после вставки его продаж
+    cursor.execute(ROLLUP_SELLER_DAY, (order_id,))
+    cursor.execute(ROLLUP_PRODUCT_DAY, (order_id,))
+
+
+def rebuild_rollups(conn):
+    # Заполняет сводные таблицы заново по всем продажам; вызывается внутри транзакции
+    conn.execute("DELETE FROM seller_daily_sales")
+    conn.execute("DELETE FROM product_daily_sales")
+    conn.execute(REBUILD_SELLER_DAYS)
+    conn.execute(REBUILD_PRODUCT_DAYS)
+
+
+def period_start(days, today=None):
+    # Первый день периода из days последних дней; даты продаж хранятся в UTC
+    today = today or datetime.now(timezone.utc).date()
+    return (today - timedelta(days=days - 1)).isoformat()
+
+
+def seller_period_totals(seller_id, today=None):
+    conn = get_connection()
+    totals = []
+    for name, days in PERIODS:
+        row = conn.execute(SELLER_TOTALS, (seller_id, period_start(days, today))).fetchone()
+        totals.append(PeriodTotals(name, *row))
+    return totals
+
+
+def top_products(seller_id, days, limit=TOP_PRODUCTS_LIMIT, today=None):
+    rows = get_connection().execute(TOP_PRODUCTS, (seller_id, period_start(days, today), limit)).fetchall()
+    return [TopProduct(*row) for row in rows]
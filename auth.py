@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from database import get_connection
+
+# Стоимость bcrypt (log2 числа раундов) для новых хэшей паролей. Хэши с другой стоимостью
+# пересчитываются при следующем успешном входе.
+BCRYPT_ROUNDS = int(os.environ.get('MARKETPLACE_BCRYPT_ROUNDS', '12'))
+
+# Нормализованные email и телефон: по ним identities проверяет уникальность среди покупателей и продавцов.
+# Нормализация выполняется в SQL, чтобы триггеры и запросы приводили значения одинаково.
+NORMALIZED_EMAIL = "lower(trim({}))"
+NORMALIZED_PHONE = "replace(replace(replace(replace(trim({}), ' ', ''), '-', ''), '(', ''), ')', '')"
+
+# Учётные записи, заведённые до identities с уже совпадавшими контактами, перечислены в identity_conflicts
+# вместе с совпавшими email и телефоном (см. backfill_identities); в identities эти контакты у них пустые.
+# Такие записи находятся при входе по собственному столбцу email таблицы users или sellers — как до identities.
+
+# Учётные записи с таким email вместе с хэшем пароля: поиск по уникальному индексу identities
+# и по уникальным индексам users.email и sellers.business_email для записей из identity_conflicts
+ACCOUNTS_BY_EMAIL = """ SELECT i.account_type, i.account_id, COALESCE(u.password_hash, s.password_hash) FROM identities i
+    LEFT JOIN users u ON i.account_type = 'buyer' AND u.id = i.account_id
+    LEFT JOIN sellers s ON i.account_type = 'seller' AND s.id = i.account_id
+    WHERE i.email = """ + NORMALIZED_EMAIL.format("?1") + """
+    UNION ALL SELECT c.account_type, u.id, u.password_hash FROM users u INNER JOIN identity_conflicts c
+        ON c.account_type = 'buyer' AND c.account_id = u.id WHERE u.email = ?1 AND c.email IS NOT NULL
+    UNION ALL SELECT c.account_type, s.id, s.password_hash FROM sellers s INNER JOIN identity_conflicts c
+        ON c.account_type = 'seller' AND c.account_id = s.id WHERE s.business_email = ?1 AND c.email IS NOT NULL """
+
+# Кем заняты email или телефон: (роль, id, совпал ли email, совпал ли телефон)
+IDENTITY_CONFLICTS = " SELECT account_type, account_id, email = " + NORMALIZED_EMAIL.format("?1") \
+    + ", phone = " + NORMALIZED_PHONE.format("?2") + " FROM identities WHERE email = " + NORMALIZED_EMAIL.format("?1") \
+    + " OR phone = " + NORMALIZED_PHONE.format("?2")
+
+# Совпадают ли email и телефон с контактами, которые запись сохранила из identity_conflicts
+RECORDED_CONFLICTS = " SELECT email = " + NORMALIZED_EMAIL.format("?1") + ", phone = " + NORMALIZED_PHONE.format("?2") \
+    + " FROM identity_conflicts WHERE account_type = ?3 AND account_id = ?4"
+
+# Учётные записи без строки identities с нормализованными контактами: покупатели раньше продавцов, по id
+MISSING_IDENTITIES = " SELECT 'buyer', id, " + NORMALIZED_EMAIL.format("email") + ", " + NORMALIZED_PHONE.format("phone_number") \
+    + """ FROM users WHERE NOT EXISTS (SELECT 1 FROM identities i WHERE i.account_type = 'buyer' AND i.account_id = users.id)
+    UNION ALL SELECT 'seller', id, """ + NORMALIZED_EMAIL.format("business_email") + ", " + NORMALIZED_PHONE.format("business_phone") \
+    + """ FROM sellers WHERE NOT EXISTS (SELECT 1 FROM identities i WHERE i.account_type = 'seller' AND i.account_id = sellers.id)
+    ORDER BY 1, 2 """
+INSERT_IDENTITY = "INSERT INTO identities (account_type, account_id, email, phone) VALUES (?,?,?,?)"
+INSERT_IDENTITY_CONFLICT = "INSERT INTO identity_conflicts (account_type, account_id, email, phone) VALUES (?,?,?,?)"
+
+UPDATE_HASH = {
+    'buyer': "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+    'seller': "UPDATE sellers SET password_hash = ? WHERE id = ? AND password_hash = ?",
+}
+
+log = logging.getLogger(__name__)
+_lock = threading.Lock()
+_dummy_hashes = {}  # стоимость -> хэш, с которым сверяется пароль для несуществующего email
+
+
+def configure(rounds=None):
+    global BCRYPT_ROUNDS
+    with _lock:
+        if rounds is not None:
+            BCRYPT_ROUNDS = rounds
+
+
+def hash_password(password, rounds=None):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds or BCRYPT_ROUNDS))
+
+
+def hash_rounds(hashed_password):
+    # Стоимость записана в самом хэше: $2b$12$...
+    return int(_as_bytes(hashed_password).split(b'$')[2])
+
+
+def needs_rehash(hashed_password, rounds=None):
+    return hash_rounds(hashed_password) != (rounds or BCRYPT_ROUNDS)
+
+
+def authenticate(email, password):
+    # Проверяет пароль и возвращает список (роль, id) учётных записей с этим email, к которым он подошёл:
+    # роль 'buyer' или 'seller'. Медленная функция (bcrypt) — вызывать не из потока интерфейса.
+    rounds = BCRYPT_ROUNDS
+    accounts = get_connection().execute(ACCOUNTS_BY_EMAIL, (email,)).fetchall()
+    if not accounts:
+        # Время ответа не должно выдавать, зарегистрирован ли email
+        bcrypt.checkpw(password.encode('utf-8'), _dummy_hash(rounds))
+        return []
+
+    # Если email совпал у нескольких записей (заведены до identities), хэши проверяются параллельно:
+    # bcrypt отпускает GIL, и вход длится как одна проверка, а не сумма. Пересчёт хэша пишет в базу —
+    # он остаётся в этом потоке с его соединением.
+    def check(account):
+        return bcrypt.checkpw(password.encode('utf-8'), _as_bytes(account[2]))
+
+    if len(accounts) == 1:
+        checks = [check(accounts[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(accounts)) as pool:
+            checks = list(pool.map(check, accounts))
+
+    matched = []
+    for (role, account_id, hashed_password), ok in zip(accounts, checks):
+        if not ok:
+            continue
+        matched.append((role, account_id))
+        if needs_rehash(hashed_password, rounds):
+            _rehash(role, account_id, hashed_password, password, rounds)
+    return matched
+
+
+def identity_conflict(email, phone, account=None):
+    # Занят ли email или телефон другой учётной записью: 'email', 'phone' или None.
+    # account — (роль, id) своей записи при редактировании профиля. Контакт из identity_conflicts,
+    # который запись оставляет прежним, занятым не считается: иначе её владелец не смог бы сохранить профиль.
+    conn = get_connection()
+    rows = conn.execute(IDENTITY_CONFLICTS, (email, phone)).fetchall()
+    kept_email = kept_phone = False
+    if account is not None:
+        kept = conn.execute(RECORDED_CONFLICTS, (email, phone, *account)).fetchone()
+        if kept is not None:
+            kept_email, kept_phone = kept
+
+    email_taken = phone_taken = False
+    for account_type, account_id, same_email, same_phone in rows:
+        if (account_type, account_id) == account:
+            continue
+        email_taken = email_taken or (same_email and not kept_email)
+        phone_taken = phone_taken or (same_phone and not kept_phone)
+    if email_taken:
+        return 'email'
+    return 'phone' if phone_taken else None
+
+
+def backfill_identities(conn):
+    # Добавляет строки identities учётным записям, у которых их нет (шаг миграций; conn — в транзакции).
+    # Email или телефон, уже занятый другой записью, в identities остаётся пустым, а запись с совпавшими
+    # контактами добавляется в identity_conflicts: вход по email работает и для неё, а строка пропадает,
+    # когда владелец сменит совпавшие контакты в профиле. Возвращает список (роль, id) таких записей и пишет его в журнал.
+    conflicts = []
+    for account_type, account_id, email, phone in conn.execute(MISSING_IDENTITIES).fetchall():
+        email_taken = conn.execute("SELECT 1 FROM identities WHERE email = ?", (email,)).fetchone() is not None
+        phone_taken = conn.execute("SELECT 1 FROM identities WHERE phone = ?", (phone,)).fetchone() is not None
+        conn.execute(INSERT_IDENTITY, (account_type, account_id, None if email_taken else email, None if phone_taken else phone))
+        if email_taken or phone_taken:
+            conn.execute(INSERT_IDENTITY_CONFLICT, (account_type, account_id, email if email_taken else None,
+                                                    phone if phone_taken else None))
+            conflicts.append((account_type, account_id))
+    if conflicts:
+        log.warning("Email или телефон совпадают с другими учётными записями, записи перенесены в identity_conflicts: %s",
+                    ", ".join(f"{account_type} {account_id}" for account_type, account_id in conflicts))
+    return conflicts
+
+
+def conflict_field(error):
+    # Какое поле нарушило уникальность (sqlite3.IntegrityError при вставке или изменении учётной записи)
+    text = str(error)
+    if 'email' in text:
+        return 'email'
+    if 'phone' in text:
+        return 'phone'
+    return None
+
+
+def _rehash(role, account_id, old_hash, password, rounds):
+    # Пароль известен только при входе — в этот момент и переводим хэш на текущую стоимость.
+    # Если пароль успели сменить, условие по старому хэшу не даст его перезаписать.
+    conn = get_connection()
+    with conn:
+        conn.execute(UPDATE_HASH[role], (hash_password(password, rounds), account_id, old_hash))
+
+
+def _dummy_hash(rounds):
+    with _lock:
+        hashed = _dummy_hashes.get(rounds)
+        if hashed is None:
+            hashed = _dummy_hashes[rounds] = bcrypt.hashpw(b'', bcrypt.gensalt(rounds))
+    return hashed
+
+
+def _as_bytes(hashed_password):
+    return hashed_password.encode('ascii') if isinstance(hashed_password, str) else hashed_password
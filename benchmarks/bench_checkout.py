@@ -0,0 +1,122 @@
+# Нагрузочная проверка оформления покупок: несколько процессов одновременно покупают
+# небольшой набор популярных товаров с ограниченным остатком.
+# Проверяет, что ни один товар не продан сверх остатка, и показывает число покупок в секунду.
+# Запуск из корня проекта: python -m benchmarks.bench_checkout [--processes 8] [--checkouts 300]
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import database
+from checkout import place_order
+from migrations import migrate
+
+
+def prepare(path, products, stock):
+    database.configure(path)
+    migrate()
+    conn = database.get_connection()
+    conn.execute("INSERT INTO sellers (organization_name, business_email, business_phone, password_hash) VALUES ('ООО', 's@x', '1', x'00')")
+    conn.execute("INSERT INTO categories (name) VALUES ('Разное')")
+    conn.executemany("INSERT INTO products (category_id, title, description, price, quantity, seller_id) VALUES (1, ?, '', ?, ?, 1)",
+                     [(f"Товар {i}", 100 + i, stock) for i in range(products)])
+    conn.execute("INSERT INTO promotions (name, discount_percent, valid_from, valid_to) VALUES ('Акция', 10, '2000-01-01 00:00:00', '2100-01-01 00:00:00')")
+    conn.execute("INSERT INTO promotion_items (promotion_id, product_id) VALUES (1, 1)")
+    conn.commit()
+    # Дочерние процессы открывают свои соединения
+    database.close_all()
+
+
+def worker(path, seed, checkouts, products, ready, go, results):
+    database.configure(path)
+    database.get_connection()
+    rnd = random.Random(seed)
+    # Все процессы начинают покупать одновременно, время запуска процессов в замер не входит
+    ready.release()
+    go.wait()
+    done = rejected = busy = 0
+    for _ in range(checkouts):
+        items = [(rnd.randint(1, products), rnd.randint(1, 3)) for _ in range(rnd.randint(1, 3))]
+        try:
+            place_order(seed, items)
+            done += 1
+        except ValueError:
+            rejected += 1
+        except sqlite3.OperationalError:
+            busy += 1
+    results.put((done, rejected, busy))
+
+
+def verify(path, stock):
+    # Для каждого товара: продано + остаток == начальный остаток, остаток не отрицательный
+    conn = sqlite3.connect(path)
+    rows = conn.execute(""" SELECT p.id, p.quantity, COALESCE(SUM(s.sold_quantity), 0) FROM products p
+        LEFT JOIN sales s ON s.product_id = p.id GROUP BY p.id """).fetchall()
+    sold = sum(row[2] for row in rows)
+    problems = [(product_id, quantity, sold_qty) for product_id, quantity, sold_qty in rows
+                if quantity < 0 or quantity + sold_qty != stock]
+    # Итоги в заголовке каждого заказа совпадают с его строками
+    broken_orders = conn.execute(""" SELECT COUNT(*) FROM orders o WHERE o.total_quantity != (SELECT SUM(s.sold_quantity)
+        FROM sales s WHERE s.order_id = o.id) OR o.items_count != (SELECT COUNT(*) FROM sales s WHERE s.order_id = o.id) """).fetchone()[0]
+    # Дневные итоги товаров совпадают с пересчётом по продажам
+    broken_orders += conn.execute(""" SELECT COUNT(*) FROM ( SELECT product_id, date(sale_date) AS day, SUM(sold_quantity) AS units,
+        COUNT(*) AS orders_count FROM sales GROUP BY product_id, day ) s LEFT JOIN product_daily_sales r
+        ON r.product_id = s.product_id AND r.day = s.day WHERE r.units IS NOT s.units OR r.orders_count IS NOT s.orders_count """).fetchone()[0]
+    conn.close()
+    return sold, problems, broken_orders
+
+
+def run(processes, checkouts, products, stock):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepare(path, products, stock)
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        ready = context.Semaphore(0)
+        go = context.Event()
+        workers = [context.Process(target=worker, args=(path, seed, checkouts, products, ready, go, results))
+                   for seed in range(1, processes + 1)]
+        for process in workers:
+            process.start()
+        for _ in workers:
+            ready.acquire()
+
+        start = time.perf_counter()
+        go.set()
+        totals = [results.get() for _ in workers]
+        elapsed = time.perf_counter() - start
+        for process in workers:
+            process.join()
+
+        done = sum(t[0] for t in totals)
+        rejected = sum(t[1] for t in totals)
+        busy = sum(t[2] for t in totals)
+        sold, problems, broken_orders = verify(path, stock)
+
+        print(f"{processes} процессов × {checkouts} покупок, {products} товаров по {stock} шт.")
+        print(f"оформлено {done}, отказ по остатку {rejected}, ошибка блокировки {busy}, продано {sold} шт.")
+        print(f"{(done + rejected) / elapsed:.0f} покупок/с ({elapsed:.2f} с)")
+        if problems:
+            for product_id, quantity, sold_qty in problems:
+                print(f"ПЕРЕПРОДАЖА: товар {product_id}, остаток {quantity}, продано {sold_qty}")
+            return False
+        if broken_orders:
+            print(f"Итоги {broken_orders} заказов или дней не совпадают с продажами")
+            return False
+        print("Перепродаж нет.")
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Параллельное оформление покупок")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--checkouts", type=int, default=300, help="попыток покупки на процесс")
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--stock", type=int, default=500)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.processes, args.checkouts, args.products, args.stock) else 1)
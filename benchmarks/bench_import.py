@@ -0,0 +1,69 @@
+# Скорость массового импорта товаров из CSV против добавления по одному товару, как в AddProductDialog
+# (поиск или создание категории и отдельная транзакция на каждый товар).
+# Запуск из корня проекта: python -m benchmarks.bench_import [--rows 20000] [--workers 4]
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import database
+from migrations import migrate
+from product_import import import_products, read_chunks, validate_rows
+
+
+def make_csv(path, rows, categories, bad_share, seed=42):
+    rnd = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write("title,category,description,price,quantity\n")
+        for i in range(rows):
+            price = "не число" if rnd.random() < bad_share else f"{rnd.randint(100, 100000) / 100}"
+            file.write(f"Товар {i},Категория {rnd.randrange(categories)},Описание товара {i},{price},{rnd.randint(1, 500)}\n")
+
+
+def naive_import(seller_id, path):
+    # Прежний путь: каждая строка — поиск категории, при необходимости её создание и вставка товара с commit
+    conn = database.get_connection()
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        for chunk in read_chunks(file):
+            valid, _ = validate_rows(chunk)
+            for _, title, category, description, price, quantity in valid:
+                row = conn.execute("SELECT id FROM categories WHERE name=?", (category,)).fetchone()
+                if row:
+                    category_id = row[0]
+                else:
+                    category_id = conn.execute("INSERT INTO categories(name) VALUES (?)", (category,)).lastrowid
+                    conn.commit()
+                conn.execute("INSERT INTO products(category_id, title, description, price, quantity, seller_id) VALUES (?, ?, ?, ?, ?, ?)",
+                             (category_id, title, description, price, quantity, seller_id))
+                conn.commit()
+
+
+def run(rows, categories, bad_share, workers, naive_rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, "bench.db"))
+        migrate()
+        path = os.path.join(tmp, "products.csv")
+
+        make_csv(path, rows, categories, bad_share)
+        report = import_products(1, path, workers=workers)
+        print(f"импорт: {report.rows} строк, добавлено {report.imported}, ошибок {len(report.errors)}, "
+              f"{report.seconds:.2f} с, {report.rows / report.seconds:,.0f} строк/с (процессов: {workers or os.cpu_count()})")
+
+        make_csv(path, naive_rows, categories, bad_share, seed=7)
+        start = time.perf_counter()
+        naive_import(2, path)
+        elapsed = time.perf_counter() - start
+        print(f"по одному товару: {naive_rows} строк, {elapsed:.2f} с, {naive_rows / elapsed:,.0f} строк/с")
+        database.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скорость импорта товаров")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--bad-share", type=float, default=0.01, help="доля строк с ошибкой")
+    parser.add_argument("--workers", type=int, default=None, help="процессов проверки (по умолчанию — число ядер)")
+    parser.add_argument("--naive-rows", type=int, default=2000, help="строк для замера добавления по одному")
+    args = parser.parse_args()
+    run(args.rows, args.categories, args.bad_share, args.workers, args.naive_rows)
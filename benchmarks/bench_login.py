@@ -0,0 +1,70 @@
+# Замер задержки входа при разной стоимости bcrypt: один вход, параллельные входы в пуле потоков
+# (bcrypt отпускает GIL) и первый вход после смены стоимости, когда хэш пересчитывается.
+# Запуск из корня проекта: python -m benchmarks.bench_login [--rounds 4 8 10 12] [--threads 4]
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import auth
+import database
+from migrations import migrate
+
+PASSWORD = "correct horse battery staple"
+
+
+def add_user(email, rounds):
+    conn = database.get_connection()
+    conn.execute("INSERT INTO users (first_name, last_name, email, phone_number, password_hash) VALUES ('Имя', 'Фамилия', ?, ?, ?)",
+                 (email, email, auth.hash_password(PASSWORD, rounds)))
+    conn.commit()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(rounds_list, repeats, threads):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, "bench.db"))
+        migrate()
+        print(f"{'стоимость':>10}{'вход, мс':>12}{'p95, мс':>10}{'неверный, мс':>14}{f'входов/с ({threads} потока)':>24}{'с пересчётом, мс':>18}")
+
+        for rounds in rounds_list:
+            auth.configure(rounds=rounds)
+            email = f"user{rounds}@example.com"
+            add_user(email, rounds)
+
+            timings = sorted(timed(auth.authenticate, email, PASSWORD)[0] for _ in range(repeats))
+            assert auth.authenticate(email, PASSWORD), "пароль не подошёл"
+            wrong_ms = statistics.median(timed(auth.authenticate, email, "wrong")[0] for _ in range(repeats))
+
+            # Пропускная способность: каждый поток открывает своё соединение, bcrypt считается параллельно
+            with ThreadPoolExecutor(threads) as pool:
+                start = time.perf_counter()
+                list(pool.map(lambda _: auth.authenticate(email, PASSWORD), range(repeats * threads)))
+                per_second = repeats * threads / (time.perf_counter() - start)
+
+            # Хэш со старой стоимостью: первый вход проверяет пароль и записывает новый хэш
+            old_email = f"old{rounds}@example.com"
+            add_user(old_email, max(rounds - 2, 4))
+            rehash_ms, _ = timed(auth.authenticate, old_email, PASSWORD)
+            stored = database.get_connection().execute("SELECT password_hash FROM users WHERE email = ?", (old_email,)).fetchone()[0]
+            assert not auth.needs_rehash(stored, rounds), "хэш не пересчитан"
+
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{rounds:>10}{statistics.median(timings):>12.1f}{p95:>10.1f}{wrong_ms:>14.1f}{per_second:>24.1f}{rehash_ms:>18.1f}")
+        database.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка входа при разной стоимости bcrypt")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[4, 8, 10, 12])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    run(args.rounds, args.repeats, args.threads)
@@ -0,0 +1,90 @@
+# Замер задержки поиска товаров: первая страница search_catalog (как в окнах каталога) против LIKE '%текст%'.
+# В обоих случаях вместе со строками читаются цены, кэш цен перед каждым замером пуст.
+# Запуск из корня проекта: python -m benchmarks.bench_search [--sizes 100000 1000000]
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import database
+import queries
+from migrations import migrate
+from paging import PAGE_SIZE
+from pricing import get_discounted_prices, invalidate_prices
+from search import build_match_query, search_catalog
+
+WORDS = ["чайник", "электрический", "кофеварка", "смартфон", "чехол", "наушники", "беспроводные", "ноутбук",
+         "игровой", "клавиатура", "мышь", "монитор", "книга", "фантастика", "рюкзак", "городской", "кроссовки",
+         "беговые", "куртка", "зимняя", "лампа", "настольная", "пылесос", "робот", "блендер", "сковорода",
+         "антипригарная", "кружка", "керамическая", "зонт", "складной", "часы", "умные", "колонка", "портативная"]
+SYLLABLES = ["ка", "ро", "ми", "те", "зу", "ла", "нор", "вес", "дин", "мак", "сел", "тор", "ви", "ан", "ус", "бри"]
+SEARCHES = ["чай", "смартфон чехол", "Игров", "зим курт", "роми", "калавес", "нортор зу"]
+LIKE_QUERY = queries.PRODUCT_ROWS + " WHERE LOWER(p.title) LIKE LOWER(?) ORDER BY p.title, p.id LIMIT ? "
+FTS_COUNT = "SELECT COUNT(*) FROM products_fts WHERE products_fts MATCH ?"
+
+
+def make_vocabulary(rnd, size=5000):
+    # Бренды и модели: редкие слова, по которым поиск избирателен
+    return ["".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4))) for _ in range(size)]
+
+
+def fill_products(count, seed=42):
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(rnd)
+    conn = database.get_connection()
+    conn.execute("INSERT INTO categories (name) VALUES ('Разное')")
+    batch = []
+    for i in range(count):
+        title = " ".join(rnd.sample(WORDS, 2) + rnd.sample(vocabulary, 2)).capitalize() + f" {i}"
+        description = " ".join(rnd.choices(WORDS, k=4) + rnd.choices(vocabulary, k=8))
+        batch.append((1, title, description, rnd.randint(100, 100000) / 100, rnd.randint(0, 500), rnd.randint(1, 1000)))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO products (category_id, title, description, price, quantity, seller_id) VALUES (?,?,?,?,?,?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO products (category_id, title, description, price, quantity, seller_id) VALUES (?,?,?,?,?,?)", batch)
+    conn.commit()
+
+
+def measure(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        invalidate_prices()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(size, repeats, limit):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure(os.path.join(tmp, "bench.db"))
+        migrate()
+        start = time.perf_counter()
+        fill_products(size)
+        print(f"\n{size} товаров, заполнение {time.perf_counter() - start:.1f} с (медиана из {repeats} замеров, мс)")
+        print(f"{'запрос':<24}{'найдено':>10}{'FTS5':>10}{'LIKE':>10}")
+
+        conn = database.get_connection()
+        def like_page(text):
+            rows = conn.execute(LIKE_QUERY, ('%' + text.lower() + '%', limit)).fetchall()
+            get_discounted_prices(row[0] for row in rows)
+
+        for text in SEARCHES:
+            found = conn.execute(FTS_COUNT, (build_match_query(text),)).fetchone()[0]
+            fts_ms = measure(lambda: search_catalog(text, limit=limit), repeats)
+            like_ms = measure(lambda: like_page(text), repeats)
+            print(f"{text:<24}{found:>10}{fts_ms:>10.2f}{like_ms:>10.2f}")
+        database.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка поиска товаров")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=PAGE_SIZE, help="строк на странице результата")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.repeats, args.limit)
@@ -0,0 +1,270 @@
+# Набор замеров горячих путей на большой базе (см. benchmarks.generate_data) с отчётом в JSON,
+# который можно сравнить с отчётом другого коммита на той же базе.
+# Замеры идут на копии базы: оформление покупок и вход (пересчёт хэша) меняют данные.
+# Запуск из корня проекта:
+#   python -m benchmarks.generate_data marketplace.db
+#   python -m benchmarks.bench_suite marketplace.db --report before.json
+#   python -m benchmarks.bench_suite marketplace.db --report after.json --compare before.json
+# Без пути к базе небольшая база генерируется во временной папке (--scale).
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import auth
+import database
+from benchmarks.bench_search import SEARCHES
+from benchmarks.generate_data import DEFAULT_SIZES, PASSWORD, generate
+from cart import ShoppingCart
+from migrations import migrate
+from paging import PAGE_SIZE, sale_query
+from pricing import get_discounted_price, get_discounted_prices, invalidate_prices
+from revenue import marketplace_commission
+from search import search_catalog
+
+# Версия формата отчёта: меняется, если меняются поля
+REPORT_FORMAT = 1
+WARMUP = 3
+# Сколько продаж выбирается случайно, чтобы взять из них покупателей, товары и продавцов:
+# так входные данные замеров смещены к популярным так же, как сами продажи
+SAMPLE_SALES = 2000
+DATASET_TABLES = ("users", "sellers", "categories", "products", "promotions", "promotion_items", "orders", "sales", "reviews")
+
+
+def measure(run, repeats, setup=None, warmup=WARMUP):
+    # Время выполнения run(*setup(i)) в миллисекундах; setup подготавливает аргументы и в замер не входит
+    timings = []
+    for i in range(warmup + repeats):
+        args = setup(i) if setup is not None else ()
+        start = time.perf_counter()
+        run(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            timings.append(elapsed)
+    return timings
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    mean = statistics.fmean(ordered)
+    return {
+        "runs": len(ordered),
+        "median_ms": round(statistics.median(ordered), 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "mean_ms": round(mean, 4),
+        "min_ms": round(ordered[0], 4),
+        "max_ms": round(ordered[-1], 4),
+        "ops_per_s": round(1000 / mean, 1) if mean else None,
+    }
+
+
+def sample_inputs(rnd):
+    # Покупатели, товары и продавцы из случайных продаж
+    conn = database.get_connection()
+    max_sale = conn.execute("SELECT MAX(id) FROM sales").fetchone()[0]
+    if not max_sale:
+        sys.exit("В базе нет продаж: сначала заполните её (python -m benchmarks.generate_data)")
+    sale_ids = sorted({rnd.randint(1, max_sale) for _ in range(SAMPLE_SALES)})
+    rows = conn.execute("SELECT buyer_id, product_id, seller_id FROM sales WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(sale_ids),)).fetchall()
+    rnd.shuffle(rows)
+    return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+
+
+def run_cases(repeats, login_repeats, seed):
+    rnd = random.Random(seed)
+    buyers, products, sellers = sample_inputs(rnd)
+    conn = database.get_connection()
+    results = {}
+
+    def case(name, run, setup=None, count=repeats):
+        results[name] = summarize(measure(run, count, setup))
+        stats = results[name]
+        print(f"{name:<40}{stats['runs']:>6}{stats['median_ms']:>12.3f}{stats['p95_ms']:>12.3f}{stats['ops_per_s']:>12.1f}")
+
+    print(f"{'замер':<40}{'раз':>6}{'медиана, мс':>12}{'p95, мс':>12}{'в секунду':>12}")
+
+    # Каталог и поиск — первая страница search_catalog вместе с ценами, кэш цен перед каждым замером пуст:
+    # тот же путь, строки поиска и размер страницы, что в колонке FTS5 benchmarks.bench_search
+    def cold_search(i, text=None):
+        invalidate_prices()
+        return (text,)
+
+    def first_page(text):
+        return search_catalog(text, limit=PAGE_SIZE)
+
+    case("loadAllProducts", first_page, setup=cold_search)
+    case("searchProducts", first_page, setup=lambda i: cold_search(i, SEARCHES[i % len(SEARCHES)]))
+
+    # Цена товара: из кэша и с запросом к базе
+    get_discounted_prices(products)
+    case("get_discounted_price", get_discounted_price, setup=lambda i: (products[i % len(products)],))
+
+    def uncached_price(i):
+        product_id = products[i % len(products)]
+        invalidate_prices([product_id])
+        return (product_id,)
+
+    case("get_discounted_price (без кэша)", get_discounted_price, setup=uncached_price)
+
+    # Оформление корзины из 1-3 популярных товаров, которых хватит на все замеры; резервы ставятся до замера
+    total_runs = WARMUP + repeats
+    in_stock = [row[0] for row in conn.execute("SELECT id FROM products WHERE id IN (SELECT value FROM json_each(?)) AND quantity >= ?",
+                                               (json.dumps(products), total_runs * 3))]
+    if not in_stock:
+        sys.exit("В базе нет популярных товаров с достаточным остатком для замера оформления")
+
+    def filled_cart(i):
+        cart = ShoppingCart(buyers[i % len(buyers)])
+        cart.clear_cart()
+        for product_id in rnd.sample(in_stock, min(rnd.randint(1, 3), len(in_stock))):
+            cart.add_item(product_id, 1)
+        return (cart,)
+
+    case("checkout", ShoppingCart.checkout, setup=filled_cart)
+
+    # История продаж продавца: первая страница и следующая по курсору
+    seller_ids = list(dict.fromkeys(sellers))
+    case("load_sales", lambda seller_id: sale_query(seller_id).page(), setup=lambda i: (seller_ids[i % len(seller_ids)],))
+    next_pages = [(query, page.cursor) for query, page in ((query, query.page()) for query in map(sale_query, seller_ids[:50]))
+                  if page.cursor is not None]
+    if next_pages:
+        case("load_sales (следующая страница)", lambda query, cursor: query.page(cursor),
+             setup=lambda i: next_pages[i % len(next_pages)])
+
+    case("get_total_revenue", marketplace_commission)
+
+    # Вход: стоимость bcrypt — как у хэшей в базе, чтобы первый вход не пересчитывал хэш
+    emails = [row[0] for row in conn.execute("SELECT email FROM users WHERE id IN (SELECT value FROM json_each(?))",
+                                             (json.dumps(buyers[:20]),))]
+    stored_hash = conn.execute("SELECT password_hash FROM users WHERE email = ?", (emails[0],)).fetchone()[0]
+    auth.configure(rounds=auth.hash_rounds(stored_hash))
+    if not auth.authenticate(emails[0], PASSWORD):
+        sys.exit(f"Пароль «{PASSWORD}» не подошёл: база создана не benchmarks.generate_data")
+    case("login", auth.authenticate, setup=lambda i: (emails[i % len(emails)], PASSWORD), count=login_repeats)
+    return results
+
+
+def git_revision():
+    # (коммит, есть ли незакоммиченные изменения) или (None, None), если git недоступен
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True,
+                                check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def dataset_info(path):
+    conn = database.get_connection()
+    return {
+        "path": os.path.abspath(path),
+        "size_bytes": os.path.getsize(path),
+        "rows": {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in DATASET_TABLES},
+    }
+
+
+def compare(report, baseline, threshold):
+    # Печатает изменение медиан относительно baseline; возвращает замеры, ставшие медленнее больше чем на threshold %
+    if report["dataset"]["rows"] != baseline["dataset"]["rows"] or report.get("inputs") != baseline.get("inputs"):
+        print("Внимание: отчёты сняты на разных базах или с разными входными данными, сравнение неточно")
+    print(f"\nСравнение с {baseline.get('commit') or 'базовым отчётом'} (медиана, мс)")
+    print(f"{'замер':<40}{'было':>12}{'стало':>12}{'изменение':>12}")
+    regressions = []
+    for name, stats in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:<40}{'—':>12}{stats['median_ms']:>12.3f}{'новый':>12}")
+            continue
+        change = (stats["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+        mark = ""
+        if change > threshold:
+            mark = "  медленнее"
+            regressions.append(name)
+        elif change < -threshold:
+            mark = "  быстрее"
+        print(f"{name:<40}{old['median_ms']:>12.3f}{stats['median_ms']:>12.3f}{change:>+11.1f}%{mark}")
+    return regressions
+
+
+def copy_database(path, target):
+    # Копия через backup API: учитывает данные, ещё не перенесённые из WAL
+    source = sqlite3.connect(path)
+    copy = sqlite3.connect(target)
+    with copy:
+        source.backup(copy)
+    source.close()
+    copy.close()
+
+
+def run(path, scale, repeats, login_repeats, seed, report_path, baseline_path, threshold):
+    with tempfile.TemporaryDirectory() as tmp:
+        if path is None:
+            path = os.path.join(tmp, "generated.db")
+            print(f"Генерация базы (scale {scale})...")
+            generate(path, {name: max(int(size * scale), 1) for name, size in DEFAULT_SIZES.items()}, seed=seed)
+        work_path = os.path.join(tmp, "work.db")
+        copy_database(path, work_path)
+        database.configure(work_path)
+        # База могла быть создана более старой версией схемы
+        migrate()
+
+        dataset = dataset_info(work_path)
+        dataset["path"] = os.path.abspath(path)
+        print(", ".join(f"{table}: {count}" for table, count in dataset["rows"].items()))
+        results = run_cases(repeats, login_repeats, seed)
+        database.close_all()
+
+    commit, dirty = git_revision()
+    report = {
+        "format": REPORT_FORMAT,
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commit": commit,
+        "dirty": dirty,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        # Входные данные поиска: замеры с разными строками или размером страницы не сравнимы
+        "inputs": {"searches": SEARCHES, "page_size": PAGE_SIZE},
+        "dataset": dataset,
+        "results": results,
+    }
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"Отчёт: {report_path}")
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, threshold)
+        if regressions:
+            print(f"Медленнее более чем на {threshold}%: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры горячих путей маркетплейса с отчётом в JSON")
+    parser.add_argument("path", nargs="?", default=None, help="база из benchmarks.generate_data (не меняется)")
+    parser.add_argument("--scale", type=float, default=0.1, help="размер базы, если путь не указан")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--login-repeats", type=int, default=10, help="замеров входа (bcrypt медленный)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", help="куда записать отчёт JSON")
+    parser.add_argument("--compare", help="отчёт для сравнения; код выхода 1, если есть замедление больше порога")
+    parser.add_argument("--threshold", type=float, default=10.0, help="порог замедления в процентах")
+    args = parser.parse_args()
+    sys.exit(run(args.path, args.scale, args.repeats, args.login_repeats, args.seed, args.report, args.compare, args.threshold))
@@ -0,0 +1,262 @@
+# Генератор большой базы маркетплейса для замеров: покупатели, продавцы, категории, товары, акции,
+# товары акций, отзывы и заказы с продажами.
+# Популярность товаров, категорий и продавцов и активность покупателей распределены по закону Ципфа:
+# немногие товары дают большую часть продаж. Даты продаж сезонные: пик в ноябре и декабре,
+# больше покупок в выходные и днём, объём продаж растёт к концу истории.
+# Запуск из корня проекта: python -m benchmarks.generate_data marketplace.db [--scale 1] [--products 100000] [--seed 42]
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import auth
+import database
+from analytics import rebuild_rollups
+from benchmarks.bench_search import WORDS, make_vocabulary
+from migrations import migrate
+from pricing import apply_discount
+from revenue import sale_commission
+
+# Пароль всех сгенерированных учётных записей. Хэш один на всех: bcrypt для каждой записи занял бы часы.
+PASSWORD = "benchmark"
+
+# Размеры по умолчанию; --scale умножает все сразу
+DEFAULT_SIZES = {
+    "users": 20000,
+    "sellers": 500,
+    "categories": 200,
+    "products": 100000,
+    "promotions": 300,
+    "promotion_items": 20000,
+    "orders": 200000,
+    "reviews": 50000,
+}
+DEFAULT_DAYS = 730
+ZIPF_EXPONENT = 1.1
+
+# Сезонность: множитель месяца, выходных и часа суток. Первый день истории продаёт в TREND_START раз меньше последнего.
+MONTH_FACTORS = (0.8, 0.75, 0.9, 0.9, 0.95, 0.9, 0.85, 0.95, 1.0, 1.05, 1.35, 1.6)
+WEEKEND_FACTOR = 1.25
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 3, 5, 7, 8, 9, 10, 11, 11, 10, 10, 10, 11, 12, 13, 13, 10, 6, 3)
+TREND_START = 0.5
+
+# Заказ из 1..5 строк, количество в строке 1..3, оценки 1..5
+LINES_WEIGHTS = (55, 25, 12, 5, 3)
+QUANTITY_WEIGHTS = (70, 20, 10)
+RATING_WEIGHTS = (5, 5, 10, 30, 50)
+# Доля акций, которые действуют сегодня
+ACTIVE_PROMOTIONS_SHARE = 0.2
+
+FIRST_NAMES = ["Иван", "Анна", "Пётр", "Мария", "Алексей", "Ольга", "Дмитрий", "Елена", "Сергей", "Наталья"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков", "Фёдоров"]
+COMMENTS = ["Отличный товар", "Всё понравилось", "Соответствует описанию", "Быстрая доставка", "Нормально",
+            "Ожидал большего", "Качество так себе", "Рекомендую", ""]
+
+BATCH_ROWS = 50000
+
+
+def zipf_chooser(rnd, ids, exponent=ZIPF_EXPONENT):
+    # Функция choose(k) -> k id, выбранных с вероятностью 1 / ранг ** exponent.
+    # Ранги перемешаны, чтобы популярность не совпадала с порядком id.
+    ids = list(ids)
+    rnd.shuffle(ids)
+    cum_weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, len(ids) + 1)))
+
+    def choose(k=1):
+        return rnd.choices(ids, cum_weights=cum_weights, k=k)
+
+    return choose
+
+
+def seasonal_days(days, today):
+    # Дни истории и кумулятивные веса для выбора дня продажи
+    first = today - timedelta(days=days - 1)
+    result = []
+    weights = []
+    for i in range(days):
+        day = first + timedelta(days=i)
+        weight = MONTH_FACTORS[day.month - 1] * (WEEKEND_FACTOR if day.weekday() >= 5 else 1)
+        weight *= TREND_START + (1 - TREND_START) * i / max(days - 1, 1)
+        result.append(day)
+        weights.append(weight)
+    return result, list(itertools.accumulate(weights))
+
+
+def sale_timestamps(rnd, count, days, today):
+    # count моментов продаж по возрастанию — id заказов и продаж идут в порядке времени, как в работающей базе
+    day_list, cum_weights = seasonal_days(days, today)
+    hours = list(itertools.accumulate(HOUR_WEIGHTS))
+    stamps = [f"{day.isoformat()} {hour:02d}:{rnd.randrange(60):02d}:{rnd.randrange(60):02d}"
+              for day, hour in zip(rnd.choices(day_list, cum_weights=cum_weights, k=count),
+                                   rnd.choices(range(24), cum_weights=hours, k=count))]
+    stamps.sort()
+    return stamps
+
+
+def insert_batches(conn, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_ROWS:
+            conn.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def generate(path, sizes=None, days=DEFAULT_DAYS, seed=42, bcrypt_rounds=None, today=None):
+    # Создаёт базу path по текущей схеме и заполняет её. Возвращает {таблица: число строк}.
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    rnd = random.Random(seed)
+    today = today or datetime.now(timezone.utc).date()
+    first_day = today - timedelta(days=days - 1)
+
+    database.configure(path)
+    migrate()
+    conn = database.get_connection()
+    # База создаётся заново: при сбое её проще сгенерировать ещё раз, чем ждать синхронизации с диском
+    conn.execute("PRAGMA synchronous = OFF")
+    password_hash = auth.hash_password(PASSWORD, bcrypt_rounds)
+
+    with conn:
+        insert_batches(conn, "INSERT INTO users (id, first_name, last_name, email, phone_number, password_hash) VALUES (?,?,?,?,?,?)",
+                       ((i, rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES), f"user{i}@example.com", f"7900{i:07d}", password_hash)
+                        for i in range(1, sizes["users"] + 1)))
+        insert_batches(conn, """ INSERT INTO sellers (id, organization_name, business_email, business_phone, legal_address, password_hash)
+            VALUES (?,?,?,?,?,?) """,
+                       ((i, f"ООО «Продавец {i}»", f"seller{i}@example.com", f"7800{i:07d}", f"г. Москва, ул. Торговая, д. {i}",
+                         password_hash) for i in range(1, sizes["sellers"] + 1)))
+        insert_batches(conn, "INSERT INTO categories (id, name) VALUES (?, ?)",
+                       ((i, f"Категория {i}") for i in range(1, sizes["categories"] + 1)))
+
+    # Товары: категория и продавец по Ципфу, цена — логнормальная (медиана около 1100 руб.), часть товаров закончилась
+    vocabulary = make_vocabulary(rnd)
+    choose_category = zipf_chooser(rnd, range(1, sizes["categories"] + 1))
+    choose_seller = zipf_chooser(rnd, range(1, sizes["sellers"] + 1))
+    prices = [0.0] * (sizes["products"] + 1)
+    sellers = [0] * (sizes["products"] + 1)
+
+    def products():
+        for i in range(1, sizes["products"] + 1):
+            prices[i] = max(round(math.exp(rnd.gauss(7, 1.2)), 2), 10.0)
+            sellers[i] = choose_seller()[0]
+            title = " ".join(rnd.sample(WORDS, 2) + rnd.sample(vocabulary, 2)).capitalize() + f" {i}"
+            description = " ".join(rnd.choices(WORDS, k=4) + rnd.choices(vocabulary, k=8))
+            quantity = 0 if rnd.random() < 0.05 else rnd.randint(1, 1000)
+            yield i, choose_category()[0], title, description, prices[i], quantity, sellers[i]
+
+    with conn:
+        insert_batches(conn, "INSERT INTO products (id, category_id, title, description, price, quantity, seller_id) VALUES (?,?,?,?,?,?,?)",
+                       products())
+
+    # Акции разбросаны по истории продаж, часть из них действует сегодня
+    promotions = []
+    for i in range(1, sizes["promotions"] + 1):
+        length = rnd.randint(3, 60)
+        if rnd.random() < ACTIVE_PROMOTIONS_SHARE:
+            start = today - timedelta(days=rnd.randrange(length))
+        else:
+            start = first_day + timedelta(days=rnd.randrange(days + 30))
+        promotions.append((i, f"Акция {i}", rnd.choice(range(5, 55, 5)), f"{start.isoformat()} 00:00:00",
+                           f"{(start + timedelta(days=length)).isoformat()} 23:59:59"))
+    product_promotions = {}  # product_id -> [(id акции, скидка, начало, конец)]
+    items = set()
+    if promotions:
+        choose_product = zipf_chooser(rnd, range(1, sizes["products"] + 1))
+        # Не больше половины всех пар: иначе выбор по Ципфу долго добирал бы редкие товары
+        limit = min(sizes["promotion_items"], len(promotions) * sizes["products"] // 2)
+        while len(items) < limit:
+            promotion = rnd.choice(promotions)
+            product_id = choose_product()[0]
+            if (promotion[0], product_id) not in items:
+                items.add((promotion[0], product_id))
+                product_promotions.setdefault(product_id, []).append((promotion[0],) + promotion[2:])
+    with conn:
+        conn.executemany("INSERT INTO promotions (id, name, discount_percent, valid_from, valid_to) VALUES (?,?,?,?,?)", promotions)
+        insert_batches(conn, "INSERT INTO promotion_items (promotion_id, product_id) VALUES (?, ?)", sorted(items))
+
+    # Заказы: покупатель и товары по Ципфу, цена продажи — со скидкой самой выгодной акции, действовавшей в момент покупки
+    choose_buyer = zipf_chooser(rnd, range(1, sizes["users"] + 1))
+    choose_product = zipf_chooser(rnd, range(1, sizes["products"] + 1))
+    orders = []
+    sales = []
+    sale_id = 0
+    for order_id, created_at in enumerate(sale_timestamps(rnd, sizes["orders"], days, today), start=1):
+        buyer_id = choose_buyer()[0]
+        lines = set(choose_product(rnd.choices(range(1, len(LINES_WEIGHTS) + 1), weights=LINES_WEIGHTS)[0]))
+        total_quantity = 0
+        total_amount = 0
+        for product_id in lines:
+            quantity = rnd.choices(range(1, len(QUANTITY_WEIGHTS) + 1), weights=QUANTITY_WEIGHTS)[0]
+            active = [p for p in product_promotions.get(product_id, ()) if p[2] <= created_at <= p[3]]
+            best = max(active, key=lambda p: p[1]) if active else None
+            sale_price = round(apply_discount(prices[product_id], best[1] if best else 0), 2)
+            sale_id += 1
+            sales.append((sale_id, order_id, product_id, buyer_id, sellers[product_id], sale_price, quantity,
+                          best[0] if best else None, sale_commission(sale_price, quantity), created_at))
+            total_quantity += quantity
+            total_amount += sale_price * quantity
+        orders.append((order_id, buyer_id, created_at, len(lines), total_quantity, total_amount))
+        if len(sales) >= BATCH_ROWS:
+            _insert_orders(conn, orders, sales)
+            orders.clear()
+            sales.clear()
+    _insert_orders(conn, orders, sales)
+
+    # Отзывы — на купленные товары, поэтому тоже смещены к популярным; оценки в основном высокие
+    with conn:
+        pairs = conn.execute("SELECT buyer_id, product_id FROM (SELECT DISTINCT buyer_id, product_id FROM sales) "
+                             "ORDER BY random() LIMIT ?", (sizes["reviews"],)).fetchall()
+        insert_batches(conn, "INSERT INTO reviews (buyer_id, product_id, rating, comment) VALUES (?,?,?,?)",
+                       ((buyer_id, product_id, rnd.choices(range(1, 6), weights=RATING_WEIGHTS)[0], rnd.choice(COMMENTS))
+                        for buyer_id, product_id in pairs))
+        # Дневные итоги продавцов и товаров — одним пересчётом вместо обновления после каждого заказа
+        rebuild_rollups(conn)
+
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("users", "sellers", "categories", "products", "promotions", "promotion_items", "orders", "sales",
+                            "reviews")}
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    database.close_all()
+    return counts
+
+
+def _insert_orders(conn, orders, sales):
+    # Итоги маркетплейса и продавцов пересчитывают триггеры продаж; seller_id задан сразу, триггер trg_sales_seller не нужен
+    with conn:
+        conn.executemany("INSERT INTO orders (id, buyer_id, created_at, items_count, total_quantity, total_amount) VALUES (?,?,?,?,?,?)",
+                         orders)
+        conn.executemany(""" INSERT INTO sales (id, order_id, product_id, buyer_id, seller_id, sale_price, sold_quantity,
+            applied_promotion_id, commission, sale_date) VALUES (?,?,?,?,?,?,?,?,?,?) """, sales)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация большой базы маркетплейса для замеров")
+    parser.add_argument("path", help="файл базы, например marketplace.db")
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель всех размеров")
+    for name, size in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None, help=f"по умолчанию {size} × scale")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="дней истории продаж до сегодняшнего")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="стоимость хэша паролей (по умолчанию — как при входе)")
+    parser.add_argument("--force", action="store_true", help="перезаписать существующий файл")
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            sys.exit(f"{args.path} уже существует, укажите --force, чтобы перезаписать")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+
+    sizes = {name: getattr(args, name) if getattr(args, name) is not None else max(int(size * args.scale), 1)
+             for name, size in DEFAULT_SIZES.items()}
+    start = time.perf_counter()
+    counts = generate(args.path, sizes, args.days, args.seed, args.bcrypt_rounds)
+    print(", ".join(f"{table}: {count}" for table, count in counts.items()))
+    print(f"{args.path}: {os.path.getsize(args.path) / 2 ** 20:.0f} МБ за {time.perf_counter() - start:.0f} с; "
+          f"пароль всех учётных записей — «{PASSWORD}»")
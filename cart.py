@@ -0,0 +1,152 @@
+import json
+from collections import namedtuple
+
+import queries
+from checkout import place_order
+from database import get_connection
+from pricing import BULK_PRICE_QUERY, apply_discount, current_timestamp, get_discounted_price
+from reservations import hold, hold_many, release
+
+# Через сколько миллисекунд после последнего изменения корзина записывается в базу
+CART_FLUSH_DELAY_MS = 3000
+
+# Расчёт корзины одним запросом: цены и акции из BULK_PRICE_QUERY плюс название товара,
+# остаток на складе и название применённой акции
+QUOTE_QUERY = """ SELECT q.id, p.title, p.quantity, q.price, q.promotion_id, pr.name, q.discount_percent
+    FROM ( """ + BULK_PRICE_QUERY + """ ) q INNER JOIN products p ON p.id = q.id LEFT JOIN promotions pr ON pr.id = q.promotion_id """
+
+# Строка расчёта: товар, количество в корзине, цена за единицу со скидкой и стоимость строки.
+# available — свободный остаток, если зарезервировать всё количество строки не удалось, иначе None.
+QuoteLine = namedtuple("QuoteLine", ["product_id", "title", "quantity", "unit_price", "original_price",
+                                     "promotion_id", "promotion_name", "discount_percent", "line_total", "in_stock",
+                                     "available"])
+# Расчёт всей корзины; товары, которых больше нет в каталоге, в него не попадают
+Quote = namedtuple("Quote", ["lines", "total"])
+
+
+class ShoppingCart:
+    # Корзина хранится в таблицах carts/cart_items и переживает выход и перезапуск программы.
+    # Содержимое читается из базы при первом обращении, а изменения копятся в памяти
+    # и записываются одной транзакцией в flush() (отложенная запись).
+    # on_change вызывается после каждого изменения — по нему окно планирует flush().
+    # Товар в корзине резервируется сразу (reservations.hold), чтобы другие покупатели его не раскупили.
+    # Резервы живут HOLD_TTL_SECONDS, поэтому у сохранённой корзины они ставятся заново при загрузке
+    # и продлеваются renew_holds(); строки, которые зарезервировать не удалось, перечислены в unavailable.
+    def __init__(self, user_id, on_change=None):
+        self.user_id = user_id
+        self.on_change = on_change
+        self._items = None  # product_id -> количество
+        self._dirty = set()  # товары, изменённые после последней записи
+        self._unavailable = {}  # product_id -> свободный остаток для строк без резерва
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = dict(get_connection().execute(queries.CART_ITEMS, (self.user_id,)).fetchall())
+            self._unavailable = hold_many(self.user_id, self._items)
+        return self._items
+
+    @property
+    def unavailable(self):
+        # {product_id: свободный остаток} для строк, количество которых сейчас не зарезервировано
+        self.items
+        return dict(self._unavailable)
+
+    def renew_holds(self):
+        # Ставит или продлевает резервы всех строк корзины; возвращает строки, которых не хватило
+        self._unavailable = hold_many(self.user_id, self.items)
+        return dict(self._unavailable)
+
+    def add_item(self, product_id, quantity):
+        # Повторное добавление товара увеличивает количество в той же строке.
+        # Резерв ставится на итоговое количество; если свободного товара не хватает — ValueError, корзина не меняется.
+        total = self.items.get(product_id, 0) + quantity
+        hold(self.user_id, product_id, total)
+        self.items[product_id] = total
+        self._unavailable.pop(product_id, None)
+        self._changed([product_id])
+
+    def remove_item(self, product_id):
+        # Удаляем конкретный товар из корзины и снимаем его резерв
+        if self.items.pop(product_id, None) is not None:
+            self._unavailable.pop(product_id, None)
+            release(self.user_id, [product_id])
+            self._changed([product_id])
+
+    def clear_cart(self):
+        # Полностью очищаем корзину
+        removed = list(self.items)
+        self.items.clear()
+        self._unavailable.clear()
+        if removed:
+            release(self.user_id, removed)
+        self._changed(removed)
+
+    def has_pending_changes(self):
+        return bool(self._dirty)
+
+    def flush(self):
+        # Записываем накопленные изменения: итоговое количество изменённых строк и удаление убранных
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        upserts = [(self.user_id, product_id, self._items[product_id]) for product_id in dirty if product_id in self._items]
+        deletes = [(self.user_id, product_id) for product_id in dirty if product_id not in self._items]
+
+        conn = get_connection()
+        try:
+            with conn:
+                conn.execute(queries.TOUCH_CART, (self.user_id,))
+                conn.executemany(queries.UPSERT_CART_ITEM, upserts)
+                conn.executemany(queries.DELETE_CART_ITEM, deletes)
+        except Exception:
+            # Не записанные изменения попробуем записать в следующий раз
+            self._dirty |= dirty
+            raise
+
+    def _changed(self, product_ids):
+        if not product_ids:
+            return
+        self._dirty.update(product_ids)
+        if self.on_change is not None:
+            self.on_change()
+
+    def quote(self):
+        # Названия, цены со скидкой, акции и итог по всей корзине за один запрос к базе
+        if not self.items:
+            return Quote([], 0)
+
+        cursor = get_connection().cursor()
+        cursor.execute(QUOTE_QUERY, (json.dumps(list(self.items)), current_timestamp()))
+        rows = {row[0]: row for row in cursor}
+
+        lines = []
+        unavailable = self._unavailable
+        for product_id, quantity in self.items.items():
+            row = rows.get(product_id)
+            if row is None:
+                continue
+            _, title, in_stock, price, promo_id, promo_name, discount = row
+            unit_price = apply_discount(price, discount)
+            lines.append(QuoteLine(product_id, title, quantity, unit_price, price, promo_id, promo_name, discount,
+                                   unit_price * quantity, in_stock, unavailable.get(product_id)))
+        return Quote(lines, sum(line.line_total for line in lines))
+
+    def get_total_amount(self):
+        # Суммарная стоимость товаров в корзине
+        return self.quote().total
+
+    def get_product_price(self, product_id):
+        # Получаем текущую цену товара с учетом возможных скидок
+        return get_discounted_price(product_id)
+
+    def checkout(self):
+        # Оформляем покупку одной транзакцией: цены, списание остатков и продажи (см. checkout.place_order)
+        # вместе с очисткой сохранённой корзины: после оформленного заказа записывать уже нечего,
+        # и ошибка записи не может выдать оформленный заказ за неудавшийся
+        if place_order(self.user_id, self.items.items(), clear_cart=True) is None:
+            return
+        # Резервы купленных товаров place_order тоже снял
+        self._items = {}
+        self._unavailable = {}
+        self._dirty = set()
@@ -0,0 +1,94 @@
+import math
+from collections import namedtuple
+
+import queries
+from categories import category_registry
+from database import get_connection
+from pricing import get_discounted_price, invalidate_prices
+
+INSERT_PRODUCT = """ INSERT INTO products (category_id, title, description, price, quantity, seller_id) VALUES (?, ?, ?, ?, ?, ?) """
+UPDATE_PRODUCT = """ UPDATE products SET title=?, category_id=?, description=?, price=?, quantity=? WHERE id=? AND seller_id=? """
+DELETE_PRODUCT = "DELETE FROM products WHERE id=? AND seller_id=?"
+
+# Товар продавца для формы редактирования
+EDITABLE_PRODUCT = """ SELECT p.title, c.name, p.description, p.price, p.quantity FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id WHERE p.id = ? AND p.seller_id = ? """
+
+# Поля товара после проверки: цена — float, количество — int
+ProductFields = namedtuple("ProductFields", ["title", "category", "description", "price", "quantity"])
+# Карточка товара для покупателя: строка каталога и цена с учётом действующей акции
+ProductDetails = namedtuple("ProductDetails", ["product_id", "title", "category_name", "description", "price", "quantity",
+                                               "avg_rating", "promotion_name", "final_price"])
+
+
+def parse_product(title, category, description, price, quantity):
+    # Проверяет поля товара (строки из формы или файла либо числа) и возвращает ProductFields.
+    # Ошибка — ValueError с текстом для пользователя.
+    title = (title or "").strip()
+    category = (category or "").strip()
+    if not title:
+        raise ValueError("Не указано название.")
+    if not category:
+        raise ValueError("Не указана категория.")
+    try:
+        price = float(str(price if price is not None else "").strip().replace(",", "."))
+    except ValueError:
+        raise ValueError("Некорректное значение цены.")
+    # float() принимает "inf", "nan" и переполняющиеся значения вроде "1e400"
+    if not math.isfinite(price):
+        raise ValueError("Некорректное значение цены.")
+    if not price > 0:
+        raise ValueError("Цена должна быть положительным числом.")
+    try:
+        quantity = int(str(quantity if quantity is not None else "").strip())
+    except ValueError:
+        raise ValueError("Некорректное значение количества.")
+    if quantity <= 0:
+        raise ValueError("Количество должно быть положительным числом.")
+    return ProductFields(title, category, description or "", price, quantity)
+
+
+def product_details(product_id):
+    # None, если товара больше нет
+    row = get_connection().execute(queries.PRODUCT_DETAILS, (product_id,)).fetchone()
+    if row is None:
+        return None
+    return ProductDetails(*row, get_discounted_price(product_id))
+
+
+def editable_product(product_id, seller_id):
+    # ProductFields товара продавца или None, если товар не найден
+    row = get_connection().execute(EDITABLE_PRODUCT, (product_id, seller_id)).fetchone()
+    return ProductFields(*row) if row else None
+
+
+def add_product(seller_id, title, category, description, price, quantity):
+    # Добавляет товар продавца; категория создаётся, если её ещё нет. Возвращает id товара.
+    fields = parse_product(title, category, description, price, quantity)
+    category_id = category_registry.get_or_create(fields.category)
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(INSERT_PRODUCT, (category_id, fields.title, fields.description, fields.price,
+                                               fields.quantity, seller_id))
+    return cursor.lastrowid
+
+
+def update_product(product_id, seller_id, title, category, description, price, quantity):
+    # Изменяет товар продавца; False, если у продавца нет такого товара
+    fields = parse_product(title, category, description, price, quantity)
+    category_id = category_registry.get_or_create(fields.category)
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(UPDATE_PRODUCT, (fields.title, category_id, fields.description, fields.price,
+                                               fields.quantity, product_id, seller_id))
+    # Цена могла измениться, закэшированная больше не актуальна
+    invalidate_prices([product_id])
+    return cursor.rowcount > 0
+
+
+def delete_product(product_id, seller_id):
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(DELETE_PRODUCT, (product_id, seller_id))
+    invalidate_prices([product_id])
+    return cursor.rowcount > 0
@@ -0,0 +1,112 @@
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt, pyqtSignal
+
+import db_executor
+from paging import PAGE_SIZE
+
+HEADERS = ["ID товара", "Название", "Категория", "Описание", "Цена", "Количество", "Средняя оценка", "Акция"]
+
+
+def _cell_text(row_data, final_price, column):
+    # Текст ячейки формируется только когда представление его запрашивает
+    if column == 0:
+        return str(row_data[0])
+    if column == 3:
+        return row_data[3][:50]
+    if column == 4:
+        return str(final_price)
+    if column == 5:
+        return str(row_data[5])
+    if column == 6:
+        return f"{row_data[6]:.2f}"
+    if column == 7:
+        return row_data[7] or "Нет акции"
+    return row_data[column]
+
+
+class ProductTableModel(QAbstractTableModel):
+    # Модель каталога товаров. Строки подгружаются страницами через canFetchMore/fetchMore,
+    # поэтому память и время первой отрисовки не зависят от размера каталога.
+    # Источник строк — функция fetch_page(after, limit) -> (строки, цены, after следующей страницы или None).
+    # Следующие страницы читаются в рабочем потоке (db_executor); пока страница загружается, новая не запрашивается.
+    # Ошибку загрузки страницы модель передаёт сигналом loadFailed и больше страниц не запрашивает.
+    loadFailed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._prices = {}
+        self._fetch_page = None
+        self._next = None
+        self._has_more = False
+        self._loading = False
+
+    def setSource(self, fetch_page, first_page=None):
+        # Заменяем источник строк; первую страницу можно передать уже загруженной (например, из рабочего потока).
+        # Страница прежнего источника, которая ещё загружается, в таблицу не попадёт.
+        db_executor.cancel(self, "page")
+        self._loading = False
+        self.beginResetModel()
+        self._rows = []
+        self._prices = {}
+        self._fetch_page = fetch_page
+        self._next = None
+        self._has_more = fetch_page is not None
+        self.endResetModel()
+
+        if first_page is not None:
+            self._appendPage(first_page)
+        elif self._has_more:
+            self.fetchMore()
+
+    def productId(self, row):
+        return self._rows[row][0]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        row_data = self._rows[index.row()]
+        return _cell_text(row_data, self._prices[row_data[0]][0], index.column())
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return HEADERS[section]
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._loading = True
+        db_executor.submit(self._fetch_page, self._next, PAGE_SIZE, owner=self, tag="page",
+                           on_result=self._pageLoaded, on_error=self._pageFailed)
+
+    def _pageLoaded(self, page):
+        self._loading = False
+        self._appendPage(page)
+
+    def _pageFailed(self, message):
+        self._loading = False
+        self._has_more = False
+        self.loadFailed.emit(message)
+
+    def _appendPage(self, page):
+        rows, prices, next_after = page
+        self._next = next_after
+        self._has_more = next_after is not None
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self._prices.update(prices)
+        self.endInsertRows()
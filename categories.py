@@ -0,0 +1,101 @@
+import threading
+
+from database import get_connection
+
+# Номер изменения категорий увеличивается триггерами при любой вставке, переименовании или удалении
+CATEGORIES_VERSION = "SELECT value FROM change_counters WHERE name = 'categories'"
+ALL_CATEGORIES = "SELECT id, name FROM categories"
+INSERT_CATEGORY = "INSERT INTO categories (name) VALUES (?) ON CONFLICT (name) DO NOTHING RETURNING id"
+CATEGORY_ID = "SELECT id FROM categories WHERE name = ?"
+
+
+class CategoryRegistry:
+    # Все категории в памяти: название <-> id. Загружаются один раз, новые добавляются через INSERT ... RETURNING.
+    # Изменения из других соединений и процессов (например, импорт товаров) видны по номеру изменения:
+    # refresh() сверяет его одним чтением по ключу и перечитывает категории, только если он сменился.
+    # Поиск id по названию и названия по id к базе не обращаются.
+    def __init__(self):
+        self._ids = None  # название -> id
+        self._names = {}  # id -> название
+        self._version = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        # Перечитывает категории, если их меняли; возвращает True, если список обновился
+        conn = get_connection()
+        version = conn.execute(CATEGORIES_VERSION).fetchone()[0]
+        with self._lock:
+            if self._ids is not None and version == self._version:
+                return False
+        self._load(conn)
+        return True
+
+    def names(self):
+        # Названия всех категорий по алфавиту
+        return sorted(self._loaded())
+
+    def id_for(self, name):
+        return self._loaded().get(name)
+
+    def name_for(self, category_id):
+        self._loaded()
+        return self._names.get(category_id)
+
+    def get_or_create(self, name):
+        # id категории; новая категория создаётся своей транзакцией
+        category_id = self.id_for(name)
+        if category_id is not None:
+            return category_id
+
+        conn = get_connection()
+        with conn:
+            row = conn.execute(INSERT_CATEGORY, (name,)).fetchone()
+            # Категорию уже добавило другое соединение — список в памяти устарел
+            created = row is not None
+            if not created:
+                row = conn.execute(CATEGORY_ID, (name,)).fetchone()
+            version = conn.execute(CATEGORIES_VERSION).fetchone()[0]
+
+        category_id = row[0]
+        with self._lock:
+            if self._ids is None:
+                # Список сбросили, пока шла вставка: он загрузится заново при следующем обращении
+                return category_id
+            self._ids[name] = category_id
+            self._names[category_id] = name
+            # Своя вставка — единственное изменение с последней загрузки: перечитывать список незачем
+            if created and version == self._version + 1:
+                self._version = version
+        return category_id
+
+    def get_or_create_many(self, names):
+        # {название: id} для набора названий; недостающие категории создаются
+        return {name: self.get_or_create(name) for name in set(names)}
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+            self._names = {}
+            self._version = None
+
+    def _loaded(self):
+        ids = self._ids
+        if ids is None:
+            self._load(get_connection())
+            ids = self._ids
+        return ids
+
+    def _load(self, conn):
+        # Вызывается вне транзакции соединения: она фиксируется по выходе из with
+        # Номер изменения и список читаются в одной транзакции, чтобы они соответствовали друг другу
+        with conn:
+            conn.execute("BEGIN")
+            version = conn.execute(CATEGORIES_VERSION).fetchone()[0]
+            rows = conn.execute(ALL_CATEGORIES).fetchall()
+        with self._lock:
+            self._ids = {name: category_id for category_id, name in rows}
+            self._names = {category_id: name for category_id, name in rows}
+            self._version = version
+
+
+category_registry = CategoryRegistry()
@@ -0,0 +1,89 @@
+import queries
+from analytics import update_rollups
+from database import get_connection
+from pricing import apply_discount, current_timestamp, fetch_price_rows
+from reservations import AVAILABLE_QUANTITY
+from revenue import sale_commission
+
+# Остаток уменьшается только если его хватает с учётом чужих действующих резервов:
+# проверка и списание — один оператор
+DECREMENT_STOCK = """ UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity - ( SELECT COALESCE(SUM(h.quantity), 0)
+    FROM stock_holds h WHERE h.product_id = products.id AND h.expires_at > ? AND h.buyer_id != ? ) >= ? """
+
+# Резерв покупателя на купленный товар больше не нужен
+DELETE_HOLD = "DELETE FROM stock_holds WHERE buyer_id = ? AND product_id = ?"
+
+# Заголовок заказа с итогами записывается один раз на оформление, строки заказа — продажи
+INSERT_ORDER = """ INSERT INTO orders ( buyer_id, created_at, items_count, total_quantity, total_amount ) VALUES (?,?,?,?,?) """
+
+INSERT_SALE = """ INSERT INTO sales ( order_id, product_id, buyer_id, sale_price, sold_quantity, applied_promotion_id, commission, sale_date )
+    VALUES (?,?,?,?,?,?,?,?) """
+
+
+def merge_items(items):
+    # Одинаковые товары корзины объединяются в одну строку: {product_id: количество}
+    quantities = {}
+    for product_id, quantity in items:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _shortage_message(conn, quantities, buyer_id, now):
+    # Какого товара не хватило — только для текста ошибки, транзакция всё равно будет отменена
+    for product_id, quantity in quantities.items():
+        row = conn.execute(AVAILABLE_QUANTITY, (now, buyer_id, product_id)).fetchone()
+        if row is None:
+            return f"Товар №{product_id} больше не продаётся."
+        if row[0] < quantity:
+            title = conn.execute("SELECT title FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+            return f"Недостаточно товара «{title}» ({max(row[0], 0)}) для покупки {quantity} штук."
+    return "Остаток товара изменился, попробуйте ещё раз."
+
+
+def place_order(buyer_id, items, clear_cart=False):
+    # Оформляет покупку товаров items — пар (product_id, количество) — одной транзакцией.
+    # BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому цены и остатки читаются и меняются
+    # согласованно, а параллельные покупатели ждут друг друга (busy_timeout) вместо перепродажи остатка.
+    # Товар, зарезервированный другими покупателями, не продаётся; свои резервы покупателя снимаются.
+    # clear_cart — очистить сохранённую корзину покупателя в той же транзакции (покупается вся корзина).
+    # Возвращает номер заказа.
+    quantities = merge_items(items)
+    if not quantities:
+        return None
+
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = current_timestamp()
+        # Цены и акции всех товаров — одним запросом внутри транзакции, без кэша
+        prices = fetch_price_rows(quantities, now)
+
+        cursor = conn.cursor()
+        cursor.executemany(DECREMENT_STOCK, [(quantity, product_id, now, buyer_id, quantity)
+                                             for product_id, quantity in quantities.items()])
+        # Для executemany rowcount — сумма по всем строкам: каждая успешная строка меняет ровно один товар
+        if cursor.rowcount != len(quantities) or len(prices) != len(quantities):
+            raise ValueError(_shortage_message(conn, quantities, buyer_id, now))
+        cursor.executemany(DELETE_HOLD, [(buyer_id, product_id) for product_id in quantities])
+
+        lines = []
+        for product_id, quantity in quantities.items():
+            price, promo_id, discount, _ = prices[product_id]
+            lines.append((product_id, apply_discount(price, discount), quantity, promo_id))
+
+        cursor.execute(INSERT_ORDER, (buyer_id, now, len(lines), sum(line[2] for line in lines),
+                                      sum(sale_price * quantity for _, sale_price, quantity, _ in lines)))
+        order_id = cursor.lastrowid
+        cursor.executemany(INSERT_SALE, [(order_id, product_id, buyer_id, sale_price, quantity, promo_id,
+                                          sale_commission(sale_price, quantity), now)
+                                         for product_id, sale_price, quantity, promo_id in lines])
+        # Дневные итоги продавцов и товаров — в той же транзакции
+        update_rollups(cursor, order_id)
+        if clear_cart:
+            cursor.execute(queries.CLEAR_CART, (buyer_id,))
+
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return order_id
@@ -0,0 +1,107 @@
+import atexit
+import os
+import sqlite3
+import threading
+import weakref
+
+from sql_trace import TracedConnection
+
+# Путь к базе данных и размер кэша подготовленных выражений можно задать через переменные окружения
+DB_PATH = os.environ.get('MARKETPLACE_DB', 'marketplace.db')
+CACHED_STATEMENTS = int(os.environ.get('MARKETPLACE_DB_CACHED_STATEMENTS', '256'))
+# Трассировка и замер времени всех запросов (см. sql_trace); по умолчанию выключена
+TRACE_SQL = os.environ.get('MARKETPLACE_SQL_TRACE', '') == '1'
+
+# PRAGMA, которые применяются один раз при открытии каждого соединения
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA busy_timeout = 5000",
+)
+
+_local = threading.local()
+_lock = threading.Lock()
+_generation = 0  # Увеличивается при смене настроек, чтобы потоки переоткрыли соединения
+
+
+class MarketplaceConnection(sqlite3.Connection):
+    # Подкласс нужен, чтобы на соединения можно было держать слабые ссылки
+    pass
+
+
+_connections = weakref.WeakSet()
+
+
+def configure(path=None, cached_statements=None, trace=None):
+    # Меняем настройки и закрываем все открытые соединения, они будут созданы заново.
+    # Включение и выключение трассировки соединений не закрывает: ими могут пользоваться другие потоки.
+    # Каждый поток сам переоткроет своё соединение при следующем get_connection вне транзакции.
+    global DB_PATH, CACHED_STATEMENTS, TRACE_SQL, _generation
+    with _lock:
+        if path is not None:
+            DB_PATH = path
+        if cached_statements is not None:
+            CACHED_STATEMENTS = cached_statements
+        if trace is not None:
+            TRACE_SQL = trace
+            _generation += 1
+    if path is not None or cached_statements is not None:
+        close_all()
+
+
+def _open_connection():
+    conn = sqlite3.connect(DB_PATH, cached_statements=CACHED_STATEMENTS, check_same_thread=False,
+                           factory=TracedConnection if TRACE_SQL else MarketplaceConnection)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection():
+    # Каждый поток получает своё долгоживущее соединение
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.generation != _generation:
+        # Соединение закрыто close_all или устарело после смены трассировки. Устаревшее закроется само, когда
+        # на него не останется ссылок (например, у недочитанного курсора); начатую на нём транзакцию доводим
+        # на нём же, иначе новое соединение ждало бы его блокировку.
+        with _lock:
+            reopen = conn not in _connections or not conn.in_transaction
+            if reopen:
+                _connections.discard(conn)
+        if reopen:
+            conn = None
+    if conn is None:
+        conn = _open_connection()
+        _local.conn = conn
+        _local.generation = _generation
+        with _lock:
+            _connections.add(conn)
+    return conn
+
+
+def close_connection():
+    # Закрываем соединение текущего потока (например, при завершении рабочего потока)
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        with _lock:
+            _connections.discard(conn)
+        conn.close()
+
+
+def close_all():
+    global _generation
+    with _lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+atexit.register(close_all)
@@ -0,0 +1,240 @@
+import functools
+import sys
+import threading
+
+from PyQt6.QtCore import QEvent, QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtWidgets import QDialog
+
+from database import get_connection
+
+# Сколько запросов к базе может выполняться одновременно. В режиме WAL читатели не блокируют друг друга.
+MAX_THREADS = 4
+
+
+def fetch_all(sql, params=()):
+    # Типовая задача для рабочего потока: выполнить запрос и вернуть все строки
+    return get_connection().execute(sql, params).fetchall()
+
+
+def fetch_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+
+class TaskCancelled(Exception):
+    # Прерывает задачу, которую отменили, при следующем вызове progress
+    pass
+
+
+class DbFuture(QObject):
+    # Результат фоновой задачи. Сигналы finished/failed/progress приходят в потоке интерфейса
+    # и не приходят вовсе, если задачу отменили.
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(object)
+
+    # Внутренние сигналы: испускаются рабочим потоком, доставляются очередью в поток объекта
+    _done = pyqtSignal(object)
+    _error = pyqtSignal(str)
+    _progress = pyqtSignal(object)
+
+    def __init__(self, executor):
+        super().__init__()
+        self._executor = executor
+        self._cancelled = False
+        self._is_done = False
+        self._conn = None
+        self._lock = threading.Lock()
+        self._done.connect(self._deliver_result)
+        self._error.connect(self._deliver_error)
+        self._progress.connect(self._deliver_progress)
+
+    def cancel(self):
+        # Отменяет задачу: если она ещё в очереди — не запустится, если выполняется — SQL-запрос прерывается
+        if self._is_done:
+            return
+        self._cancelled = True
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+        self._executor._forget(self)
+
+    def isCancelled(self):
+        return self._cancelled
+
+    def isDone(self):
+        return self._is_done
+
+    def report_progress(self, value):
+        # Вызывается задачей из рабочего потока; value доставляется в сигнал progress.
+        # Отменённая задача на этом вызове останавливается, даже если прерывать было нечего (запрос не выполнялся).
+        if self._cancelled:
+            raise TaskCancelled()
+        self._progress.emit(value)
+
+    def _deliver_progress(self, value):
+        if not self._cancelled and not self._is_done:
+            self.progress.emit(value)
+
+    def _deliver_result(self, result):
+        if self._cancelled:
+            return
+        self._is_done = True
+        self._executor._forget(self)
+        self.finished.emit(result)
+
+    def _deliver_error(self, message):
+        if self._cancelled:
+            return
+        self._is_done = True
+        self._executor._forget(self)
+        if self.receivers(self.failed) > 0:
+            self.failed.emit(message)
+        else:
+            # Ошибку, которую никто не обрабатывает, хотя бы выводим в консоль
+            print(message, file=sys.stderr)
+
+
+class _DbTask(QRunnable):
+    def __init__(self, future, func, args):
+        super().__init__()
+        self.future = future
+        self.func = func
+        self.args = args
+
+    def run(self):
+        future = self.future
+        if future._cancelled:
+            return
+        # У каждого потока пула своё соединение (database.get_connection)
+        with future._lock:
+            future._conn = get_connection()
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            if not future._cancelled:
+                future._error.emit(str(e))
+            return
+        finally:
+            with future._lock:
+                future._conn = None
+        future._done.emit(result)
+
+
+class _OwnerWatcher(QObject):
+    # Следит за окном-владельцем: когда окно закрывается, его задачи отменяются.
+    # Скрытие не отменяет загрузок: окна скрываются при переходах между ними и потом показываются снова,
+    # а результат, пришедший скрытому окну, просто будет виден при следующем показе.
+    # Диалог, завершённый через accept/reject (кнопкой или Esc), события Close не получает — его задачи отменяются по finished.
+    def __init__(self, owner):
+        super().__init__(owner)
+        self.futures = set()
+        self.tagged = {}
+        owner.installEventFilter(self)
+        if isinstance(owner, QDialog):
+            owner.finished.connect(self.cancel_all)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Close:
+            self.cancel_all()
+        return False
+
+    def cancel_all(self):
+        for future in list(self.futures):
+            future.cancel()
+        self.futures.clear()
+        self.tagged.clear()
+
+
+class DbExecutor(QObject):
+    # Выполняет функции доступа к данным в пуле потоков и отдаёт результат окнам через DbFuture
+    def __init__(self, max_threads=MAX_THREADS, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        # Потоки не завершаются по простою, чтобы их соединения с базой переиспользовались
+        self._pool.setExpiryTimeout(-1)
+        self._active = set()
+        self._watchers = {}
+
+    def submit(self, func, *args, owner=None, tag=None, on_result=None, on_error=None, on_progress=None):
+        # func(*args) выполняется в рабочем потоке и не должна обращаться к виджетам.
+        # owner — окно, с закрытием которого задача отменяется; новая задача с тем же tag
+        # у того же владельца отменяет предыдущую (повторная загрузка той же таблицы).
+        # С on_progress функция получает аргумент progress — её вызовы доходят до on_progress в потоке интерфейса.
+        future = DbFuture(self)
+        if on_result is not None:
+            future.finished.connect(on_result)
+        if on_error is not None:
+            future.failed.connect(on_error)
+        if on_progress is not None:
+            future.progress.connect(on_progress)
+            func = functools.partial(func, progress=future.report_progress)
+
+        if owner is not None:
+            watcher = self._watcher(owner)
+            if tag is not None:
+                previous = watcher.tagged.get(tag)
+                if previous is not None:
+                    previous.cancel()
+                watcher.tagged[tag] = future
+            watcher.futures.add(future)
+
+        self._active.add(future)
+        self._pool.start(_DbTask(future, func, args))
+        return future
+
+    def cancel(self, owner, tag=None):
+        # Отменить задачи окна: все или только с указанным tag
+        watcher = self._watchers.get(id(owner))
+        if watcher is None:
+            return
+        if tag is None:
+            watcher.cancel_all()
+        elif tag in watcher.tagged:
+            watcher.tagged.pop(tag).cancel()
+
+    def wait(self, msecs=-1):
+        # Дождаться завершения всех задач пула (для завершения работы и скриптов)
+        return self._pool.waitForDone(msecs)
+
+    def _watcher(self, owner):
+        key = id(owner)
+        watcher = self._watchers.get(key)
+        if watcher is None:
+            watcher = _OwnerWatcher(owner)
+            self._watchers[key] = watcher
+            owner.destroyed.connect(lambda *_, key=key: self._owner_destroyed(key))
+        return watcher
+
+    def _owner_destroyed(self, key):
+        watcher = self._watchers.pop(key, None)
+        if watcher is not None:
+            for future in list(watcher.futures):
+                future.cancel()
+
+    def _forget(self, future):
+        self._active.discard(future)
+        for watcher in self._watchers.values():
+            watcher.futures.discard(future)
+            for tag, tagged in list(watcher.tagged.items()):
+                if tagged is future:
+                    del watcher.tagged[tag]
+
+
+_executor = None
+
+
+def executor():
+    # Общий исполнитель приложения; создаётся при первом обращении, когда QApplication уже есть
+    global _executor
+    if _executor is None:
+        _executor = DbExecutor()
+    return _executor
+
+
+def submit(func, *args, **options):
+    return executor().submit(func, *args, **options)
+
+
+def cancel(owner, tag=None):
+    executor().cancel(owner, tag)
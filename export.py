@@ -0,0 +1,85 @@
+import csv
+import json
+import os
+import tempfile
+
+from database import get_connection
+
+# Сколько строк читается из курсора и записывается в файл за один раз. Память не зависит
+# от размера выгрузки: в ней только текущая порция строк.
+EXPORT_CHUNK_ROWS = 5000
+
+FORMATS = ("csv", "jsonl")
+
+# Продажи продавца и покупки покупателя в порядке оформления. Сортировка совпадает с индексами
+# (seller_id, sale_date) и (buyer_id, sale_date), поэтому строки читаются по индексу без сортировки всей выборки.
+SALE_EXPORT_COLUMNS = ["sale_id", "order_id", "sale_date", "product_id", "title", "quantity", "price", "amount",
+                       "commission", "net_revenue"]
+SALE_EXPORT = """ SELECT s.id, s.order_id, s.sale_date, s.product_id, p.title, s.sold_quantity, s.sale_price,
+    s.sale_price * s.sold_quantity, COALESCE(s.commission, 0), s.sale_price * s.sold_quantity - COALESCE(s.commission, 0)
+    FROM sales s LEFT JOIN products p ON p.id = s.product_id WHERE s.seller_id = ? ORDER BY s.sale_date, s.id """
+SALE_EXPORT_COUNT = "SELECT sales_count FROM seller_revenue_totals WHERE seller_id = ?"
+
+PURCHASE_EXPORT_COLUMNS = ["sale_id", "order_id", "sale_date", "product_id", "title", "quantity", "price", "amount",
+                           "promotion"]
+PURCHASE_EXPORT = """ SELECT s.id, s.order_id, s.sale_date, s.product_id, p.title, s.sold_quantity, s.sale_price,
+    s.sale_price * s.sold_quantity, pr.name FROM sales s LEFT JOIN products p ON p.id = s.product_id
+    LEFT JOIN promotions pr ON pr.id = s.applied_promotion_id WHERE s.buyer_id = ? ORDER BY s.sale_date, s.id """
+PURCHASE_EXPORT_COUNT = "SELECT COUNT(*) FROM sales WHERE buyer_id = ?"
+
+
+def export_sales(seller_id, path, fmt="csv", progress=None):
+    return export_query(SALE_EXPORT, (seller_id,), SALE_EXPORT_COLUMNS, path, fmt,
+                        _count(SALE_EXPORT_COUNT, seller_id), progress)
+
+
+def export_purchases(buyer_id, path, fmt="csv", progress=None):
+    return export_query(PURCHASE_EXPORT, (buyer_id,), PURCHASE_EXPORT_COLUMNS, path, fmt,
+                        _count(PURCHASE_EXPORT_COUNT, buyer_id), progress)
+
+
+def export_query(sql, params, columns, path, fmt, total=None, progress=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Записывает результат запроса в CSV или JSON Lines порциями по chunk_rows строк; возвращает число строк.
+    # progress((записано, всего)) вызывается перед началом и после каждой порции; исключение из него прекращает выгрузку.
+    # Файл пишется во временный рядом с path и заменяет его только после успешной выгрузки;
+    # при ошибке или отмене временный файл удаляется.
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, part_path = tempfile.mkstemp(prefix=name + ".", suffix=".part", dir=directory)
+    written = 0
+    try:
+        # utf-8-sig — чтобы Excel открыл CSV с кириллицей без выбора кодировки
+        with open(fd, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="") as file:
+            if fmt == "csv":
+                writer = csv.writer(file)
+                writer.writerow(columns)
+                write_rows = writer.writerows
+            else:
+                def write_rows(rows):
+                    file.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+            if progress is not None:
+                progress((0, total))
+            cursor = get_connection().execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                write_rows(rows)
+                written += len(rows)
+                if progress is not None:
+                    progress((written, total))
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return written
+
+
+def _count(sql, account_id):
+    # Число строк выгрузки для индикатора прогресса
+    row = get_connection().execute(sql, (account_id,)).fetchone()
+    return row[0] if row else 0
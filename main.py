@@ -1,56 +1,40 @@
 from PyQt6.QtWidgets import * #(QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton,
                             #QMessageBox, QTableWidget, QTableWidgetItem, QDialog, QHBoxLayout,
                              #QAbstractItemView,  QSpinBox, QDateTimeEdit, QComboBox)
-from PyQt6.QtCore import Qt
-import sqlite3
-import bcrypt
+from PyQt6.QtCore import QEvent, QObject, Qt, QTimer
+from PyQt6.QtGui import QCursor
 import sys
+import traceback
 from datetime import datetime
 
-def create_db():
-    connection = sqlite3.connect('marketplace.db')
-    cursor = connection.cursor()
-
-    # Таблица Пользователей
-    cursor.execute(""" CREATE TABLE IF NOT EXISTS users ( id INTEGER PRIMARY KEY AUTOINCREMENT, first_name TEXT NOT NULL,
-        last_name TEXT NOT NULL, email TEXT NOT NULL UNIQUE, phone_number TEXT NOT NULL UNIQUE, password_hash BLOB NOT NULL ) """)
-
-    # Таблица Продавцов
-    cursor.execute(""" CREATE TABLE IF NOT EXISTS sellers ( id INTEGER PRIMARY KEY AUTOINCREMENT,
-        organization_name TEXT NOT NULL, business_email TEXT NOT NULL UNIQUE, business_phone TEXT NOT NULL UNIQUE,
-        legal_address TEXT, password_hash BLOB NOT NULL) """)
-
-    # Таблица Категорий товаров
-    cursor.execute(""" CREATE TABLE IF NOT EXISTS categories ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE ) """)
-
-    # Таблица Товаров 
-    cursor.execute(""" CREATE TABLE IF NOT EXISTS products ( id INTEGER PRIMARY KEY AUTOINCREMENT, category_id INTEGER NOT NULL,
-        title TEXT NOT NULL, description TEXT NOT NULL, price DECIMAL(10, 2) NOT NULL, quantity INTEGER NOT NULL,
-        seller_id INTEGER NOT NULL, FOREIGN KEY (category_id) REFERENCES categories(id),
-        FOREIGN KEY (seller_id) REFERENCES sellers(id) ) """)
-
-    # Таблица Отзывов
-    cursor.execute(""" CREATE TABLE IF NOT EXISTS reviews ( id INTEGER PRIMARY KEY AUTOINCREMENT, buyer_id INTEGER NOT NULL,
-        product_id INTEGER NOT NULL, rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5), comment TEXT,
-        FOREIGN KEY (buyer_id) REFERENCES users(id), FOREIGN KEY (product_id) REFERENCES products(id) ) """)
+import database
+import db_executor
+import queries
+import sql_trace
+from accounts import (buyer_profile, register_buyer, register_seller, seller_profile, update_buyer_profile,
+                      update_seller_profile)
+from analytics import PERIODS, seller_period_totals, top_products
+from auth import authenticate
+from categories import category_registry
+from cart import CART_FLUSH_DELAY_MS, ShoppingCart
+from catalog import add_product, delete_product, editable_product, product_details, update_product
+from catalog_model import ProductTableModel
+from database import get_connection
+from export import export_purchases, export_sales
+from migrations import migrate
+from paging import order_query, sale_query
+from product_import import import_products
+from promotions import assign_promotion, create_promotion, list_promotions, promotion_choices
+from reservations import SWEEP_INTERVAL_MS, available_quantity, sweep_expired
+from reviews import (add_review, buyer_reviews, delete_review, get_review, purchased_products, seller_reviews,
+                     update_review)
+from revenue import marketplace_commission, seller_net_revenue
+from search import search_catalog
+from search_controller import SearchController
 
-    # Таблица Продаж
-    cursor.execute("""CREATE TABLE IF NOT EXISTS sales ( id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL,
-        buyer_id INTEGER NOT NULL, sale_price DECIMAL(10, 2) NOT NULL, sold_quantity INTEGER NOT NULL, applied_promotion_id INTEGER,
-        sale_date DATETIME DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (product_id) REFERENCES products(id),
-        FOREIGN KEY (buyer_id) REFERENCES users(id), FOREIGN KEY (applied_promotion_id) REFERENCES promotions(id) );""")
-
-    # Таблица Акций
-    cursor.execute(""" CREATE TABLE IF NOT EXISTS promotions ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
-        discount_percent INTEGER NOT NULL CHECK(discount_percent >= 0 AND discount_percent < 100),
-        valid_from DATETIME NOT NULL, valid_to DATETIME NOT NULL ) """)
-
-    # Промежуточная таблица товаров-участников акции
-    cursor.execute(""" CREATE TABLE IF NOT EXISTS promotion_items ( promotion_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
-        FOREIGN KEY (promotion_id) REFERENCES promotions(id), FOREIGN KEY (product_id) REFERENCES products(id), PRIMARY KEY(promotion_id, product_id) ) """)
-
-    connection.commit()
-    connection.close()
+def create_db():
+    # Создаём или обновляем схему базы данных через нумерованные миграции
+    migrate(get_connection())
 
 
 
@@ -83,7 +67,7 @@ style_sheet = """
         border-radius: 5px;
         padding: 5px;
     }
-    QTableWidget
+    QTableView
     {
         selection-background-color: #CFCFCF;
         gridline-color: #DDDDDD;
@@ -132,38 +116,6 @@ style_sheet = """
 """
 
 
-def get_max_discount_for_product(product_id):
-    conn = sqlite3.connect('marketplace.db')
-    cursor = conn.cursor()
-
-    # Запрашиваем максимальную скидку среди всех акций, применяемых к этому товару
-    cursor.execute(""" SELECT MAX(pr.discount_percent) FROM promotion_items pi INNER JOIN promotions pr ON pi.promotion_id
-            = pr.id WHERE pi.product_id = ? AND pr.valid_from <= ? AND pr.valid_to >= ? """,
-        (product_id, datetime.now(), datetime.now()))
-
-    result = cursor.fetchone()
-    max_discount = result[0] if result and result[0] is not None else 0
-    conn.close()
-    return max_discount
-
-def get_discounted_price(product_id):
-    conn = sqlite3.connect('marketplace.db')
-    cursor = conn.cursor()
-
-    # Получаем оригинальную цену товара
-    cursor.execute("SELECT price FROM products WHERE id=?", (product_id,))
-    original_price = cursor.fetchone()[0]
-
-    # Получаем максимальную скидку для товара
-    max_discount = get_max_discount_for_product(product_id)
-
-    # Высчитываем цену с учетом скидки
-    final_price = original_price * (1 - max_discount / 100)
-    conn.close()
-    return final_price
-
-
-    
 class MainMenu(QWidget):
     def __init__(self):
         super().__init__()
@@ -179,8 +131,9 @@ class MainMenu(QWidget):
         title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
                 
-        revenue_label = QLabel(f"<b>Доход маркетплейса составил уже:</b> {self.get_total_revenue():,.2f} руб!")
-        revenue_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # Сумма дохода считается в фоне и подставляется в метку, когда будет готова (update_revenue)
+        self.revenue_label = QLabel("<b>Доход маркетплейса составил уже:</b> ...")
+        self.revenue_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         
         login_button = QPushButton("Войти")
         login_button.clicked.connect(self.openLoginWindow)
@@ -189,7 +142,7 @@ class MainMenu(QWidget):
         registration_button.clicked.connect(self.openRegistrationWindow)
 
         layout.addWidget(title_label)
-        layout.addWidget(revenue_label)
+        layout.addWidget(self.revenue_label)
         layout.addStretch()
         layout.addWidget(login_button)
         layout.addWidget(registration_button)
@@ -198,29 +151,21 @@ class MainMenu(QWidget):
         self.setLayout(layout)
 
     def update_revenue(self):
-        total_revenue = self.get_total_revenue()
-        for widget in self.children():
-            if isinstance(widget, QLabel) and "<b>Доход маркетплейса:" in widget.text():
-                widget.setText(f"<b>Доход маркетплейса:</b> {total_revenue:,.2f} руб.")
+        # SUM по всем продажам выполняется в рабочем потоке, окно при этом не блокируется
+        db_executor.submit(self.get_total_revenue, owner=self, tag="revenue", on_result=self.showRevenue)
+
+    def showRevenue(self, total_revenue):
+        self.revenue_label.setText(f"<b>Доход маркетплейса составил уже:</b> {total_revenue:,.2f} руб!")
 
     def get_total_revenue(self):
-        comission = 0.006
+        # Выполняется в рабочем потоке: обращаться к виджетам здесь нельзя
         try:
-            conn = sqlite3.connect('marketplace.db')
-            c = conn.cursor()
-            
-            # Вычислим общую сумму продаж и применим процент комиссии
-            c.execute("""
-                SELECT SUM(sale_price * sold_quantity) FROM sales
-            """)
-            result = c.fetchone()[0]
-            return round(result * comission, 2) if result else 0.0
+            # Сумма комиссий копится при оформлении продаж, здесь читается одна строка итогов
+            return marketplace_commission()
         except Exception as e:
             print(e)
             return 0.0
-        finally:
-            conn.close()
-    
+
     def openLoginWindow(self):
         if 'login' not in self.windows:
             self.windows['login'] = LoginWindow(self)
@@ -253,14 +198,14 @@ class LoginWindow(QWidget):
         self.txt_password = QLineEdit()
         self.txt_password.setEchoMode(QLineEdit.EchoMode.Password)
 
-        btn_login = QPushButton("Войти")
-        btn_login.clicked.connect(lambda: self.login(self.txt_email.text(), self.txt_password.text())) 
+        self.btn_login = QPushButton("Войти")
+        self.btn_login.clicked.connect(lambda: self.login(self.txt_email.text(), self.txt_password.text()))
 
         layout.addWidget(self.lbl_email)
         layout.addWidget(self.txt_email)
         layout.addWidget(self.lbl_password)
         layout.addWidget(self.txt_password)
-        layout.addWidget(btn_login)
+        layout.addWidget(self.btn_login)
 
         self.setLayout(layout)
 
@@ -270,48 +215,34 @@ class LoginWindow(QWidget):
                 QMessageBox.warning(self, "Ошибка", "Заполните все поля.")
                 return
 
-            conn = sqlite3.connect('marketplace.db')
-            cursor = conn.cursor()
-
-            # Проверка пользователя
-            cursor.execute("SELECT password_hash FROM users WHERE email=?", (email,))
-            user_result = cursor.fetchone()
-
-            flag = 0
-
-            if user_result:
-                hashed_password = user_result[0]
-                if bcrypt.checkpw(password.encode('utf-8'), hashed_password):
-                    cursor.execute("SELECT id FROM users WHERE email=?", (email,))
-                    user_id = cursor.fetchone()[0]
-                    self.openBuyerDashboard(user_id)
-                    flag = 1
+            # Проверка пароля (bcrypt) идёт в рабочем потоке, окно не замирает
+            self.btn_login.setEnabled(False)
+            db_executor.submit(authenticate, email, password, owner=self, tag="login",
+                               on_result=self.finishLogin, on_error=self.showLoginError)
 
-            # Проверка продавца
-            cursor.execute("SELECT password_hash FROM sellers WHERE business_email=?", (email,))
-            seller_result = cursor.fetchone()
-
-            if seller_result:
-                hashed_password = seller_result[0]
-                if bcrypt.checkpw(password.encode('utf-8'), hashed_password):
-                    cursor.execute("SELECT id FROM sellers WHERE business_email=?", (email,))
-                    seller_id = cursor.fetchone()[0]
-                    self.openSellerDashboard(seller_id)
-                    flag = 1
+        except Exception as e:
+            QMessageBox.critical(self, "Критическая ошибка", f"Возникла ошибка: {str(e)}")
+            traceback.print_exc()
 
-            if flag == 0:
-                QMessageBox.warning(self, "Ошибка", "Неверный email или пароль.")
-                return  # Остаемся на экране, если произошла ошибка
+    def finishLogin(self, accounts):
+        self.btn_login.setEnabled(True)
+        if not accounts:
+            QMessageBox.warning(self, "Ошибка", "Неверный email или пароль.")
+            return  # Остаемся на экране, если произошла ошибка
 
-            conn.close()
+        for role, account_id in accounts:
+            if role == 'buyer':
+                self.openBuyerDashboard(account_id)
+            else:
+                self.openSellerDashboard(account_id)
 
-            # ОЧИСТКА ПОЛЕЙ
-            self.txt_email.clear()
-            self.txt_password.clear()
+        # ОЧИСТКА ПОЛЕЙ
+        self.txt_email.clear()
+        self.txt_password.clear()
 
-        except Exception as e:
-            QMessageBox.critical(self, "Критическая ошибка", f"Возникла ошибка: {str(e)}")
-            traceback.print_exc()
+    def showLoginError(self, message):
+        self.btn_login.setEnabled(True)
+        QMessageBox.critical(self, "Критическая ошибка", f"Возникла ошибка: {message}")
         
     def openBuyerDashboard(self, user_id):
         # Переходим в панель покупателя
@@ -330,7 +261,15 @@ class BuyerDashboard(QWidget):
         super().__init__()
         self.user_id = user_id
         self.main_menu = main_menu
-        self.shopping_cart = ShoppingCart(self.user_id)
+
+        # Изменения корзины записываются в базу пачкой через несколько секунд после последнего изменения
+        self.cart_flush_timer = QTimer(self)
+        self.cart_flush_timer.setSingleShot(True)
+        self.cart_flush_timer.setInterval(CART_FLUSH_DELAY_MS)
+        self.cart_flush_timer.timeout.connect(self.saveCart)
+
+        # Сохранённая корзина загрузится из базы при первом обращении к ней
+        self.shopping_cart = ShoppingCart(self.user_id, on_change=self.cart_flush_timer.start)
         self.initUI()
 
     def initUI(self):
@@ -362,11 +301,18 @@ class BuyerDashboard(QWidget):
         review_btn.clicked.connect(self.show_review_management)
         sidebar_layout.addWidget(review_btn)
 
+        # Список категорий заполняется, когда фоновый запрос вернёт результат
         self.categories_combo = QComboBox()
-        self.categories_combo.addItems(self.fetch_categories())  
+        self.categories_combo.addItem("Все", None)
         self.categories_combo.currentIndexChanged.connect(self.filterByCategory)
+        db_executor.submit(self.fetch_categories, owner=self, tag="categories", on_result=self.showCategories)
         sidebar_layout.addWidget(self.categories_combo)
     
+        # Поиск выполняется в рабочем потоке с задержкой после ввода
+        self.search_controller = SearchController(search_catalog, parent=self)
+        self.search_controller.results_ready.connect(self.showProducts)
+        self.search_controller.search_failed.connect(self.showSearchError)
+
         search_bar = QLineEdit()
         search_bar.setPlaceholderText("Поиск по названию...")
         search_bar.textChanged.connect(self.searchProducts)
@@ -380,11 +326,11 @@ class BuyerDashboard(QWidget):
         central_widget = QWidget()
         central_layout = QVBoxLayout(central_widget)
 
-        self.products_table = QTableWidget()
-        self.products_table.setColumnCount(8) 
-        self.products_table.setHorizontalHeaderLabels([ 
-            "ID товара", "Название", "Категория", "Описание", "Цена", "Количество", "Средняя оценка", "Акция"
-        ])
+        # Таблица товаров работает поверх модели, которая подгружает строки страницами
+        self.products_model = ProductTableModel(self)
+        self.products_model.loadFailed.connect(self.showLoadError)
+        self.products_table = QTableView()
+        self.products_table.setModel(self.products_model)
         self.products_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.products_table.doubleClicked.connect(self.showProductDetails)
         central_layout.addWidget(self.products_table)
@@ -399,98 +345,34 @@ class BuyerDashboard(QWidget):
         self.setLayout(main_layout)
         
     def fetch_categories(self):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
+        # Выполняется в рабочем потоке. Категории читаются из базы, только если их меняли с прошлой загрузки
+        category_registry.refresh()
+        return [(name, category_registry.id_for(name)) for name in category_registry.names()]
+
+    def showCategories(self, categories_list):
+        # Заполнение списка не должно запускать фильтрацию по категории.
+        # id категории хранится в самом пункте списка, фильтр по нему не обращается к базе.
+        self.categories_combo.blockSignals(True)
+        self.categories_combo.clear()
+        self.categories_combo.addItem("Все", None)
+        for name, category_id in categories_list:
+            self.categories_combo.addItem(name, category_id)
+        self.categories_combo.blockSignals(False)
 
-        # Извлекаем все уникальные категории
-        cursor.execute("SELECT name FROM categories ORDER BY name ASC;")
-        rows = cursor.fetchall()
-
-        # Преобразовываем результат в простой список имен категорий
-        categories_list = ["Все"] + [row[0] for row in rows]
-
-        conn.close()
-        return categories_list
-    
     def loadAllProducts(self):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        cursor.execute(""" SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity, COALESCE(AVG(r.rating), 0)
-            AS avg_rating, pr.name AS promotion_name FROM products p LEFT JOIN categories c ON p.category_id = c.id
-            LEFT JOIN promotion_items pi ON p.id = pi.product_id LEFT JOIN promotions pr ON pi.promotion_id = pr.id LEFT JOIN reviews r
-            ON p.id = r.product_id GROUP BY p.id """)
-        rows = cursor.fetchall()
-
-        # Настройка размера таблицы под количество строк
-        self.products_table.setRowCount(len(rows))
-
-        # Перебор всех записей и заполнение таблицы
-        row_num = 0
-        for row_data in rows:
-            columns = [
-                str(row_data[0]),             
-                row_data[1],                 
-                row_data[2],                 
-                row_data[3][:50],               
-                get_discounted_price(row_data[0]),  
-                str(row_data[5]),               
-                f"{row_data[6]:.2f}",            
-                row_data[7] or "Нет акции"     
-            ]
-
-            # Заполняем таблицу
-            for col_num, value in enumerate(columns):
-                item = QTableWidgetItem(str(value))
-                self.products_table.setItem(row_num, col_num, item)
-            row_num += 1
-
-        conn.close()
+        self.loadCatalog(None)
 
+    def loadCatalog(self, category_id):
+        # Результат отложенного поиска больше не нужен: таблицу заменит этот список.
+        # Первая страница загружается в фоне, следующие — по мере прокрутки таблицы.
+        self.search_controller.cancel()
+        db_executor.submit(search_catalog, None, category_id, owner=self, tag="products",
+                           on_result=self.showProducts, on_error=self.showLoadError)
 
     def filterByCategory(self, index):
-        if index == 0:
-            self.loadAllProducts()
-            return
+        # "Все" — весь каталог, иначе товары выбранной категории
+        self.loadCatalog(self.categories_combo.itemData(index))
 
-        # Иначе фильтруем товары по выбранной категории
-        category_name = self.categories_combo.currentText()
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        # Сначала находим ID категории по её имени
-        cursor.execute("SELECT id FROM categories WHERE name = ?", (category_name,))
-        category_id = cursor.fetchone()[0]
-
-        # Затем фильтруем товары по этому ID
-        cursor.execute(""" SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity, COALESCE(AVG(r.rating), 0)
-            AS avg_rating, pr.name AS promotion_name FROM products p LEFT JOIN categories c ON p.category_id = c.id LEFT JOIN promotion_items pi
-            ON p.id = pi.product_id LEFT JOIN promotions pr ON pi.promotion_id = pr.id LEFT JOIN reviews r ON p.id = r.product_id WHERE p.category_id = ?
-            GROUP BY p.id """, (category_id,))
-
-        rows = cursor.fetchall()
-
-        # Обновляем таблицу товаров
-        self.products_table.setRowCount(len(rows))
-        row_num = 0
-        for row_data in rows:
-            columns = [
-                str(row_data[0]),
-                row_data[1],
-                row_data[2],
-                row_data[3][:50],                   
-                get_discounted_price(row_data[0]),   
-                str(row_data[5]),
-                f"{row_data[6]:.2f}",
-                row_data[7] or "Нет акции"
-            ]
-
-            for col_num, value in enumerate(columns):
-                item = QTableWidgetItem(str(value))
-                self.products_table.setItem(row_num, col_num, item)
-            row_num += 1
-
-        conn.close()
     def openUserProfileSettings(self):
         try:
             profile_settings_dialog = UserProfileSettingsDialog(self.user_id)
@@ -499,57 +381,29 @@ class BuyerDashboard(QWidget):
             QMessageBox.critical(self, "Ошибка", f"Что-то пошло не так: {e}")
 
     def searchProducts(self, text):
-        # Сначала определяем текущую категорию
-        current_category = self.categories_combo.currentText()
-
-        # Если текущая категория равна "Все", ищем во всей базе
-        if current_category == "Все":
-            where_clause = "WHERE LOWER(p.title) LIKE LOWER(?)"
-        else:
-            # Иначе фильтруем ещё и по выбранной категории
-            cursor.execute("SELECT id FROM categories WHERE name = ?", (current_category,))
-            category_id = cursor.fetchone()[0]
-            where_clause = f"WHERE LOWER(p.title) LIKE LOWER(?) AND p.category_id={category_id}"
-
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
+        # Если текущая категория равна "Все", ищем во всей базе, иначе ещё и фильтруем по категории
+        category_id = self.categories_combo.currentData()
 
-        # Составляем запрос с учётом текущей категории
-        cursor.execute(f""" SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity, COALESCE(AVG(r.rating), 0)
-            AS avg_rating, pr.name AS promotion_name FROM products p LEFT JOIN categories c ON p.category_id = c.id LEFT JOIN promotion_items pi
-            ON p.id = pi.product_id LEFT JOIN promotions pr ON pi.promotion_id = pr.id LEFT JOIN reviews r ON p.id = r.product_id {where_clause}
-            GROUP BY p.id """, ('%' + text.strip().lower() + '%',))
+        # Поиск выполнится в фоне после паузы в наборе, в таблицу попадёт только последний результат.
+        # Незавершённая загрузка каталога не должна перезаписать результат поиска.
+        db_executor.cancel(self, "products")
+        self.search_controller.request(text, category_id)
 
-        rows = cursor.fetchall()
+    def showProducts(self, result):
+        fetch_page, first_page = result
+        self.products_model.setSource(fetch_page, first_page)
 
-        # Обновляем таблицу товаров
-        self.products_table.setRowCount(len(rows))
-        row_num = 0
-        for row_data in rows:
-            columns = [
-                str(row_data[0]),
-                row_data[1],
-                row_data[2],
-                row_data[3][:50],                    
-                get_discounted_price(row_data[0]),   
-                str(row_data[5]),
-                f"{row_data[6]:.2f}",
-                row_data[7] or "Нет акции"
-            ]
-
-            for col_num, value in enumerate(columns):
-                item = QTableWidgetItem(str(value))
-                self.products_table.setItem(row_num, col_num, item)
-            row_num += 1
-
-        conn.close()
+    def showSearchError(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить поиск: {message}")
 
+    def showLoadError(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить товары: {message}")
 
     def showProductDetails(self):
-        selected_row = self.products_table.currentRow()
+        selected_row = self.products_table.currentIndex().row()
         if selected_row != -1:
             try:
-                product_id = int(self.products_table.item(selected_row, 0).text())
+                product_id = self.products_model.productId(selected_row)
                 detail_dialog = ProductDetailDialog(product_id, shopping_cart=self.shopping_cart, parent=self)
                 detail_dialog.exec()
             except Exception as ex:
@@ -557,7 +411,6 @@ class BuyerDashboard(QWidget):
 
     def show_cart(self):
         try:
-            cart = ShoppingCart(self.user_id)
             cart_window = CartWindow(self.shopping_cart, parent=self)
             cart_window.exec()
             self.loadAllProducts()
@@ -573,23 +426,56 @@ class BuyerDashboard(QWidget):
             
     def show_review_management(self):
         try:
-            conn = sqlite3.connect('marketplace.db')
-            review_window = ReviewManagementWindow(self.user_id, conn, parent=self)
+            review_window = ReviewManagementWindow(self.user_id, parent=self)
             review_window.exec()
-            conn.close()
         except Exception as ex:
             QMessageBox.critical(self, "Критическая ошибка", f"Произошла непредвиденная ошибка: {ex}")
 
+    def flushCart(self):
+        # Записывает изменения корзины; возвращает текст ошибки или None.
+        # Не записанные изменения остаются в памяти и записываются при следующей попытке.
+        self.cart_flush_timer.stop()
+        try:
+            self.shopping_cart.flush()
+        except Exception as e:
+            return str(e)
+        return None
+
+    def saveCart(self):
+        error = self.flushCart()
+        if error is not None:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить корзину: {error}")
+
+    def confirmCartSaved(self):
+        # Перед выходом: True, если корзина сохранена или покупатель согласен потерять изменения
+        error = self.flushCart()
+        if error is None:
+            return True
+        reply = QMessageBox.question(
+            self, "Корзина не сохранена",
+            f"Не удалось сохранить корзину: {error}\nПоследние изменения корзины будут потеряны. Всё равно выйти?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        return reply == QMessageBox.StandardButton.Yes
+
+    def closeEvent(self, event):
+        # Закрытие окна завершает программу: несохранённые изменения корзины записываем сразу
+        if not self.confirmCartSaved():
+            event.ignore()
+            return
+        super().closeEvent(event)
+
     def logout(self):
         # Возврат на главное окно (не создается новое окно)
+        if not self.confirmCartSaved():
+            return
+        self.search_controller.cancel()
         self.main_menu.showAgain()
         self.hide()
 
 class ReviewManagementWindow(QDialog):
-    def __init__(self, user_id, conn, parent=None):
+    def __init__(self, user_id, parent=None):
         super().__init__(parent)
         self.user_id = user_id
-        self.conn = conn
         self.initUI()
 
     def initUI(self):
@@ -628,10 +514,10 @@ class ReviewManagementWindow(QDialog):
         self.resize(800, 600)
 
     def load_reviews(self):
-        cursor = self.conn.cursor()
-        cursor.execute(""" SELECT r.id, p.title, r.rating, r.comment FROM reviews r JOIN products p ON r.product_id = p.id WHERE r.buyer_id = ? """, (self.user_id,))
-        reviews = cursor.fetchall()
+        # Отзывы читаются в рабочем потоке, таблица заполняется в show_reviews
+        db_executor.submit(buyer_reviews, self.user_id, owner=self, tag="reviews", on_result=self.show_reviews)
 
+    def show_reviews(self, reviews):
         self.reviews_table.setRowCount(len(reviews))
         for row_idx, review in enumerate(reviews):
             review_id, product_title, rating, comment = review
@@ -671,80 +557,84 @@ class ReviewManagementWindow(QDialog):
 
     def edit_review(self, review_id):
         # Открывает окно редактирования отзыва
-        edit_dialog = EditReviewDialog(review_id, self.conn, parent=self)
+        edit_dialog = EditReviewDialog(review_id, self.user_id, parent=self)
         edit_dialog.exec()
 
     def delete_review(self, review_id):
         reply = QMessageBox.question(self, "Удаление отзыва", "Вы точно хотите удалить этот отзыв?", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM reviews WHERE id=?", (review_id,))
-            self.conn.commit()
+            delete_review(review_id, self.user_id)
             QMessageBox.information(self, "Удалено", "Отзыв успешно удалён.")
             self.load_reviews()
 
     def add_review(self):
         # Откроем форму добавления отзыва
-        add_review_dialog = AddReviewForm(self.user_id, self.conn, parent=self)
+        add_review_dialog = AddReviewForm(self.user_id, parent=self)
         add_review_dialog.exec()
         self.load_reviews()
 
 class EditReviewDialog(QDialog):
-    def __init__(self, review_id, conn, parent=None):
+    def __init__(self, review_id, user_id, parent=None):
         super().__init__(parent)
         self.review_id = review_id
-        self.conn = conn
+        self.user_id = user_id
         self.initUI()
 
     def initUI(self):
         layout = QFormLayout()
 
-        # Загружаем данные отзыва
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT rating, comment FROM reviews WHERE id=?", (self.review_id,))
-        review_data = cursor.fetchone()
-        if review_data:
-            rating, comment = review_data
-        else:
-            QMessageBox.warning(self, "Ошибка", "Отзыв не найден.")
-            self.close()
-            return
-
         # Поле рейтинга
         self.rating_spinbox = QSpinBox()
         self.rating_spinbox.setRange(1, 5)
-        self.rating_spinbox.setValue(rating)
         layout.addRow("Оценка:", self.rating_spinbox)
 
         # Поле комментария
         self.comment_field = QLineEdit()
-        self.comment_field.setText(comment)
         layout.addRow("Комментарий:", self.comment_field)
 
-        # Кнопка сохранить
-        save_button = QPushButton("Сохранить изменения")
-        save_button.clicked.connect(self.save_changes)
-        layout.addWidget(save_button)
+        # Кнопка сохранить; доступна, когда отзыв загрузится
+        self.save_button = QPushButton("Сохранить изменения")
+        self.save_button.clicked.connect(self.save_changes)
+        self.save_button.setEnabled(False)
+        layout.addWidget(self.save_button)
 
         self.setLayout(layout)
         self.setWindowTitle("Редактирование отзыва")
 
+        # Загружаем данные отзыва
+        db_executor.submit(get_review, self.review_id, self.user_id, owner=self, tag="review", on_result=self.show_review,
+                           on_error=self.show_load_error)
+
+    def show_review(self, review_data):
+        if not review_data:
+            QMessageBox.warning(self, "Ошибка", "Отзыв не найден.")
+            self.reject()
+            return
+        rating, comment = review_data
+        self.rating_spinbox.setValue(rating)
+        self.comment_field.setText(comment)
+        self.save_button.setEnabled(True)
+
+    def show_load_error(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить отзыв: {message}")
+
     def save_changes(self):
         rating = self.rating_spinbox.value()
         comment = self.comment_field.text().strip()
 
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE reviews SET rating=?, comment=? WHERE id=?", (rating, comment, self.review_id))
-        self.conn.commit()
+        try:
+            update_review(self.review_id, self.user_id, rating, comment)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
         QMessageBox.information(self, "Обновлено", "Отзыв успешно обновлён.")
         self.parent().load_reviews()  # Обновляем список отзывов родителя
         self.accept()
 
 class AddReviewForm(QDialog):
-    def __init__(self, user_id, conn, parent=None):
+    def __init__(self, user_id, parent=None):
         super().__init__(parent)
         self.user_id = user_id
-        self.conn = conn
         self.product_id = None  # Переменная для хранения идентификатора товара
         self.initUI()
 
@@ -775,10 +665,9 @@ class AddReviewForm(QDialog):
 
     def load_purchased_products(self):
         # Загружаем товары, которые пользователь купил
-        cursor = self.conn.cursor()
-        cursor.execute(""" SELECT DISTINCT p.id, p.title FROM sales s JOIN products p ON s.product_id = p.id WHERE s.buyer_id = ? """, (self.user_id,))
-        purchased_products = cursor.fetchall()
+        db_executor.submit(purchased_products, self.user_id, owner=self, tag="products", on_result=self.show_purchased_products)
 
+    def show_purchased_products(self, purchased_products):
         # Заполняем комбинационный бокс (dropdown list)
         for prod_id, title in purchased_products:
             self.purchased_products_combobox.addItem(title, prod_id)
@@ -797,24 +686,12 @@ class AddReviewForm(QDialog):
         rating = self.rating_spinbox.value()
         comment = self.comment_field.text().strip()
 
-        # Проверяем, выбран ли товар
-        if not self.product_id:
-            QMessageBox.warning(self, "Ошибка", "Выберите товар для отзыва.")
-            return
-
-        # Проверяем, есть ли уже отзыв от этого пользователя на этот товар
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id FROM reviews WHERE buyer_id=? AND product_id=?", (self.user_id, self.product_id))
-        existing_review = cursor.fetchone()
-
-        if existing_review:
-            QMessageBox.warning(self, "Ошибка", "Вы уже оставили отзыв на этот товар.")
+        # Товар должен быть выбран и куплен, повторный отзыв на тот же товар не принимается
+        try:
+            add_review(self.user_id, self.product_id, rating, comment)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
             return
-
-        # Добавляем отзыв в базу данных
-        cursor.execute("INSERT INTO reviews (buyer_id, product_id, rating, comment) VALUES (?,?,?,?)",
-                       (self.user_id, self.product_id, rating, comment))
-        self.conn.commit()
         QMessageBox.information(self, "Успех", "Ваш отзыв успешно отправлен.")
         self.accept()
 
@@ -827,61 +704,162 @@ class PurchaseHistoryWindow(QDialog):
     def initUI(self):
         layout = QVBoxLayout()
 
-        # Таблица для отображения истории покупок
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(6)
-        self.history_table.setHorizontalHeaderLabels([
-            "ID покупки", "Товар", "Количество", "Цена", "Дата покупки", "Промоакция"
-        ])
-        self.history_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-        self.history_table.setAlternatingRowColors(True)
-        self.history_table.setSortingEnabled(True)
+        # Дерево заказов: строка заказа с итогами, товары заказа загружаются при раскрытии
+        self.history_tree = QTreeWidget()
+        self.history_tree.setColumnCount(5)
+        self.history_tree.setHeaderLabels(["Заказ / товар", "Дата покупки", "Количество", "Сумма", "Промоакция"])
+        self.history_tree.setAlternatingRowColors(True)
+        self.history_tree.itemExpanded.connect(self.load_order_items)
+
+        # Кнопка догрузки следующей страницы истории
+        self.more_button = QPushButton("Показать ещё")
+        self.more_button.clicked.connect(lambda: self.load_orders(self.next_cursor))
 
-        # Загрузка данных о покупке
-        self.load_purchases()
+        # Выгрузка всей истории покупок в файл
+        export_button = QPushButton("Экспорт в файл...")
+        export_button.clicked.connect(lambda: ExportProgressDialog.start(self, export_purchases, self.user_id, "покупки"))
+
+        # Загрузка первой страницы заказов
+        self.orders = order_query(self.user_id)
+        self.next_cursor = None
+        self.load_orders()
 
         # Простая кнопка для закрытия окна
         close_button = QPushButton("Закрыть")
         close_button.clicked.connect(self.close)
 
         # Организация компоновки
-        layout.addWidget(self.history_table)
+        layout.addWidget(self.history_tree)
+        layout.addWidget(self.more_button)
+        layout.addWidget(export_button)
         layout.addWidget(close_button)
 
         self.setLayout(layout)
         self.setWindowTitle("История покупок")
         self.resize(800, 600)
 
-    def load_purchases(self):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        # Запрос на получение истории покупок конкретного пользователя
-        cursor.execute(""" SELECT s.id, p.title, s.sold_quantity, s.sale_price, s.sale_date, pr.name AS promotion_name FROM sales
-            s LEFT JOIN products p ON s.product_id = p.id LEFT JOIN promotions pr ON s.applied_promotion_id = pr.id WHERE
-            s.buyer_id = ? ORDER BY s.sale_date DESC """, (self.user_id,))
-
-        purchases = cursor.fetchall()
-        conn.close()
-
-        # Обновляем таблицу результатами
-        self.history_table.setRowCount(len(purchases))
-        for row_idx, purchase in enumerate(purchases):
-            date_obj = datetime.strptime(purchase[4], "%Y-%m-%d %H:%M:%S")
-            formatted_date = date_obj.strftime("%Y-%m-%d %H:%M")
-
-            columns = [
-                str(purchase[0]),  
-                purchase[1],        
-                str(purchase[2]),  
-                f"{purchase[3]:.2f} ₽",  
-                formatted_date,     
-                purchase[5] or "Без промоакции"     
-            ]
+    def load_orders(self, cursor=None):
+        # Загружаем в фоне одну страницу заказов; show_orders допишет её в дерево
+        self.more_button.setEnabled(False)
+        db_executor.submit(self.orders.page, cursor, owner=self, tag="orders", on_result=self.show_orders)
+
+    def show_orders(self, page):
+        self.next_cursor = page.cursor
+        self.more_button.setEnabled(True)
+        self.more_button.setVisible(page.cursor is not None)
+
+        for order_id, created_at, items_count, total_quantity, total_amount in page.rows:
+            formatted_date = datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M")
+            item = QTreeWidgetItem([f"Заказ №{order_id} ({items_count} поз.)", formatted_date,
+                                    str(total_quantity), f"{total_amount:.2f} ₽", ""])
+            item.setData(0, Qt.ItemDataRole.UserRole, order_id)
+            # Стрелка раскрытия видна до того, как товары заказа загружены
+            item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+            self.history_tree.addTopLevelItem(item)
+
+    def load_order_items(self, item):
+        # Товары заказа загружаются при первом раскрытии; повторное раскрытие до загрузки перезапускает её
+        order_id = item.data(0, Qt.ItemDataRole.UserRole)
+        if order_id is None or item.childCount():
+            return
+        db_executor.submit(db_executor.fetch_all, queries.ORDER_ITEMS, (order_id,), owner=self, tag=f"order-{order_id}",
+                           on_result=lambda rows: self.show_order_items(item, rows))
+
+    def show_order_items(self, item, rows):
+        for _, title, quantity, price, _, promotion_name in rows:
+            item.addChild(QTreeWidgetItem([title or "Товар удалён", "", str(quantity), f"{price * quantity:.2f} ₽",
+                                           promotion_name or "Без промоакции"]))
+        item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.DontShowIndicatorWhenChildless)
+
+class ExportProgressDialog(QProgressDialog):
+    # Выгрузка истории в файл в рабочем потоке (см. export.py) с индикатором по числу строк.
+    # Кнопка «Отмена» прерывает запрос, недописанный файл удаляется.
+    def __init__(self, export_func, account_id, path, fmt, parent=None):
+        super().__init__("Подготовка выгрузки...", "Отмена", 0, 0, parent)
+        self.path = path
+        self.setWindowTitle("Экспорт")
+        self.setWindowModality(Qt.WindowModality.WindowModal)
+        self.setMinimumDuration(0)
+        self.setAutoClose(False)
+        self.setAutoReset(False)
+
+        self.future = db_executor.submit(export_func, account_id, path, fmt, on_result=self.finishExport,
+                                         on_error=self.showExportError, on_progress=self.showProgress)
+        self.canceled.connect(self.future.cancel)
 
-            for col_idx, value in enumerate(columns):
-                item = QTableWidgetItem(str(value))
-                self.history_table.setItem(row_idx, col_idx, item)
+    @staticmethod
+    def start(parent, export_func, account_id, default_name):
+        # Спрашиваем имя файла и формат и запускаем выгрузку
+        path, selected_filter = QFileDialog.getSaveFileName(parent, "Экспорт", f"{default_name}.csv",
+                                                            "CSV (*.csv);;JSON Lines (*.jsonl)")
+        if not path:
+            return None
+        fmt = "jsonl" if path.endswith(".jsonl") or selected_filter.startswith("JSON") else "csv"
+        dialog = ExportProgressDialog(export_func, account_id, path, fmt, parent)
+        dialog.show()
+        return dialog
+
+    def showProgress(self, progress):
+        written, total = progress
+        if total:
+            self.setMaximum(total)
+            self.setValue(min(written, total))
+            self.setLabelText(f"Выгружено {written:,} из {total:,} строк")
+        else:
+            self.setLabelText(f"Выгружено {written:,} строк")
+
+    def finishExport(self, count):
+        self.close()
+        QMessageBox.information(self.parent(), "Экспорт", f"Выгружено строк: {count}.\nФайл: {self.path}")
+
+    def showExportError(self, message):
+        self.close()
+        QMessageBox.critical(self.parent(), "Ошибка", f"Не удалось выгрузить данные: {message}")
+
+class ImportProgressDialog(QProgressDialog):
+    # Импорт товаров из CSV в рабочем потоке (см. product_import.py): число прочитанных строк и ошибок,
+    # по окончании — скорость загрузки и список ошибочных строк
+    MAX_LISTED_ERRORS = 1000
+
+    def __init__(self, seller_id, path, parent=None):
+        super().__init__("Чтение файла...", "Остановить", 0, 0, parent)
+        self.setWindowTitle("Импорт товаров")
+        self.setWindowModality(Qt.WindowModality.WindowModal)
+        self.setMinimumDuration(0)
+        self.setAutoClose(False)
+        self.setAutoReset(False)
+
+        self.future = db_executor.submit(import_products, seller_id, path, on_result=self.showReport,
+                                         on_error=self.showImportError, on_progress=self.showProgress)
+        self.canceled.connect(self.stopImport)
+
+    def showProgress(self, progress):
+        rows, errors = progress
+        self.setLabelText(f"Обработано строк: {rows:,}, с ошибками: {errors:,}")
+
+    def stopImport(self):
+        # Уже записанные порции остаются в каталоге
+        if not self.future.isDone():
+            self.future.cancel()
+            self.done(QDialog.DialogCode.Rejected)
+
+    def showReport(self, report):
+        self.done(QDialog.DialogCode.Accepted)
+        speed = report.rows / report.seconds if report.seconds else report.rows
+        box = QMessageBox(QMessageBox.Icon.Information if not report.errors else QMessageBox.Icon.Warning, "Импорт товаров",
+                          f"Добавлено товаров: {report.imported} из {report.rows} строк за {report.seconds:.1f} с "
+                          f"({speed:,.0f} строк/с).\nСтрок с ошибками: {len(report.errors)}.", parent=self.parent())
+        if report.errors:
+            listed = report.errors[:self.MAX_LISTED_ERRORS]
+            details = "\n".join(f"Строка {line_number}: {message}" for line_number, message in listed)
+            if len(report.errors) > len(listed):
+                details += f"\n... и ещё {len(report.errors) - len(listed)}"
+            box.setDetailedText(details)
+        box.exec()
+
+    def showImportError(self, message):
+        self.done(QDialog.DialogCode.Rejected)
+        QMessageBox.critical(self.parent(), "Ошибка", f"Не удалось импортировать товары: {message}")
 
 class UserProfileSettingsDialog(QDialog):
     def __init__(self, user_id):
@@ -933,22 +911,18 @@ class UserProfileSettingsDialog(QDialog):
         self.loadUserData()
 
     def loadUserData(self):
-        try:
-            with sqlite3.connect('marketplace.db') as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """SELECT first_name, last_name, email, phone_number FROM users WHERE id=?""",
-                    (self.user_id,)
-                )
-                data = cursor.fetchone()
-
-                if data:
-                    self.first_name_edit.setText(data[0])
-                    self.last_name_edit.setText(data[1])
-                    self.email_edit.setText(data[2])
-                    self.phone_number_edit.setText(data[3])
-        except Exception as ex:
-            QMessageBox.critical(self, "Ошибка загрузки данных", f"Произошла ошибка: {ex}")
+        db_executor.submit(buyer_profile, self.user_id, owner=self, tag="profile", on_result=self.showUserData,
+                           on_error=self.showLoadError)
+
+    def showUserData(self, data):
+        if data:
+            self.first_name_edit.setText(data[0])
+            self.last_name_edit.setText(data[1])
+            self.email_edit.setText(data[2])
+            self.phone_number_edit.setText(data[3])
+
+    def showLoadError(self, message):
+        QMessageBox.critical(self, "Ошибка загрузки данных", f"Произошла ошибка: {message}")
 
     def saveChanges(self):
         try:
@@ -958,64 +932,8 @@ class UserProfileSettingsDialog(QDialog):
             phone = self.phone_number_edit.text().strip()
             new_password = self.new_password_edit.text().strip()
 
-            # Проверяем наличие обязательных полей
-            if not all([first_name, last_name, email, phone]):
-                raise ValueError("Все поля должны быть заполнены.")
-
-            # Проверяем формат номера телефона
-            if not phone.isdigit():
-                raise ValueError("Номер телефона должен состоять только из цифр.")
-
-            # Подключаемся к базе данных
-            with sqlite3.connect('marketplace.db') as conn:
-                cursor = conn.cursor()
-
-                # Проверяем уникальность email среди покупателей и продавцов
-                cursor.execute("SELECT COUNT(*) FROM users WHERE email=? AND id!=?", (email, self.user_id))
-                count_email_users = cursor.fetchone()[0]
-
-                cursor.execute("SELECT COUNT(*) FROM sellers WHERE business_email=?", (email,))
-                count_email_sellers = cursor.fetchone()[0]
-
-                total_count_email = count_email_users + count_email_sellers
-
-                # Проверяем уникальность phone среди покупателей и продавцов
-                cursor.execute("SELECT COUNT(*) FROM users WHERE phone_number=? AND id!=?", (phone, self.user_id))
-                count_phone_users = cursor.fetchone()[0]
-
-                cursor.execute("SELECT COUNT(*) FROM sellers WHERE business_phone=?", (phone,))
-                count_phone_sellers = cursor.fetchone()[0]
-
-                total_count_phone = count_phone_users + count_phone_sellers
-
-                # Если найден хотя бы один дубликат email или телефона
-                if total_count_email > 0:
-                    raise ValueError("Данный адрес электронной почты уже занят.")
-
-                if total_count_phone > 0:
-                    raise ValueError("Данный номер телефона уже занят.")
-
-                # Хэшируем новый пароль, если он указан
-                if new_password:
-                    salt = bcrypt.gensalt()
-                    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), salt)
-                else:
-                    hashed_password = None
-
-                # Формируем запрос на обновление данных
-                update_query = """UPDATE users SET first_name=?, last_name=?, email=?, phone_number=? """
-                params = [first_name, last_name, email, phone]
-
-                if hashed_password:
-                    update_query += ", password_hash=?"
-                    params.append(hashed_password)
-
-                update_query += "WHERE id=?"
-                params.append(self.user_id)
-
-                # Выполняем обновление данных
-                cursor.execute(update_query, tuple(params))
-                conn.commit()
+            # Проверка полей, занятости email и телефона и сохранение (ошибки ввода — ValueError)
+            update_buyer_profile(self.user_id, first_name, last_name, email, phone, new_password)
 
             # Сообщаем пользователю об успешности операции
             QMessageBox.information(self, "Успешно", "Ваш профиль успешно обновлен!")
@@ -1037,38 +955,18 @@ class ProductDetailDialog(QDialog):
         self.setWindowTitle("Подробности товара")
         layout = QVBoxLayout()
 
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        # Запрашиваем информацию о товаре
-        cursor.execute(""" SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity, COALESCE(AVG(r.rating), 0)
-            AS avg_rating, pr.name AS promotion_name FROM products p LEFT JOIN categories c ON p.category_id = c.id LEFT JOIN promotion_items
-            pi ON p.id = pi.product_id LEFT JOIN promotions pr ON pi.promotion_id = pr.id LEFT JOIN reviews r ON p.id = r.product_id WHERE p.id = ?
-
-            GROUP BY p.id, p.title, c.name, p.description, p.price, p.quantity, pr.name """, (self.product_id,))
-        product_data = cursor.fetchone()
-
-        if not product_data:
-            QMessageBox.critical(self, "Ошибка", "Данный товар не найден.")
-            return
-
-        # Раскладываем данные о товаре
-        ( _, title, category_name, description, original_price, quantity, avg_rating, promotion_name) = product_data
-
-        # Получаем итоговую цену с учетом скидок
-        final_price = get_discounted_price(self.product_id)
-
-        # Основные элементы интерфейса
-        title_label = QLabel(f"<h2><b>{title}</b></h2>")
-        category_label = QLabel(f"Категория: {category_name}")
-        description_label = QLabel(description)
-        price_label = QLabel(f"Цена: {final_price:.2f} руб.")
-        quantity_label = QLabel(f"В наличии: {quantity} шт.")
-        rating_label = QLabel(f"Средний рейтинг: {avg_rating:.2f}") if avg_rating > 0 else QLabel("Рейтинг отсутствует")
+        # Основные элементы интерфейса; заполняются, когда загрузится товар (show_details)
+        self.final_price = 0
+        self.title_label = QLabel()
+        self.category_label = QLabel()
+        self.description_label = QLabel()
+        self.price_label = QLabel()
+        self.quantity_label = QLabel()
+        self.rating_label = QLabel()
 
         # Спиннер для выбора количества товара
         spin_box = QSpinBox()
-        spin_box.setRange(1, quantity)
+        spin_box.setRange(1, 1)
         spin_box.valueChanged.connect(self.update_total_cost)
 
         # Метка для отображения итоговой суммы
@@ -1076,44 +974,71 @@ class ProductDetailDialog(QDialog):
         total_cost_label.setObjectName("totalCostLabel")
 
         # Кнопка добавления в корзину
-        add_cart_button = QPushButton("Добавить в корзину")
-        add_cart_button.clicked.connect(self.add_to_cart)
-        add_cart_button.setEnabled(quantity > 0)
+        self.add_cart_button = QPushButton("Добавить в корзину")
+        self.add_cart_button.clicked.connect(self.add_to_cart)
+        self.add_cart_button.setEnabled(False)
 
         # Добавляем элементы в форму
         form_layout = QFormLayout()
         form_layout.addRow("Выбор количества:", spin_box)
         form_layout.addRow(total_cost_label)
-        form_layout.addRow(add_cart_button)
+        form_layout.addRow(self.add_cart_button)
 
         # Генеральный макет окна
-        layout.addWidget(title_label)
-        layout.addWidget(category_label)
-        layout.addWidget(description_label)
-        layout.addWidget(price_label)
-        layout.addWidget(quantity_label)
-        layout.addWidget(rating_label)
+        layout.addWidget(self.title_label)
+        layout.addWidget(self.category_label)
+        layout.addWidget(self.description_label)
+        layout.addWidget(self.price_label)
+        layout.addWidget(self.quantity_label)
+        layout.addWidget(self.rating_label)
         layout.addLayout(form_layout)
 
         self.setLayout(layout)
         self.resize(400, 600)
-        conn.close()
 
-        # Обновляем итоговую сумму при старте окна
+        # Товар с итоговой ценой и свободный остаток читаются в рабочем потоке
+        db_executor.submit(self.fetch_details, owner=self, tag="details", on_result=self.show_details,
+                           on_error=self.show_load_error)
+
+    def fetch_details(self):
+        # Выполняется в рабочем потоке: (товар, свободный остаток, количество в корзине) или None, если товара нет.
+        # Корзина в это время не меняется: окно модальное, а добавление в корзину выключено до загрузки.
+        product = product_details(self.product_id)
+        if product is None:
+            return None
+        available = available_quantity(self.product_id, self.shopping_cart.user_id) or 0
+        return product, available, self.shopping_cart.items.get(self.product_id, 0)
+
+    def show_details(self, details):
+        if details is None:
+            QMessageBox.critical(self, "Ошибка", "Данный товар не найден.")
+            self.reject()
+            return
+        product, available, in_cart = details
+        # Доступно покупателю: остаток за вычетом чужих резервов; сколько уже лежит в его корзине, добавить повторно нельзя
+        can_add = max(available - in_cart, 0)
+        self.final_price = product.final_price
+
+        self.title_label.setText(f"<h2><b>{product.title}</b></h2>")
+        self.category_label.setText(f"Категория: {product.category_name}")
+        self.description_label.setText(product.description)
+        self.price_label.setText(f"Цена: {product.final_price:.2f} руб.")
+        self.quantity_label.setText(f"В наличии: {available} шт.")
+        self.rating_label.setText(f"Средний рейтинг: {product.avg_rating:.2f}" if product.avg_rating > 0 else "Рейтинг отсутствует")
+        self.findChild(QSpinBox).setRange(1, max(can_add, 1))
+        self.add_cart_button.setEnabled(can_add > 0)
+
+        # Обновляем итоговую сумму после загрузки
         self.update_total_cost()
 
+    def show_load_error(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить товар: {message}")
+
     def update_total_cost(self):
-        try:
-            # Получаем текущее значение спина
-            spin_value = self.findChild(QSpinBox).value()
-            # Повторно считаем итоговую цену
-            final_price = get_discounted_price(self.product_id)
-            total_cost = spin_value * final_price
-            # Находим метку и обновляем её текст
-            total_cost_label = self.findChild(QLabel, "totalCostLabel")
-            total_cost_label.setText(f"Общая сумма: {total_cost:.2f} руб.")
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Что-то пошло не так: {e}")
+        # Итоговая цена загружена вместе с товаром, пересчёт суммы к базе не обращается
+        spin_value = self.findChild(QSpinBox).value()
+        total_cost_label = self.findChild(QLabel, "totalCostLabel")
+        total_cost_label.setText(f"Общая сумма: {spin_value * self.final_price:.2f} руб.")
 
     def add_to_cart(self):
         try:
@@ -1123,38 +1048,6 @@ class ProductDetailDialog(QDialog):
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Что-то пошло не так: {e}")
 
-def find_applicable_promotion(product_id):
-    conn = sqlite3.connect('marketplace.db')
-    cursor = conn.cursor()
-
-    cursor.execute(""" SELECT pi.promotion_id, pr.discount_percent FROM promotion_items pi INNER JOIN promotions pr
-        ON pi.promotion_id = pr.id WHERE pi.product_id = ? AND datetime('now') BETWEEN pr.valid_from AND pr.valid_to ORDER BY
-        pr.discount_percent DESC LIMIT 1 """, (product_id,))
-
-    applicable_promo = cursor.fetchone()
-    conn.close()
-    return applicable_promo
-
-def get_discounted_price(product_id):
-    conn = sqlite3.connect('marketplace.db')
-    cursor = conn.cursor()
-
-    # Получаем оригинальную цену товара
-    cursor.execute("SELECT price FROM products WHERE id=?", (product_id,))
-    original_price = cursor.fetchone()[0]
-
-    # Проверяем наличие акции
-    applicable_promo = find_applicable_promotion(product_id)
-    if applicable_promo:
-        _, discount_percent = applicable_promo
-        final_price = original_price * (1 - discount_percent / 100)
-    else:
-        final_price = original_price
-
-    conn.close()
-    return final_price
-    
-
 class CartWindow(QDialog):
     def __init__(self, shopping_cart, parent=None):
         super().__init__(parent)
@@ -1166,22 +1059,28 @@ class CartWindow(QDialog):
 
         # Таблица для отображения товаров в корзине
         self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(['Товар', 'Количество', 'Цена', 'Стоимость'])
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(['Товар', 'Количество', 'Цена', 'Акция', 'Стоимость'])
         self.table.setAlternatingRowColors(True)
         self.table.setSortingEnabled(True)
-        self.fill_table()
+
+        # Строки, которые не удалось зарезервировать, купить в этом количестве не получится
+        self.unavailable_label = QLabel('Некоторых товаров не хватает: уменьшите количество или удалите их из корзины.')
+        self.unavailable_label.setStyleSheet('color: red;')
+        self.unavailable_label.setVisible(False)
 
         # Общая сумма заказа
-        self.total_label = QLabel(f'Итого: {self.shopping_cart.get_total_amount():.2f} ₽')
+        self.total_label = QLabel('Итого: …')
         self.total_label.setStyleSheet('font-weight: bold; color: green;')
 
-        # Кнопка для оформления заказа
+        # Кнопка для оформления заказа; доступна, когда корзина рассчитана
         self.buy_button = QPushButton('Завершить покупку')
         self.buy_button.clicked.connect(self.process_order)
+        self.buy_button.setEnabled(False)
 
         # Складываем виджетами
         layout.addWidget(self.table)
+        layout.addWidget(self.unavailable_label)
         layout.addWidget(self.total_label)
         layout.addWidget(self.buy_button)
 
@@ -1189,24 +1088,47 @@ class CartWindow(QDialog):
         self.setWindowTitle('Корзина')
         self.resize(600, 400)
 
-    def fill_table(self):
-        # Очищаем таблицу перед добавлением новых данных
-        self.table.setRowCount(0)
-
-        # Заполняем таблицу товарами из корзины
-        for i, (product_id, quantity) in enumerate(self.shopping_cart.items):
-            # Название товара
-            product_name = self.get_product_name(product_id)
-            # Цена товара
-            unit_price = self.shopping_cart.get_product_price(product_id)
-            # Стоимость всего выбранного товара
-            total_price = unit_price * quantity
-
-            self.table.insertRow(i)
-            self.table.setItem(i, 0, QTableWidgetItem(product_name))
-            self.table.setItem(i, 1, QTableWidgetItem(str(quantity)))
-            self.table.setItem(i, 2, QTableWidgetItem(f'{unit_price:.2f} ₽'))
-            self.table.setItem(i, 3, QTableWidgetItem(f'{total_price:.2f} ₽'))
+        db_executor.submit(self.fetch_quote, owner=self, tag="quote", on_result=self.show_quote, on_error=self.show_load_error)
+
+    def fetch_quote(self):
+        # Выполняется в рабочем потоке. Резервы строк продлеваются при каждом открытии корзины: они могли истечь,
+        # пока корзина лежала. Названия, цены и итог всей корзины приходят одним расчётом.
+        # Корзина в это время не меняется: окно модальное, а покупка выключена до окончания расчёта.
+        # Возвращает (текст ошибки продления резервов или None, расчёт).
+        try:
+            self.shopping_cart.renew_holds()
+            renew_error = None
+        except Exception as e:
+            renew_error = str(e)
+        return renew_error, self.shopping_cart.quote()
+
+    def show_quote(self, result):
+        renew_error, quote = result
+        if renew_error is not None:
+            QMessageBox.warning(self, 'Ошибка', f'Не удалось продлить резерв товаров: {renew_error}')
+        self.fill_table(quote)
+        self.unavailable_label.setVisible(any(line.available is not None for line in quote.lines))
+        self.total_label.setText(f'Итого: {quote.total:.2f} ₽')
+        self.buy_button.setEnabled(True)
+
+    def show_load_error(self, message):
+        QMessageBox.critical(self, 'Ошибка', f'Не удалось рассчитать корзину: {message}')
+
+    def fill_table(self, quote):
+        # Заполняем таблицу строками расчёта корзины, без дополнительных запросов
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(quote.lines))
+        for i, line in enumerate(quote.lines):
+            promotion = f'{line.promotion_name} (-{line.discount_percent}%)' if line.promotion_id else 'Нет акции'
+            self.table.setItem(i, 0, QTableWidgetItem(line.title))
+            quantity = str(line.quantity)
+            if line.available is not None:
+                quantity += f' (свободно {line.available})'
+            self.table.setItem(i, 1, QTableWidgetItem(quantity))
+            self.table.setItem(i, 2, QTableWidgetItem(f'{line.unit_price:.2f} ₽'))
+            self.table.setItem(i, 3, QTableWidgetItem(promotion))
+            self.table.setItem(i, 4, QTableWidgetItem(f'{line.line_total:.2f} ₽'))
+        self.table.setSortingEnabled(True)
 
     def process_order(self):
         # Обрабатываем покупку, удаляя купленные товары из корзины
@@ -1216,78 +1138,8 @@ class CartWindow(QDialog):
             self.close()
         except Exception as e:
             QMessageBox.critical(self, 'Ошибка', f'Во время оформления заказа возникла ошибка:\n{e}')
-    @staticmethod
-    def get_product_name(product_id):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT title FROM products WHERE id=?", (product_id,))
-        name = cursor.fetchone()[0]
-        conn.close()
-        return name
 
 
-class ShoppingCart:
-    def __init__(self, user_id):
-        self.user_id = user_id
-        self.items = []  # Туплы вида (product_id, quantity)
-
-    def add_item(self, product_id, quantity):
-        # Добавляем товар в корзину
-        self.items.append((product_id, quantity))
-
-    def remove_item(self, product_id):
-        # Удаляем конкретный товар из корзины
-        self.items = [item for item in self.items if item[0] != product_id]
-
-    def clear_cart(self):
-        # Полностью очищаем корзину
-        self.items.clear()
-
-    def get_total_amount(self):
-        # Суммарная стоимость товаров в корзине
-        total = 0
-        for product_id, quantity in self.items:
-            price = self.get_product_price(product_id)
-            total += price * quantity
-        return total
-
-    def get_product_price(self, product_id):
-        # Получаем текущую цену товара с учетом возможных скидок
-        return get_discounted_price(product_id)
-
-    def checkout(self):
-        # Оформляем покупку
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        for product_id, quantity in self.items:
-            # Проверяем доступное количество товара
-            cursor.execute("SELECT quantity FROM products WHERE id=?", (product_id,))
-            available_stock = cursor.fetchone()[0]
-            if available_stock < quantity:
-                raise ValueError(f"Недостаточно товара ({available_stock}) для покупки {quantity} штук.")
-
-            applicable_promo = find_applicable_promotion(product_id)
-            if applicable_promo:
-                promo_id, _ = applicable_promo
-            else:
-                promo_id = None
-
-            # Получение цены товара
-            discounted_price = self.get_product_price(product_id)
-
-            # Регистрация продажи с указанием применяемой акции
-            cursor.execute(
-                """ INSERT INTO sales ( product_id, buyer_id, sale_price, sold_quantity, applied_promotion_id ) VALUES (?,?,?,?,?) """,
-                (product_id, self.user_id, discounted_price, quantity, promo_id))
-
-            # Уменьшаем остаток товара
-            cursor.execute("UPDATE products SET quantity = quantity - ? WHERE id = ?", (quantity, product_id))
-
-        conn.commit()
-        conn.close()
-        self.clear_cart()
-        
 class SellerDashboard(QWidget):
     def __init__(self, seller_id, main_menu ):
         super().__init__()
@@ -1321,11 +1173,19 @@ class SellerDashboard(QWidget):
         history_btn.clicked.connect(self.show_sales_history) 
         sidebar_layout.addWidget(history_btn)
 
+        analytics_btn = QPushButton("Аналитика продаж")
+        analytics_btn.clicked.connect(self.show_sales_analytics)
+        sidebar_layout.addWidget(analytics_btn)
+
         promotions_btn = QPushButton("Управление акциями")
         promotions_btn.clicked.connect(self.managePromotions)
         sidebar_layout.addWidget(promotions_btn)
 
-        # Поиск товаров
+        # Поиск товаров выполняется в рабочем потоке с задержкой после ввода
+        self.search_controller = SearchController(search_catalog, parent=self)
+        self.search_controller.results_ready.connect(self.showProducts)
+        self.search_controller.search_failed.connect(self.showSearchError)
+
         search_bar = QLineEdit()
         search_bar.setPlaceholderText("Поиск по названию...")
         search_bar.textChanged.connect(self.filterProductsByName)
@@ -1349,17 +1209,19 @@ class SellerDashboard(QWidget):
         delete_product_btn.clicked.connect(self.deleteSelectedProduct)
         assign_promo_btn = QPushButton("Назначить акцию товару")
         assign_promo_btn.clicked.connect(self.assignPromotion)
+        import_btn = QPushButton("Импорт товаров из CSV")
+        import_btn.clicked.connect(self.importProducts)
         top_buttons_layout.addWidget(add_product_btn)
+        top_buttons_layout.addWidget(import_btn)
         top_buttons_layout.addWidget(delete_product_btn)
         top_buttons_layout.addWidget(assign_promo_btn)
         central_layout.addWidget(top_buttons_widget)
 
         # Таблица товаров с дополнительным полем "Акция"
-        self.products_table = QTableWidget()
-        self.products_table.setColumnCount(8)  # Один дополнительный столбец для акции
-        self.products_table.setHorizontalHeaderLabels([
-            "ID товара", "Название", "Категория", "Описание", "Цена", "Количество", "Средняя оценка", "Акция"
-        ])
+        self.products_model = ProductTableModel(self)
+        self.products_model.loadFailed.connect(self.showSearchError)
+        self.products_table = QTableView()
+        self.products_table.setModel(self.products_model)
         self.products_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.products_table.doubleClicked.connect(self.editProduct)
         central_layout.addWidget(self.products_table)
@@ -1384,75 +1246,27 @@ class SellerDashboard(QWidget):
         self.reviews_panel.show() 
 
     def filterProductsByName(self, text):
-        # Очистка таблицы
-        self.products_table.clearContents()
-        self.products_table.setRowCount(0)
+        # Поиск по названию и описанию выполняется в фоне; пустая строка вернёт все товары продавца
+        db_executor.cancel(self, "products")
+        self.search_controller.request(text, None, self.seller_id)
 
-        # Если текст пуст, загрузить все товары
-        if not text.strip():
-            self.loadProducts()
-            return
-        try:
-            # Фильтр товаров по названию
-            conn = sqlite3.connect('marketplace.db')
-            cursor = conn.cursor()
-            cursor.execute(""" SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity, COALESCE(AVG(r.rating), 0)
-                AS avg_rating, pr.name AS promotion_name FROM products p LEFT JOIN categories c ON p.category_id = c.id LEFT JOIN promotion_items pi
-                ON p.id = pi.product_id LEFT JOIN promotions pr ON pi.promotion_id = pr.id LEFT JOIN reviews r ON p.id = r.product_id
-                WHERE p.seller_id = ? AND LOWER(p.title) LIKE LOWER('%'||?||'%') GROUP BY p.id, p.title, c.name, p.description, p.price,
-                p.quantity, pr.name """, (self.seller_id, text))
-            filtered_rows = cursor.fetchall()
-
-            self.products_table.setRowCount(len(filtered_rows))
-            row_num = 0
-            for row_data in filtered_rows:
-                for col_num, value in enumerate(row_data):
-                    item = QTableWidgetItem(str(value))
-                    self.products_table.setItem(row_num, col_num, item)
-                row_num += 1
-
-            conn.close()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Что-то пошло не так: {e}")
-            
-
-    def loadProducts(self):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-        cursor.execute(""" SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity, COALESCE(AVG(r.rating), 0)
-            AS avg_rating, pr.name AS promotion_name FROM products p LEFT JOIN categories c ON p.category_id = c.id LEFT JOIN
-            promotion_items pi ON p.id = pi.product_id LEFT JOIN promotions pr ON pi.promotion_id = pr.id LEFT JOIN reviews r ON p.id
-            = r.product_id WHERE p.seller_id = ? GROUP BY p.id """, (self.seller_id,))
-        rows = cursor.fetchall()
-
-        self.products_table.setRowCount(len(rows))
-        row_num = 0
-        for row_data in rows:
-            # Получаем оригинальную цену товара
-            product_id = row_data[0]
-            original_price = row_data[4]
-
-            # Вычисляем итоговую цену с учетом скидки
-            final_price = get_discounted_price(product_id)
+    def showProducts(self, result):
+        fetch_page, first_page = result
+        self.products_model.setSource(fetch_page, first_page)
 
-            # Заполняем таблицу с учетом скидки
-            data_with_discount = list(row_data[:4]) + [final_price] + list(row_data[5:])
-            for col_num, value in enumerate(data_with_discount):
-                item = QTableWidgetItem(str(value))
-                self.products_table.setItem(row_num, col_num, item)
-            row_num += 1
+    def showSearchError(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Что-то пошло не так: {message}")
 
-        conn.close()
+    def loadProducts(self):
+        # Первая страница товаров продавца загружается в фоне, следующие — по мере прокрутки таблицы
+        self.search_controller.cancel()
+        db_executor.submit(search_catalog, None, None, self.seller_id, owner=self, tag="products",
+                           on_result=self.showProducts, on_error=self.showSearchError)
 
     def editProduct(self):
-        selected_row = self.products_table.currentRow()
+        selected_row = self.products_table.currentIndex().row()
         if selected_row != -1:
-            product_id_item = self.products_table.item(selected_row, 0)  # Берём ID товара из первой колонки
-            if product_id_item is None:
-                QMessageBox.warning(self, "Ошибка", "Не удалось получить ID товара.")
-                return
-
-            product_id = int(product_id_item.text())
+            product_id = self.products_model.productId(selected_row)  # ID товара берём из строки модели
 
             self.edit_dialog = EditProductDialog(product_id, self.seller_id)
             result = self.edit_dialog.exec()
@@ -1465,27 +1279,31 @@ class SellerDashboard(QWidget):
         if result == QDialog.DialogCode.Accepted:
             self.loadProducts()  # Обновим таблицу после добавления товара
 
+    def importProducts(self):
+        # Массовая загрузка товаров из CSV; таблица обновляется, когда загрузка закончится
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт товаров", "", "CSV (*.csv)")
+        if path:
+            self.import_dialog = ImportProgressDialog(self.seller_id, path, self)
+            self.import_dialog.finished.connect(lambda _: self.loadProducts())
+            self.import_dialog.show()
+
     def deleteSelectedProduct(self):
-        selected_row = self.products_table.currentRow()
+        selected_row = self.products_table.currentIndex().row()
         if selected_row != -1:
-            product_id = int(self.products_table.item(selected_row, 0).text())
+            product_id = self.products_model.productId(selected_row)
             reply = QMessageBox.question(
                 self, "Подтверждение удаления",
                 f"Удалить товар №{product_id}?",
                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
-                conn = sqlite3.connect('marketplace.db')
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM products WHERE id=? AND seller_id=?", (product_id, self.seller_id))
-                conn.commit()
-                conn.close()
+                delete_product(product_id, self.seller_id)
                 self.loadProducts()  # Обновление таблицы
 
     def assignPromotion(self):
         # Открыть диалог выбора акции для товара
-        selected_row = self.products_table.currentRow()
+        selected_row = self.products_table.currentIndex().row()
         if selected_row != -1:
-            product_id = int(self.products_table.item(selected_row, 0).text())
+            product_id = self.products_model.productId(selected_row)
             assign_dialog = AssignPromotionDialog(product_id, self.seller_id)
             result = assign_dialog.exec()
             if result == QDialog.DialogCode.Accepted:
@@ -1500,6 +1318,7 @@ class SellerDashboard(QWidget):
 
     def logout(self):
         # Возврат на главное окно (не создается новое окно)
+        self.search_controller.cancel()
         self.main_menu.showAgain()
         self.hide()
     def show_sales_history(self):
@@ -1507,6 +1326,11 @@ class SellerDashboard(QWidget):
         sales_history_window = SalesHistoryWindow(self.seller_id, parent=self)
         sales_history_window.exec()
 
+    def show_sales_analytics(self):
+        # Открываем окно аналитики продаж
+        analytics_window = SellerAnalyticsWindow(self.seller_id, parent=self)
+        analytics_window.exec()
+
 
 class SalesHistoryWindow(QDialog):
     def __init__(self, seller_id, parent=None):
@@ -1527,44 +1351,56 @@ class SalesHistoryWindow(QDialog):
         self.sales_table.setAlternatingRowColors(True)
         self.sales_table.setSortingEnabled(True)
 
-        # Загрузка данных о продажах
+        # Общий доход продавца за вычетом комиссии читается из накопленных итогов
+        self.total_label = QLabel("<b>Доход за всё время:</b> ...")
+        db_executor.submit(seller_net_revenue, self.seller_id, owner=self, tag="total",
+                           on_result=lambda total: self.total_label.setText(f"<b>Доход за всё время:</b> {total:,.2f} ₽"))
+
+        # Кнопка догрузки следующей страницы истории
+        self.more_button = QPushButton("Показать ещё")
+        self.more_button.clicked.connect(lambda: self.load_sales(self.next_cursor))
+
+        # Выгрузка всех продаж в файл для бухгалтерии
+        export_button = QPushButton("Экспорт в файл...")
+        export_button.clicked.connect(lambda: ExportProgressDialog.start(self, export_sales, self.seller_id, "продажи"))
+
+        # Загрузка первой страницы истории продаж
+        self.sales = sale_query(self.seller_id)
+        self.next_cursor = None
         self.load_sales()
 
         # Кнопка закрыть
         close_button = QPushButton("Закрыть")
         close_button.clicked.connect(self.close)
+        layout.addWidget(self.total_label)
         layout.addWidget(self.sales_table)
+        layout.addWidget(self.more_button)
+        layout.addWidget(export_button)
         layout.addWidget(close_button)
 
         self.setLayout(layout)
         self.setWindowTitle("История продаж")
         self.resize(800, 600)
 
-    def load_sales(self):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        # Получаем историю продаж текущего продавца
-        cursor.execute(
-            """SELECT s.id, p.title, s.sold_quantity, s.sale_price, s.sale_date, s.sale_price * s.sold_quantity AS revenue
-               FROM sales s JOIN products p ON s.product_id = p.id
-               WHERE p.seller_id = ?
-               ORDER BY s.sale_date DESC""",
-            (self.seller_id,)
-        )
+    def load_sales(self, cursor=None):
+        # Получаем в фоне одну страницу истории продаж текущего продавца
+        self.more_button.setEnabled(False)
+        db_executor.submit(self.sales.page, cursor, owner=self, tag="sales", on_result=self.show_sales)
 
-        sales = cursor.fetchall()
-        conn.close()
+    def show_sales(self, page):
+        self.next_cursor = page.cursor
+        self.more_button.setEnabled(True)
+        self.more_button.setVisible(page.cursor is not None)
 
-        # Настраиваем количество строк в таблице
-        self.sales_table.setRowCount(len(sales))
+        # Дописываем строки в конец таблицы, сортировку включаем после заполнения
+        self.sales_table.setSortingEnabled(False)
+        start = self.sales_table.rowCount()
+        self.sales_table.setRowCount(start + len(page.rows))
 
         # Перебираем каждую продажу и добавляем её данные в таблицу
-        for row_idx, sale in enumerate(sales):
-            sale_id, product_title, sold_qty, sale_price, sale_date_str, revenue = sale
-
-            # Применяем комиссию
-            adjusted_revenue = float(revenue) * 0.994
+        for row_idx, sale in enumerate(page.rows, start):
+            # Доход уже за вычетом комиссии, записанной в продажу
+            sale_id, product_title, sold_qty, sale_price, sale_date_str, net_revenue = sale
 
             # Форматируем дату продажи
             sale_date = datetime.strptime(sale_date_str, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M")
@@ -1575,13 +1411,81 @@ class SalesHistoryWindow(QDialog):
                 str(sold_qty),          
                 f"{sale_price:.2f} ₽",  
                 sale_date,             
-                f"{adjusted_revenue:.2f} ₽"     
+                f"{net_revenue:.2f} ₽"     
             ]
 
             # Заполняем ячейки таблицы
             for col_idx, value in enumerate(columns):
                 item = QTableWidgetItem(str(value))
                 self.sales_table.setItem(row_idx, col_idx, item)
+        self.sales_table.setSortingEnabled(True)
+
+class SellerAnalyticsWindow(QDialog):
+    # Итоги продаж за неделю, месяц и год и самые продаваемые товары. Данные читаются
+    # из дневных итогов (analytics.py), а не из всех продаж продавца.
+    def __init__(self, seller_id, parent=None):
+        super().__init__(parent)
+        self.seller_id = seller_id
+        self.initUI()
+
+    def initUI(self):
+        layout = QVBoxLayout()
+
+        # Итоги по периодам
+        self.totals_table = QTableWidget(len(PERIODS), 5)
+        self.totals_table.setHorizontalHeaderLabels(["Период", "Выручка", "Доход", "Продано, шт.", "Заказов"])
+        self.totals_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.totals_table.verticalHeader().setVisible(False)
+
+        # Самые продаваемые товары за выбранный период
+        self.period_combo = QComboBox()
+        for name, days in PERIODS:
+            self.period_combo.addItem(name, days)
+        self.period_combo.currentIndexChanged.connect(self.load_top_products)
+
+        self.top_table = QTableWidget(0, 4)
+        self.top_table.setHorizontalHeaderLabels(["Товар", "Продано, шт.", "Выручка", "Заказов"])
+        self.top_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.top_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+
+        close_button = QPushButton("Закрыть")
+        close_button.clicked.connect(self.close)
+
+        layout.addWidget(QLabel("<b>Итоги продаж</b>"))
+        layout.addWidget(self.totals_table)
+        layout.addWidget(QLabel("<b>Самые продаваемые товары</b>"))
+        layout.addWidget(self.period_combo)
+        layout.addWidget(self.top_table)
+        layout.addWidget(close_button)
+
+        self.setLayout(layout)
+        self.setWindowTitle("Аналитика продаж")
+        self.resize(700, 600)
+
+        self.load_totals()
+        self.load_top_products()
+
+    def load_totals(self):
+        db_executor.submit(seller_period_totals, self.seller_id, owner=self, tag="totals", on_result=self.show_totals)
+
+    def show_totals(self, totals):
+        for row_idx, period in enumerate(totals):
+            columns = [period.name, f"{period.revenue:,.2f} ₽", f"{period.net_revenue:,.2f} ₽", str(period.units), str(period.orders)]
+            for col_idx, value in enumerate(columns):
+                self.totals_table.setItem(row_idx, col_idx, QTableWidgetItem(value))
+        self.totals_table.resizeColumnsToContents()
+
+    def load_top_products(self):
+        db_executor.submit(top_products, self.seller_id, self.period_combo.currentData(), owner=self, tag="top",
+                           on_result=self.show_top_products)
+
+    def show_top_products(self, products):
+        self.top_table.setRowCount(len(products))
+        for row_idx, product in enumerate(products):
+            columns = [product.title or "Товар удалён", str(product.units), f"{product.revenue:,.2f} ₽", str(product.orders)]
+            for col_idx, value in enumerate(columns):
+                self.top_table.setItem(row_idx, col_idx, QTableWidgetItem(value))
+        self.top_table.resizeColumnsToContents()
 
 class ProfileSettingsDialog(QDialog):
     def __init__(self, seller_id):
@@ -1627,19 +1531,18 @@ class ProfileSettingsDialog(QDialog):
         self.setWindowTitle("Редактирование профиля продавца")
 
     def loadSellerData(self):
-        try:
-            with sqlite3.connect('marketplace.db') as conn:
-                cursor = conn.cursor()
-                cursor.execute(""" SELECT organization_name, business_email, business_phone, legal_address FROM sellers WHERE id=? """, (self.seller_id,))
-                current_data = cursor.fetchone()
-
-                if current_data:
-                    self.organization_name_edit.setText(current_data[0])
-                    self.business_email_edit.setText(current_data[1])
-                    self.business_phone_edit.setText(current_data[2])
-                    self.legal_address_edit.setText(current_data[3])
-        except Exception as ex:
-            QMessageBox.critical(self, "Ошибка загрузки данных", f"Произошла ошибка: {ex}")
+        db_executor.submit(seller_profile, self.seller_id, owner=self, tag="profile", on_result=self.showSellerData,
+                           on_error=self.showLoadError)
+
+    def showSellerData(self, current_data):
+        if current_data:
+            self.organization_name_edit.setText(current_data[0])
+            self.business_email_edit.setText(current_data[1])
+            self.business_phone_edit.setText(current_data[2])
+            self.legal_address_edit.setText(current_data[3])
+
+    def showLoadError(self, message):
+        QMessageBox.critical(self, "Ошибка загрузки данных", f"Произошла ошибка: {message}")
 
     def saveChanges(self):
         try:
@@ -1649,64 +1552,8 @@ class ProfileSettingsDialog(QDialog):
             address = self.legal_address_edit.text().strip()
             new_password = self.password_edit.text().strip()
 
-            # Проверка заполненности ключевых полей
-            if not all([org_name, email, phone]):
-                raise ValueError("Необходимо заполнить обязательные поля.")
-
-            # Проверка формата номера телефона
-            if not phone.isdigit():
-                raise ValueError("Номер телефона должен содержать только цифры.")
-
-            # Соединение с базой данных
-            with sqlite3.connect('marketplace.db') as conn:
-                cursor = conn.cursor()
-
-                # Проверяем уникальность email среди покупателей и продавцов
-                cursor.execute("SELECT COUNT(*) FROM users WHERE email=? AND id!=?", (email, self.seller_id))
-                count_email_users = cursor.fetchone()[0]
-
-                cursor.execute("SELECT COUNT(*) FROM sellers WHERE business_email=?", (email,))
-                count_email_sellers = cursor.fetchone()[0]
-
-                total_count_email = count_email_users + count_email_sellers
-
-                # Проверяем уникальность phone среди покупателей и продавцов
-                cursor.execute("SELECT COUNT(*) FROM users WHERE phone_number=? AND id!=?", (phone, self.seller_id))
-                count_phone_users = cursor.fetchone()[0]
-
-                cursor.execute("SELECT COUNT(*) FROM sellers WHERE business_phone=?", (phone,))
-                count_phone_sellers = cursor.fetchone()[0]
-
-                total_count_phone = count_phone_users + count_phone_sellers
-
-                # Если найден хотя бы один дубликат email или телефона
-                if total_count_email > 1 and count_email_users !=1:
-                    raise ValueError("Данный адрес электронной почты уже занят.")
-
-                if total_count_phone > 1 and count_phone_users !=1 :
-                    raise ValueError("Данный номер телефона уже занят.")
-
-                # Если задан новый пароль, хешируем его
-                if new_password:
-                    salt = bcrypt.gensalt()
-                    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), salt)
-                else:
-                    hashed_password = None
-
-                # Составляем SQL-запрос для обновления записи
-                update_query = """ UPDATE sellers SET organization_name=?, business_email=?, business_phone=?, legal_address=? """
-                params = [org_name, email, phone, address]
-
-                if hashed_password:
-                    update_query += ", password_hash=?"
-                    params.append(hashed_password)
-
-                update_query += " WHERE id=?"
-                params.append(self.seller_id)
-
-                # Выполняем обновление данных
-                cursor.execute(update_query, tuple(params))
-                conn.commit()
+            # Проверка полей, занятости email и телефона и сохранение (ошибки ввода — ValueError)
+            update_seller_profile(self.seller_id, org_name, email, phone, address, new_password)
 
             # Уведомляем пользователя об успешной операции
             QMessageBox.information(self, "Успех", "Профиль успешно обновлён!")
@@ -1757,21 +1604,12 @@ class ReviewsPanel(QWidget):
         self.setLayout(layout)
 
     def loadReviews(self):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        # Запрос зависит от установленного фильтра
-        if self.selected_product_name is None:
-            # Без фильтра — грузим все отзывы
-            cursor.execute(""" SELECT u.first_name || ' ' || u.last_name AS full_name, p.title, r.rating, r.comment,
-                r.id FROM reviews r INNER JOIN users u ON r.buyer_id=u.id INNER JOIN products p ON r.product_id=p.id WHERE p.seller_id=? """, (self.seller_id,))
-        else:
-            # Грузим отзывы только по указанному товару
-            cursor.execute(""" SELECT u.first_name || ' ' || u.last_name AS full_name, p.title, r.rating, r.comment,
-                r.id FROM reviews r INNER JOIN users u ON r.buyer_id=u.id INNER JOIN products p ON r.product_id=p.id WHERE p.seller_id=? AND p.title LIKE ? """, (self.seller_id, '%' + self.selected_product_name + '%'))  # LIKE с частичным соответствием
-
-        rows = cursor.fetchall()
+        # Без фильтра — все отзывы, иначе только по товарам с указанным названием.
+        # Новый фильтр отменяет ещё не завершённую загрузку с прежним
+        db_executor.submit(seller_reviews, self.seller_id, self.selected_product_name, owner=self, tag="reviews",
+                           on_result=self.showReviews)
 
+    def showReviews(self, rows):
         self.reviews_table.setRowCount(len(rows))
         row_num = 0
         for row_data in rows:
@@ -1780,7 +1618,6 @@ class ReviewsPanel(QWidget):
                 self.reviews_table.setItem(row_num, col_num, item)
             row_num += 1
 
-        conn.close()
 
     def filterByProductName(self):
         # Читаем введённое значение названия товара
@@ -1805,18 +1642,9 @@ class AssignPromotionDialog(QDialog):
         self.setWindowTitle("Назначение акции товару")
         layout = QVBoxLayout()
 
-        # Список доступных акций
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM promotions")
-        available_promos = cursor.fetchall()
-        conn.close()
-
-        # Добавляем пункт "Без акции"
+        # Добавляем пункт "Без акции"; доступные акции добавятся, когда загрузятся
         self.promo_combo = QComboBox()
         self.promo_combo.addItem("Без акции", None)  # Специальный пункт для снятия акции
-        for promo_id, promo_name in available_promos:
-            self.promo_combo.addItem(promo_name, promo_id)
 
         layout.addWidget(QLabel("Выберите акцию:"))
         layout.addWidget(self.promo_combo)
@@ -1828,21 +1656,20 @@ class AssignPromotionDialog(QDialog):
 
         self.setLayout(layout)
 
-    def applyPromotion(self):
-        selected_promo_id = self.promo_combo.currentData()
+        # Список доступных акций
+        db_executor.submit(promotion_choices, owner=self, tag="promotions", on_result=self.showPromotions,
+                           on_error=self.showLoadError)
 
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
+    def showPromotions(self, available_promos):
+        for promo_id, promo_name in available_promos:
+            self.promo_combo.addItem(promo_name, promo_id)
 
-        if selected_promo_id is None:
-            # Если выбрано "Без акции", удаляем существующую связь
-            cursor.execute("DELETE FROM promotion_items WHERE product_id=?", (self.product_id,))
-        else:
-            # Присваиваем новую акцию или обновляем старую
-            cursor.execute("INSERT OR REPLACE INTO promotion_items (promotion_id, product_id) VALUES (?, ?)", (selected_promo_id, self.product_id))
+    def showLoadError(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить акции: {message}")
 
-        conn.commit()
-        conn.close()
+    def applyPromotion(self):
+        # "Без акции" снимает акции товара, иначе назначается выбранная
+        assign_promotion(self.product_id, self.promo_combo.currentData())
 
         QMessageBox.information(self, "Готово", "Акция назначена товару, цены обновлены.")
         self.accept()
@@ -1876,11 +1703,9 @@ class PromotionsDialog(QDialog):
         self.setLayout(layout)
 
     def loadPromotions(self):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM promotions ORDER BY valid_from DESC")
-        rows = cursor.fetchall()
+        db_executor.submit(list_promotions, owner=self, tag="promotions", on_result=self.showPromotions)
 
+    def showPromotions(self, rows):
         self.promotions_table.setRowCount(len(rows))
         row_num = 0
         for row_data in rows:
@@ -1896,7 +1721,6 @@ class PromotionsDialog(QDialog):
             self.promotions_table.setItem(row_num, 3, QTableWidgetItem(end_date))
             row_num += 1
 
-        conn.close()
 
     def createPromotion(self):
         try:
@@ -1958,32 +1782,13 @@ class CreatePromotionDialog(QDialog):
             start_date = self.start_date_input.dateTime().toString("yyyy-MM-dd HH:mm:ss")
             end_date = self.end_date_input.dateTime().toString("yyyy-MM-dd HH:mm:ss")
 
-            # Проверка корректности данных
-            if not promo_name:
-                QMessageBox.warning(self, "Ошибка", "Введите название акции.")
-                return
-
-            # Проверка срока действия акции
-            now = datetime.now()
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
-
-            if start_dt > end_dt:
-                QMessageBox.warning(self, "Ошибка", "Дата окончания должна быть позже даты начала.")
-                return
-
-            if now > end_dt:
-                QMessageBox.warning(self, "Ошибка", "Срок действия акции истекает до настоящего времени.")
+            # Проверка названия и срока действия акции и добавление её в базу
+            try:
+                create_promotion(promo_name, discount, start_date, end_date)
+            except ValueError as e:
+                QMessageBox.warning(self, "Ошибка", str(e))
                 return
 
-            # Добавляем акцию в базу данных
-            conn = sqlite3.connect('marketplace.db')
-            cursor = conn.cursor()
-            cursor.execute(""" INSERT INTO promotions (name, discount_percent, valid_from, valid_to) VALUES
-                (?, ?, ?, ?) """, (promo_name, discount, start_date, end_date))
-            conn.commit()
-            conn.close()
-
             QMessageBox.information(self, "Готово", "Акция успешно создана")
             self.accept()
         except Exception as e:
@@ -2001,24 +1806,17 @@ class EditProductDialog(QDialog):
         self.setWindowTitle("Редактирование товара")
         layout = QVBoxLayout()
 
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-        # Объединяем данные товаров и категорий
-        cursor.execute(""" SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity FROM
-            products p LEFT JOIN categories c ON p.category_id=c.id WHERE p.id=? """, (self.product_id,))
-        current_product = cursor.fetchone()
-        conn.close()
-
-        # Инициализируем поля для редактирования
-        self.title_input = QLineEdit(current_product[1])  # Название товара
-        self.category_input = QLineEdit(current_product[2])  # Название категории
-        self.description_input = QLineEdit(current_product[3])
-        self.price_input = QLineEdit(str(current_product[4]))
-        self.quantity_input = QLineEdit(str(current_product[5]))
+        # Инициализируем поля для редактирования; заполняются, когда товар загрузится
+        self.title_input = QLineEdit()  # Название товара
+        self.category_input = QLineEdit()  # Название категории
+        self.description_input = QLineEdit()
+        self.price_input = QLineEdit()
+        self.quantity_input = QLineEdit()
 
         # Формируем UI
-        save_btn = QPushButton("Сохранить изменения")
-        save_btn.clicked.connect(self.saveChanges)
+        self.save_btn = QPushButton("Сохранить изменения")
+        self.save_btn.clicked.connect(self.saveChanges)
+        self.save_btn.setEnabled(False)
 
         layout.addWidget(QLabel("Название:"))
         layout.addWidget(self.title_input)
@@ -2030,68 +1828,38 @@ class EditProductDialog(QDialog):
         layout.addWidget(self.price_input)
         layout.addWidget(QLabel("Количество:"))
         layout.addWidget(self.quantity_input)
-        layout.addWidget(save_btn)
+        layout.addWidget(self.save_btn)
 
         self.setLayout(layout)
-    def validateInput(self):
-        # Проверка цены
-        try:
-            price = float(self.price_input.text())
-            if price <= 0:
-                raise ValueError("Цена должна быть положительным числом.")
-        except ValueError:
-            QMessageBox.warning(self, "Ошибка", "Некорректное значение цены.")
-            return False
-
-        # Проверка количества
-        try:
-            quantity = int(self.quantity_input.text())
-            if quantity <= 0:
-                raise ValueError("Количество должно быть положительным числом.")
-        except ValueError:
-            QMessageBox.warning(self, "Ошибка", "Некорректное значение количества.")
-            return False
-
-        return True
-    
-    def saveChanges(self):
-        if not self.validateInput():  # Проверка правильности введённых данных
-            return
-        new_title = self.title_input.text().strip()
-        new_category_name = self.category_input.text().strip()
-        new_description = self.description_input.text()
-        new_price = float(self.price_input.text())
-        new_quantity = int(self.quantity_input.text())
-
-        # Проверяем категорию и получаем её ID
-        category_id = self.get_or_create_category(new_category_name)
-
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-        cursor.execute("""UPDATE products SET title=?, category_id=?, description=?, price=?, quantity=? WHERE id=?""",
-                      (new_title, category_id, new_description, new_price, new_quantity, self.product_id))
-        conn.commit()
-        conn.close()
-        self.accept()
 
-    def get_or_create_category(self, category_name):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
+        # Товар продавца вместе с названием категории
+        db_executor.submit(editable_product, self.product_id, self.seller_id, owner=self, tag="product",
+                           on_result=self.showProduct, on_error=self.showLoadError)
 
-        # Сначала ищем категорию по имени
-        cursor.execute("SELECT id FROM categories WHERE name=?", (category_name,))
-        result = cursor.fetchone()
+    def showProduct(self, current_product):
+        if current_product is None:
+            QMessageBox.warning(self, "Ошибка", "Товар не найден.")
+            self.reject()
+            return
+        self.title_input.setText(current_product.title)
+        self.category_input.setText(current_product.category)
+        self.description_input.setText(current_product.description)
+        self.price_input.setText(str(current_product.price))
+        self.quantity_input.setText(str(current_product.quantity))
+        self.save_btn.setEnabled(True)
 
-        if result:
-            category_id = result[0]
-        else:
-            # Если категории нет, создаём новую
-            cursor.execute("INSERT INTO categories(name) VALUES (?)", (category_name,))
-            category_id = cursor.lastrowid
-            conn.commit()
+    def showLoadError(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить товар: {message}")
 
-        conn.close()
-        return category_id
+    def saveChanges(self):
+        # Поля проверяются при сохранении (catalog.parse_product), категория создаётся, если её ещё нет
+        try:
+            update_product(self.product_id, self.seller_id, self.title_input.text(), self.category_input.text(),
+                           self.description_input.text(), self.price_input.text(), self.quantity_input.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
+        self.accept()
 
 # Окно для добавления нового товара
 class AddProductDialog(QDialog):
@@ -2127,65 +1895,15 @@ class AddProductDialog(QDialog):
 
         self.setLayout(layout)
 
-    def validateInput(self):
-        # Проверка цены
-        try:
-            price = float(self.price_input.text())
-            if price <= 0:
-                raise ValueError("Цена должна быть положительным числом.")
-        except ValueError:
-            QMessageBox.warning(self, "Ошибка", "Некорректное значение цены.")
-            return False
-
-        # Проверка количества
-        try:
-            quantity = int(self.quantity_input.text())
-            if quantity <= 0:
-                raise ValueError("Количество должно быть положительным числом.")
-        except ValueError:
-            QMessageBox.warning(self, "Ошибка", "Некорректное значение количества.")
-            return False
-
-        return True
-
     def addProduct(self):
-        if not self.validateInput():  # Проверка правильности введённых данных
+        # Поля проверяются при сохранении (catalog.parse_product), категория создаётся, если её ещё нет
+        try:
+            add_product(self.seller_id, self.title_input.text(), self.category_input.text(), self.description_input.text(),
+                        self.price_input.text(), self.quantity_input.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
             return
-        title = self.title_input.text().strip()
-        category_name = self.category_input.text().strip()
-        description = self.description_input.text()
-        price = float(self.price_input.text())
-        quantity = int(self.quantity_input.text())
-
-        # Проверяем категорию и получаем её ID
-        category_id = self.get_or_create_category(category_name)
-
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-        cursor.execute("""INSERT INTO products(category_id, title, description, price, quantity, seller_id) VALUES (?, ?, ?, ?, ?, ?)""",
-                      (category_id, title, description, price, quantity, self.seller_id))
-        conn.commit()
-        conn.close()
         self.accept()
-
-    def get_or_create_category(self, category_name):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        # Сначала ищем категорию по имени
-        cursor.execute("SELECT id FROM categories WHERE name=?", (category_name,))
-        result = cursor.fetchone()
-
-        if result:
-            category_id = result[0]
-        else:
-            # Если категории нет, создаём новую
-            cursor.execute("INSERT INTO categories(name) VALUES (?)", (category_name,))
-            category_id = cursor.lastrowid
-            conn.commit()
-
-        conn.close()
-        return category_id
     
 
 # Основной класс регистрации
@@ -2261,83 +1979,20 @@ class RegistrationWindow(QWidget):
         phone = self.txt_phone.text().strip()
         password = self.txt_password.text().strip()
 
-        # Базовая проверка заполненности
-        if not all([first_value, second_value, email, phone, password]):
-            QMessageBox.warning(self, "Ошибка", "Все поля должны быть заполнены.")
-            return
-
-        # Проверка телефона на допустимый формат (например, числовой)
-        if not phone.isdigit():
-            QMessageBox.warning(self, "Ошибка", "Номер телефона должен содержать только цифры.")
-            return
-
-        # Проверка уникальности email и телефона в базе данных
+        # Проверка полей и уникальности email и телефона среди покупателей и продавцов (ошибки ввода — ValueError)
         try:
-            conn = sqlite3.connect('marketplace.db')
-            cursor = conn.cursor()
-            
-            # Проверяем email на уникальность в обеих таблицах
-            cursor.execute("SELECT COUNT(*) FROM users WHERE email=?", (email,))
-            count_users_email = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM sellers WHERE business_email=?", (email,))
-            count_sellers_email = cursor.fetchone()[0]
-
-            # Проверяем телефон на уникальность в обеих таблицах
-            cursor.execute("SELECT COUNT(*) FROM users WHERE phone_number=?", (phone,))
-            count_users_phone = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM sellers WHERE business_phone=?", (phone,))
-            count_sellers_phone = cursor.fetchone()[0]
-
-            # Если email или телефон уже используются
-            if count_users_email > 0 or count_sellers_email > 0:
-                QMessageBox.warning(self, "Ошибка", "Электронная почта уже используется другим пользователем.")
-                conn.close()
-                return
-
-            if count_users_phone > 0 or count_sellers_phone > 0:
-                QMessageBox.warning(self, "Ошибка", "Номер телефона уже используется другим пользователем.")
-                conn.close()
-                return
-
-            # Продолжаем регистрацию
             self.register(first_value, second_value, email, phone, password)
-            conn.close()
-
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", str(e))
 
     def register(self, first_value, second_value, email, phone, password):
-        conn = sqlite3.connect('marketplace.db')
-        cursor = conn.cursor()
-
-        # Выбор таблицы для вставки данных
-        table_name = 'sellers' if self.is_seller_mode else 'users'
-
-        # Проверка уникальности email
-        unique_column = 'business_email' if self.is_seller_mode else 'email'
-        cursor.execute(f"SELECT * FROM {table_name} WHERE {unique_column}=?", (email,))
-        existing_user = cursor.fetchone()
-
-        if existing_user:
-            QMessageBox.warning(self, "Ошибка", "Пользователь с таким Email уже существует.")
-            return
-
-        # Хэширование пароля
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-
-        # Добавляем нового пользователя или продавца
+        # Добавляем нового продавца (название организации и юридический адрес) или покупателя (имя и фамилия)
         if self.is_seller_mode:
-            cursor.execute("INSERT INTO sellers (organization_name, business_email, business_phone, legal_address, password_hash) VALUES (?,?,?,?,?)",
-                            (first_value, email, phone, second_value, hashed_password ))
+            register_seller(first_value, second_value, email, phone, password)
         else:
-            cursor.execute("INSERT INTO users (first_name, last_name, email, phone_number, password_hash) VALUES (?,?,?,?,?)",
-                            (first_value, second_value, email, phone, hashed_password))
-
-        conn.commit()
-        conn.close()
+            register_buyer(first_value, second_value, email, phone, password)
 
         QMessageBox.information(self, "Успешно", "Вы успешно зарегистрированы.")
 
@@ -2352,6 +2007,39 @@ class RegistrationWindow(QWidget):
         self.parent.showAgain()
         self.hide()
 
+
+class DebugMenu(QObject):
+    # Скрытое меню отладки: открывается по Ctrl+Shift+D в любом окне приложения
+    def __init__(self, app):
+        super().__init__()
+        app.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if (event.type() == QEvent.Type.KeyPress and not event.isAutoRepeat() and event.key() == Qt.Key.Key_D
+                and event.modifiers() == Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.ShiftModifier):
+            self.showMenu(QApplication.activeWindow())
+            return True
+        return False
+
+    def showMenu(self, window):
+        menu = QMenu(window)
+        trace_action = menu.addAction("Трассировка SQL")
+        trace_action.setCheckable(True)
+        trace_action.setChecked(database.TRACE_SQL)
+        # Новый класс получат соединения, которые потоки откроют после переключения; открытые не закрываются
+        trace_action.toggled.connect(lambda checked: database.configure(trace=checked))
+        menu.addAction("Сохранить отчёт SQL", lambda: self.dumpTrace(window))
+        menu.addAction("Сбросить статистику SQL", sql_trace.reset)
+        menu.exec(QCursor.pos())
+
+    def dumpTrace(self, window):
+        try:
+            paths = sql_trace.dump()
+        except OSError as e:
+            QMessageBox.warning(window, "Ошибка", f"Не удалось сохранить отчёт: {e}")
+            return
+        QMessageBox.information(window, "Трассировка SQL", "Отчёт сохранён:\n" + "\n".join(paths))
+
         
 # Главная функция для запуска приложения
 if __name__ == "__main__":
@@ -2360,6 +2048,14 @@ if __name__ == "__main__":
     # Создаем базу данных (если она ещё не была создана ранее)
     create_db()
 
+    # Истёкшие резервы товара периодически удаляются в фоне
+    holds_sweeper = QTimer()
+    holds_sweeper.timeout.connect(lambda: db_executor.submit(sweep_expired))
+    holds_sweeper.start(SWEEP_INTERVAL_MS)
+
+    # Трассировка запросов: MARKETPLACE_SQL_TRACE=1 или меню отладки
+    debug_menu = DebugMenu(app)
+
     main_menu = MainMenu()
     main_menu.show()
 
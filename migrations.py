@@ -0,0 +1,424 @@
+import re
+import sys
+
+import queries
+from analytics import REBUILD_PRODUCT_DAYS, REBUILD_SELLER_DAYS, SELLER_TOTALS, TOP_PRODUCTS
+from auth import ACCOUNTS_BY_EMAIL, IDENTITY_CONFLICTS, NORMALIZED_EMAIL, NORMALIZED_PHONE, RECORDED_CONFLICTS, backfill_identities
+from catalog import EDITABLE_PRODUCT
+from categories import CATEGORIES_VERSION, CATEGORY_ID
+from database import get_connection
+from export import PURCHASE_EXPORT, PURCHASE_EXPORT_COUNT, SALE_EXPORT
+from paging import catalog_query, order_query, sale_query
+from reservations import AVAILABLE_QUANTITY
+from reviews import PURCHASED_PRODUCT
+from revenue import COMMISSION_RATE
+
+# Нумерованные миграции схемы. Номер последней применённой хранится в PRAGMA user_version,
+# поэтому каждая миграция выполняется ровно один раз. Шаг миграции — SQL-строка или функция(conn).
+
+
+def _identity_update_trigger(table, account_type, email_column, phone_column):
+    # Изменение контактов учётной записи переносится в identities. Совпавший при переносе контакт
+    # (identity_conflicts), который запись оставила прежним, в identities остаётся пустым;
+    # изменённый контакт из identity_conflicts убирается, а вместе с последним — и строка записи.
+    email = NORMALIZED_EMAIL.format("NEW." + email_column)
+    phone = NORMALIZED_PHONE.format("NEW." + phone_column)
+    account = f"account_type = '{account_type}' AND account_id = NEW.id"
+    return f""" CREATE TRIGGER IF NOT EXISTS trg_{table}_identity_update AFTER UPDATE OF {email_column}, {phone_column} ON {table} BEGIN
+    UPDATE identity_conflicts SET email = CASE WHEN email = {email} THEN email END, phone = CASE WHEN phone = {phone} THEN phone END
+        WHERE {account};
+    DELETE FROM identity_conflicts WHERE {account} AND email IS NULL AND phone IS NULL;
+    UPDATE identities SET
+        email = CASE WHEN EXISTS (SELECT 1 FROM identity_conflicts WHERE {account} AND email IS NOT NULL) THEN NULL ELSE {email} END,
+        phone = CASE WHEN EXISTS (SELECT 1 FROM identity_conflicts WHERE {account} AND phone IS NOT NULL) THEN NULL ELSE {phone} END
+        WHERE {account};
+END """
+
+
+MIGRATIONS = [
+    (1, "Базовые таблицы", [
+        # Таблица Пользователей
+        """ CREATE TABLE IF NOT EXISTS users ( id INTEGER PRIMARY KEY AUTOINCREMENT, first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL, email TEXT NOT NULL UNIQUE, phone_number TEXT NOT NULL UNIQUE, password_hash BLOB NOT NULL ) """,
+
+        # Таблица Продавцов
+        """ CREATE TABLE IF NOT EXISTS sellers ( id INTEGER PRIMARY KEY AUTOINCREMENT,
+            organization_name TEXT NOT NULL, business_email TEXT NOT NULL UNIQUE, business_phone TEXT NOT NULL UNIQUE,
+            legal_address TEXT, password_hash BLOB NOT NULL) """,
+
+        # Таблица Категорий товаров
+        """ CREATE TABLE IF NOT EXISTS categories ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE ) """,
+
+        # Таблица Товаров
+        """ CREATE TABLE IF NOT EXISTS products ( id INTEGER PRIMARY KEY AUTOINCREMENT, category_id INTEGER NOT NULL,
+            title TEXT NOT NULL, description TEXT NOT NULL, price DECIMAL(10, 2) NOT NULL, quantity INTEGER NOT NULL,
+            seller_id INTEGER NOT NULL, FOREIGN KEY (category_id) REFERENCES categories(id),
+            FOREIGN KEY (seller_id) REFERENCES sellers(id) ) """,
+
+        # Таблица Отзывов
+        """ CREATE TABLE IF NOT EXISTS reviews ( id INTEGER PRIMARY KEY AUTOINCREMENT, buyer_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL, rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5), comment TEXT,
+            FOREIGN KEY (buyer_id) REFERENCES users(id), FOREIGN KEY (product_id) REFERENCES products(id) ) """,
+
+        # Таблица Продаж
+        """CREATE TABLE IF NOT EXISTS sales ( id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL,
+            buyer_id INTEGER NOT NULL, sale_price DECIMAL(10, 2) NOT NULL, sold_quantity INTEGER NOT NULL, applied_promotion_id INTEGER,
+            sale_date DATETIME DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (buyer_id) REFERENCES users(id), FOREIGN KEY (applied_promotion_id) REFERENCES promotions(id) )""",
+
+        # Таблица Акций
+        """ CREATE TABLE IF NOT EXISTS promotions ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+            discount_percent INTEGER NOT NULL CHECK(discount_percent >= 0 AND discount_percent < 100),
+            valid_from DATETIME NOT NULL, valid_to DATETIME NOT NULL ) """,
+
+        # Промежуточная таблица товаров-участников акции
+        """ CREATE TABLE IF NOT EXISTS promotion_items ( promotion_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+            FOREIGN KEY (promotion_id) REFERENCES promotions(id), FOREIGN KEY (product_id) REFERENCES products(id), PRIMARY KEY(promotion_id, product_id) ) """,
+    ]),
+
+    (2, "Индексы для загрузчиков таблиц", [
+        # Товары продавца и товары категории (SellerDashboard.loadProducts, BuyerDashboard.filterByCategory)
+        "CREATE INDEX IF NOT EXISTS idx_products_seller ON products (seller_id, title)",
+        "CREATE INDEX IF NOT EXISTS idx_products_category ON products (category_id, title)",
+        # Средняя оценка товара считается по покрывающему индексу
+        "CREATE INDEX IF NOT EXISTS idx_reviews_product ON reviews (product_id, rating)",
+        # Отзывы покупателя и проверка повторного отзыва
+        "CREATE INDEX IF NOT EXISTS idx_reviews_buyer ON reviews (buyer_id, product_id)",
+        # История покупок: WHERE buyer_id = ? ORDER BY sale_date DESC
+        "CREATE INDEX IF NOT EXISTS idx_sales_buyer_date ON sales (buyer_id, sale_date)",
+        # История продаж продавца: соединение по product_id и сортировка по дате
+        "CREATE INDEX IF NOT EXISTS idx_sales_product_date ON sales (product_id, sale_date)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (sale_date)",
+        # Акции товара (расчёт цены со скидкой)
+        "CREATE INDEX IF NOT EXISTS idx_promotion_items_product ON promotion_items (product_id, promotion_id)",
+        "CREATE INDEX IF NOT EXISTS idx_promotions_valid_from ON promotions (valid_from)",
+    ]),
+
+    (3, "Агрегаты оценок товаров", [
+        # Количество, сумма и распределение оценок по звёздам для каждого товара
+        """ CREATE TABLE IF NOT EXISTS product_rating_stats ( product_id INTEGER PRIMARY KEY, ratings_count INTEGER NOT NULL DEFAULT 0,
+            ratings_sum INTEGER NOT NULL DEFAULT 0, stars_1 INTEGER NOT NULL DEFAULT 0, stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0, stars_4 INTEGER NOT NULL DEFAULT 0, stars_5 INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (product_id) REFERENCES products(id) ) """,
+
+        # Заполняем агрегаты по уже существующим отзывам
+        """ INSERT OR REPLACE INTO product_rating_stats (product_id, ratings_count, ratings_sum, stars_1, stars_2, stars_3, stars_4, stars_5)
+            SELECT product_id, COUNT(*), SUM(rating), SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+            FROM reviews GROUP BY product_id """,
+
+        # Триггеры поддерживают агрегаты точными при любом изменении отзывов
+        """ CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_insert AFTER INSERT ON reviews BEGIN
+            INSERT OR IGNORE INTO product_rating_stats (product_id) VALUES (NEW.product_id);
+            UPDATE product_rating_stats SET ratings_count = ratings_count + 1, ratings_sum = ratings_sum + NEW.rating,
+                stars_1 = stars_1 + (NEW.rating = 1), stars_2 = stars_2 + (NEW.rating = 2), stars_3 = stars_3 + (NEW.rating = 3),
+                stars_4 = stars_4 + (NEW.rating = 4), stars_5 = stars_5 + (NEW.rating = 5)
+            WHERE product_id = NEW.product_id;
+        END """,
+
+        """ CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_delete AFTER DELETE ON reviews BEGIN
+            UPDATE product_rating_stats SET ratings_count = ratings_count - 1, ratings_sum = ratings_sum - OLD.rating,
+                stars_1 = stars_1 - (OLD.rating = 1), stars_2 = stars_2 - (OLD.rating = 2), stars_3 = stars_3 - (OLD.rating = 3),
+                stars_4 = stars_4 - (OLD.rating = 4), stars_5 = stars_5 - (OLD.rating = 5)
+            WHERE product_id = OLD.product_id;
+        END """,
+
+        """ CREATE TRIGGER IF NOT EXISTS trg_reviews_stats_update AFTER UPDATE OF rating, product_id ON reviews BEGIN
+            UPDATE product_rating_stats SET ratings_count = ratings_count - 1, ratings_sum = ratings_sum - OLD.rating,
+                stars_1 = stars_1 - (OLD.rating = 1), stars_2 = stars_2 - (OLD.rating = 2), stars_3 = stars_3 - (OLD.rating = 3),
+                stars_4 = stars_4 - (OLD.rating = 4), stars_5 = stars_5 - (OLD.rating = 5)
+            WHERE product_id = OLD.product_id;
+            INSERT OR IGNORE INTO product_rating_stats (product_id) VALUES (NEW.product_id);
+            UPDATE product_rating_stats SET ratings_count = ratings_count + 1, ratings_sum = ratings_sum + NEW.rating,
+                stars_1 = stars_1 + (NEW.rating = 1), stars_2 = stars_2 + (NEW.rating = 2), stars_3 = stars_3 + (NEW.rating = 3),
+                stars_4 = stars_4 + (NEW.rating = 4), stars_5 = stars_5 + (NEW.rating = 5)
+            WHERE product_id = NEW.product_id;
+        END """,
+    ]),
+
+    (4, "Полнотекстовый поиск товаров", [
+        # FTS5-индекс по названию и описанию. unicode61 приводит к нижнему регистру любые буквы,
+        # в том числе кириллицу, prefix ускоряет запросы вида "сло"*
+        """ CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5( title, description, content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3' ) """,
+
+        # Индексируем уже существующие товары
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+
+        # Триггеры синхронизируют индекс с таблицей товаров
+        """ CREATE TRIGGER IF NOT EXISTS trg_products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END """,
+
+        """ CREATE TRIGGER IF NOT EXISTS trg_products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, title, description) VALUES ('delete', OLD.id, OLD.title, OLD.description);
+        END """,
+
+        """ CREATE TRIGGER IF NOT EXISTS trg_products_fts_update AFTER UPDATE OF title, description ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, title, description) VALUES ('delete', OLD.id, OLD.title, OLD.description);
+            INSERT INTO products_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END """,
+    ]),
+
+    (5, "Постраничная выборка по ключу сортировки", [
+        # Каталог по названию без фильтров: (title, id)
+        "CREATE INDEX IF NOT EXISTS idx_products_title ON products (title)",
+
+        # Продавец продажи хранится в самой продаже, чтобы его история листалась по индексу (seller_id, sale_date)
+        # без соединения со всеми его товарами
+        "ALTER TABLE sales ADD COLUMN seller_id INTEGER REFERENCES sellers(id)",
+        "UPDATE sales SET seller_id = (SELECT seller_id FROM products WHERE products.id = sales.product_id)",
+        """ CREATE TRIGGER IF NOT EXISTS trg_sales_seller AFTER INSERT ON sales WHEN NEW.seller_id IS NULL BEGIN
+            UPDATE sales SET seller_id = (SELECT seller_id FROM products WHERE products.id = NEW.product_id) WHERE id = NEW.id;
+        END """,
+        "CREATE INDEX IF NOT EXISTS idx_sales_seller_date ON sales (seller_id, sale_date)",
+    ]),
+
+    (6, "Комиссия продаж и накопленные итоги", [
+        # Комиссия маркетплейса записывается в продажу при оформлении (revenue.sale_commission)
+        "ALTER TABLE sales ADD COLUMN commission DECIMAL(10, 2)",
+        lambda conn: conn.execute("UPDATE sales SET commission = sale_price * sold_quantity * ?", (COMMISSION_RATE,)),
+
+        # Итоги по маркетплейсу (ровно одна строка) и по каждому продавцу
+        """ CREATE TABLE IF NOT EXISTS revenue_totals ( id INTEGER PRIMARY KEY CHECK (id = 1), sales_count INTEGER NOT NULL DEFAULT 0,
+            gross DECIMAL(12, 2) NOT NULL DEFAULT 0, commission DECIMAL(12, 2) NOT NULL DEFAULT 0 ) """,
+        """ CREATE TABLE IF NOT EXISTS seller_revenue_totals ( seller_id INTEGER PRIMARY KEY, sales_count INTEGER NOT NULL DEFAULT 0,
+            gross DECIMAL(12, 2) NOT NULL DEFAULT 0, commission DECIMAL(12, 2) NOT NULL DEFAULT 0,
+            FOREIGN KEY (seller_id) REFERENCES sellers(id) ) """,
+
+        # Заполняем итоги по уже существующим продажам
+        """ INSERT OR REPLACE INTO revenue_totals (id, sales_count, gross, commission)
+            SELECT 1, COUNT(*), COALESCE(SUM(sale_price * sold_quantity), 0), COALESCE(SUM(commission), 0) FROM sales """,
+        """ INSERT OR REPLACE INTO seller_revenue_totals (seller_id, sales_count, gross, commission)
+            SELECT seller_id, COUNT(*), SUM(sale_price * sold_quantity), SUM(COALESCE(commission, 0))
+            FROM sales WHERE seller_id IS NOT NULL GROUP BY seller_id """,
+
+        # Триггеры обновляют итоги в той же транзакции, что и вставка продажи (ShoppingCart.checkout).
+        # seller_id новой продажи мог ещё не быть заполнен триггером trg_sales_seller, поэтому берём его из товара.
+        """ CREATE TRIGGER IF NOT EXISTS trg_sales_totals_insert AFTER INSERT ON sales BEGIN
+            UPDATE revenue_totals SET sales_count = sales_count + 1, gross = gross + NEW.sale_price * NEW.sold_quantity,
+                commission = commission + COALESCE(NEW.commission, 0)
+            WHERE id = 1;
+            INSERT OR IGNORE INTO seller_revenue_totals (seller_id)
+                VALUES (COALESCE(NEW.seller_id, (SELECT seller_id FROM products WHERE id = NEW.product_id)));
+            UPDATE seller_revenue_totals SET sales_count = sales_count + 1, gross = gross + NEW.sale_price * NEW.sold_quantity,
+                commission = commission + COALESCE(NEW.commission, 0)
+            WHERE seller_id = COALESCE(NEW.seller_id, (SELECT seller_id FROM products WHERE id = NEW.product_id));
+        END """,
+
+        """ CREATE TRIGGER IF NOT EXISTS trg_sales_totals_delete AFTER DELETE ON sales BEGIN
+            UPDATE revenue_totals SET sales_count = sales_count - 1, gross = gross - OLD.sale_price * OLD.sold_quantity,
+                commission = commission - COALESCE(OLD.commission, 0)
+            WHERE id = 1;
+            UPDATE seller_revenue_totals SET sales_count = sales_count - 1, gross = gross - OLD.sale_price * OLD.sold_quantity,
+                commission = commission - COALESCE(OLD.commission, 0)
+            WHERE seller_id = OLD.seller_id;
+        END """,
+    ]),
+
+    (7, "Сохранённые корзины покупателей", [
+        # Корзина покупателя и её строки; количество строки перезаписывается целиком (upsert)
+        """ CREATE TABLE IF NOT EXISTS carts ( buyer_id INTEGER PRIMARY KEY, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (buyer_id) REFERENCES users(id) ) """,
+        """ CREATE TABLE IF NOT EXISTS cart_items ( buyer_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0), PRIMARY KEY (buyer_id, product_id),
+            FOREIGN KEY (buyer_id) REFERENCES carts(buyer_id), FOREIGN KEY (product_id) REFERENCES products(id) ) WITHOUT ROWID """,
+    ]),
+
+    (8, "Резервы товара", [
+        # Резерв покупателя на товар в корзине действует до expires_at (см. reservations.py)
+        """ CREATE TABLE IF NOT EXISTS stock_holds ( buyer_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0), expires_at DATETIME NOT NULL, PRIMARY KEY (buyer_id, product_id),
+            FOREIGN KEY (buyer_id) REFERENCES users(id), FOREIGN KEY (product_id) REFERENCES products(id) ) WITHOUT ROWID """,
+        # Сумма действующих резервов товара читается только из индекса (buyer_id входит в него как часть ключа)
+        "CREATE INDEX IF NOT EXISTS idx_stock_holds_product ON stock_holds (product_id, expires_at, quantity)",
+        # Удаление истёкших резервов
+        "CREATE INDEX IF NOT EXISTS idx_stock_holds_expires ON stock_holds (expires_at)",
+    ]),
+
+    (9, "Заказы", [
+        # Заголовок заказа: одна строка на оформление корзины с итогами по всем её строкам.
+        # Строки заказа — продажи с этим order_id.
+        """ CREATE TABLE IF NOT EXISTS orders ( id INTEGER PRIMARY KEY AUTOINCREMENT, buyer_id INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP, items_count INTEGER NOT NULL, total_quantity INTEGER NOT NULL,
+            total_amount DECIMAL(12, 2) NOT NULL, FOREIGN KEY (buyer_id) REFERENCES users(id) ) """,
+        "ALTER TABLE sales ADD COLUMN order_id INTEGER REFERENCES orders(id)",
+        # История заказов покупателя и число заказов по дням
+        "CREATE INDEX IF NOT EXISTS idx_orders_buyer_date ON orders (buyer_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_order ON sales (order_id)",
+
+        # Старые продажи одной корзины вставлялись подряд с одинаковым sale_date — собираем из них заказы
+        """ INSERT INTO orders (buyer_id, created_at, items_count, total_quantity, total_amount)
+            SELECT buyer_id, sale_date, COUNT(*), SUM(sold_quantity), SUM(sale_price * sold_quantity)
+            FROM sales GROUP BY buyer_id, sale_date ORDER BY MIN(id) """,
+        """ UPDATE sales SET order_id = (SELECT o.id FROM orders o WHERE o.buyer_id = sales.buyer_id AND o.created_at = sales.sale_date) """,
+    ]),
+
+    (10, "Единые email и телефоны учётных записей", [
+        # Нормализованные email и телефон каждого покупателя и продавца. UNIQUE не даёт двум учётным записям
+        # любого типа получить одинаковые контакты даже при одновременной регистрации.
+        # Пустой контакт — совпавший с другой записью при переносе (см. identity_conflicts).
+        """ CREATE TABLE IF NOT EXISTS identities ( account_type TEXT NOT NULL CHECK (account_type IN ('buyer', 'seller')),
+            account_id INTEGER NOT NULL, email TEXT UNIQUE, phone TEXT UNIQUE,
+            PRIMARY KEY (account_type, account_id) ) WITHOUT ROWID """,
+        # Учётные записи, чьи контакты при переносе уже были заняты другими, и эти совпавшие контакты
+        """ CREATE TABLE IF NOT EXISTS identity_conflicts ( account_type TEXT NOT NULL, account_id INTEGER NOT NULL,
+            email TEXT, phone TEXT, PRIMARY KEY (account_type, account_id) ) WITHOUT ROWID """,
+
+        # Существующие записи; если контакты уже совпадали, их сохраняет та, что заведена первой (покупатели раньше продавцов),
+        # а остальные попадают в identity_conflicts и перечисляются в журнале
+        backfill_identities,
+
+        # Триггеры меняют identities в той же транзакции, что и саму учётную запись:
+        # занятый email или телефон отменяет вставку или изменение (sqlite3.IntegrityError)
+        """ CREATE TRIGGER IF NOT EXISTS trg_users_identity_insert AFTER INSERT ON users BEGIN
+            INSERT INTO identities (account_type, account_id, email, phone)
+                VALUES ('buyer', NEW.id, """ + NORMALIZED_EMAIL.format("NEW.email") + ", " + NORMALIZED_PHONE.format("NEW.phone_number") + """);
+        END """,
+        _identity_update_trigger("users", "buyer", "email", "phone_number"),
+        """ CREATE TRIGGER IF NOT EXISTS trg_users_identity_delete AFTER DELETE ON users BEGIN
+            DELETE FROM identities WHERE account_type = 'buyer' AND account_id = OLD.id;
+            DELETE FROM identity_conflicts WHERE account_type = 'buyer' AND account_id = OLD.id;
+        END """,
+
+        """ CREATE TRIGGER IF NOT EXISTS trg_sellers_identity_insert AFTER INSERT ON sellers BEGIN
+            INSERT INTO identities (account_type, account_id, email, phone)
+                VALUES ('seller', NEW.id, """ + NORMALIZED_EMAIL.format("NEW.business_email") + ", " + NORMALIZED_PHONE.format("NEW.business_phone") + """);
+        END """,
+        _identity_update_trigger("sellers", "seller", "business_email", "business_phone"),
+        """ CREATE TRIGGER IF NOT EXISTS trg_sellers_identity_delete AFTER DELETE ON sellers BEGIN
+            DELETE FROM identities WHERE account_type = 'seller' AND account_id = OLD.id;
+            DELETE FROM identity_conflicts WHERE account_type = 'seller' AND account_id = OLD.id;
+        END """,
+    ]),
+
+    (11, "Дневные итоги продаж", [
+        # Выручка, комиссия, продано штук и число заказов по продавцу и дню и по товару продавца и дню.
+        # Дополняются при оформлении заказа (analytics.update_rollups), аналитика продавца читает только их.
+        """ CREATE TABLE IF NOT EXISTS seller_daily_sales ( seller_id INTEGER NOT NULL, day TEXT NOT NULL,
+            revenue DECIMAL(12, 2) NOT NULL, commission DECIMAL(12, 2) NOT NULL, units INTEGER NOT NULL, orders_count INTEGER NOT NULL,
+            PRIMARY KEY (seller_id, day), FOREIGN KEY (seller_id) REFERENCES sellers(id) ) WITHOUT ROWID """,
+        """ CREATE TABLE IF NOT EXISTS product_daily_sales ( seller_id INTEGER NOT NULL, day TEXT NOT NULL, product_id INTEGER NOT NULL,
+            revenue DECIMAL(12, 2) NOT NULL, commission DECIMAL(12, 2) NOT NULL, units INTEGER NOT NULL, orders_count INTEGER NOT NULL,
+            PRIMARY KEY (seller_id, day, product_id), FOREIGN KEY (seller_id) REFERENCES sellers(id),
+            FOREIGN KEY (product_id) REFERENCES products(id) ) WITHOUT ROWID """,
+
+        # Итоги по уже оформленным продажам
+        REBUILD_SELLER_DAYS,
+        REBUILD_PRODUCT_DAYS,
+    ]),
+
+    (12, "Номер изменения категорий", [
+        # Счётчики изменений справочников. Список категорий держится в памяти (categories.CategoryRegistry)
+        # и перечитывается, только если счётчик сменился: так видны и изменения из других процессов.
+        """ CREATE TABLE IF NOT EXISTS change_counters ( name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0 ) WITHOUT ROWID """,
+        "INSERT OR IGNORE INTO change_counters (name) VALUES ('categories')",
+        """ CREATE TRIGGER IF NOT EXISTS trg_categories_changed_insert AFTER INSERT ON categories BEGIN
+            UPDATE change_counters SET value = value + 1 WHERE name = 'categories';
+        END """,
+        """ CREATE TRIGGER IF NOT EXISTS trg_categories_changed_update AFTER UPDATE ON categories BEGIN
+            UPDATE change_counters SET value = value + 1 WHERE name = 'categories';
+        END """,
+        """ CREATE TRIGGER IF NOT EXISTS trg_categories_changed_delete AFTER DELETE ON categories BEGIN
+            UPDATE change_counters SET value = value + 1 WHERE name = 'categories';
+        END """,
+    ]),
+]
+
+# Запросы, которые не должны сканировать таблицы целиком: (вызывающий код, запрос, пример параметров)
+HOT_PATH_QUERIES = [
+    ("LoginWindow.login", ACCOUNTS_BY_EMAIL, ("a@b",)),
+    ("RegistrationWindow.onRegisterClick", IDENTITY_CONFLICTS, ("a@b", "1")),
+    ("UserProfileSettingsDialog (совпавшие при переносе контакты)", RECORDED_CONFLICTS, ("a@b", "1", "buyer", 1)),
+    ("CategoryRegistry.refresh", CATEGORIES_VERSION, ()),
+    ("CategoryRegistry.get_or_create", CATEGORY_ID, ("a",)),
+    ("BuyerDashboard.filterByCategory", catalog_query(category_id=1).page_sql(after=True), (1, "a", 1, 200)),
+    ("SellerDashboard.loadProducts", catalog_query(seller_id=1).page_sql(after=True), (1, "a", 1, 200)),
+    ("ProductDetailDialog", queries.PRODUCT_DETAILS, (1,)),
+    ("EditProductDialog", EDITABLE_PRODUCT, (1, 1)),
+    ("BuyerDashboard.searchProducts", queries.PRODUCT_SEARCH + " AND p.category_id = ? " + queries.SEARCH_ORDER, ('"a"*', 1)),
+    ("SellerDashboard.filterProductsByName", queries.PRODUCT_SEARCH + " AND p.seller_id = ? " + queries.SEARCH_ORDER, ('"a"*', 1)),
+    ("BuyerDashboard.loadAllProducts", catalog_query().page_sql(after=True), ("a", 1, 200)),
+    ("PurchaseHistoryWindow.load_orders", order_query(1).page_sql(after=True), (1, "2024-01-01 00:00:00", 1, 200)),
+    ("PurchaseHistoryWindow.load_order_items", queries.ORDER_ITEMS, (1,)),
+    ("revenue.orders_per_day", queries.ORDERS_PER_DAY, ("2024-01-01", "2024-02-01")),
+    ("SalesHistoryWindow.load_sales", sale_query(1).page_sql(after=True), (1, "2024-01-01 00:00:00", 1, 200)),
+    ("SellerAnalyticsWindow.load_totals", SELLER_TOTALS, (1, "2024-01-01")),
+    ("SellerAnalyticsWindow.load_top_products", TOP_PRODUCTS, (1, "2024-01-01", 10)),
+    ("export.export_sales", SALE_EXPORT, (1,)),
+    ("export.export_purchases", PURCHASE_EXPORT, (1,)),
+    ("export.export_purchases (прогресс)", PURCHASE_EXPORT_COUNT, (1,)),
+    ("ReviewManagementWindow.load_reviews", queries.REVIEWS_BY_BUYER, (1,)),
+    ("AddReviewForm.load_purchased_products", queries.PURCHASED_PRODUCTS, (1,)),
+    ("ShoppingCart.items", queries.CART_ITEMS, (1,)),
+    ("ProductDetailDialog.available_quantity", AVAILABLE_QUANTITY, ("2024-01-01 00:00:00", 1, 1)),
+    ("reservations.sweep_expired", "DELETE FROM stock_holds WHERE expires_at <= ?", ("2024-01-01 00:00:00",)),
+    ("AddReviewForm.submit_review", queries.BUYER_PRODUCT_REVIEW, (1, 1)),
+    ("AddReviewForm.submit_review (покупка)", PURCHASED_PRODUCT, (1, 1)),
+    ("ReviewsPanel.loadReviews", queries.REVIEWS_BY_SELLER, (1,)),
+    ("PromotionsDialog.loadPromotions", queries.PROMOTIONS, ()),
+]
+
+# Полный просмотр таблицы: "SCAN products" или "SCAN p" без использования индекса
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn=None):
+    # Применяем по порядку все миграции новее текущей версии схемы
+    conn = conn or get_connection()
+    version = get_schema_version(conn)
+
+    for number, _, steps in MIGRATIONS:
+        if number <= version:
+            continue
+
+        # Каждая миграция выполняется в своей транзакции вместе с обновлением user_version
+        conn.execute("BEGIN")
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return get_schema_version(conn)
+
+
+def find_full_scans(conn=None):
+    # Возвращает список (вызывающий код, строка плана) для запросов, которые сканируют таблицу целиком
+    conn = conn or get_connection()
+    problems = []
+    for caller, sql, params in HOT_PATH_QUERIES:
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[-1]
+            if _FULL_SCAN.match(detail):
+                problems.append((caller, detail))
+    return problems
+
+
+def check_query_plans(conn=None):
+    problems = find_full_scans(conn)
+    if problems:
+        details = "\n".join(f"{caller}: {detail}" for caller, detail in problems)
+        raise AssertionError(f"Запросы выполняются полным просмотром таблицы:\n{details}")
+
+
+if __name__ == "__main__":
+    # python migrations.py [--check] — применить миграции и при необходимости проверить планы запросов
+    migrate()
+    if "--check" in sys.argv[1:]:
+        try:
+            check_query_plans()
+        except AssertionError as e:
+            print(e)
+            sys.exit(1)
+        print("Все запросы используют индексы.")
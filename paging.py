@@ -0,0 +1,93 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+import queries
+from database import get_connection
+
+# Сколько строк загружается за один раз
+PAGE_SIZE = 200
+
+# Страница результата: строки и курсор следующей страницы (None, если строк больше нет)
+Page = namedtuple("Page", ["rows", "cursor"])
+
+
+def encode_cursor(values):
+    # Курсор — значения ключа сортировки последней строки страницы. Для вызывающего кода это непрозрачная строка.
+    return base64.urlsafe_b64encode(json.dumps(list(values), ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise ValueError("Некорректный курсор страницы")
+    if not isinstance(values, list):
+        raise ValueError("Некорректный курсор страницы")
+    return values
+
+
+class KeysetQuery:
+    # Постраничная выборка по ключу сортировки (keyset/seek). Следующая страница начинается условием
+    # (k1, k2) > (?, ?), а не OFFSET, поэтому при индексе по ключу любая страница стоит одинаково,
+    # сколько бы строк ни было до неё. Последний столбец ключа должен быть уникальным (обычно id).
+    # keys — список пар (выражение SQL, номер столбца в строке результата).
+    def __init__(self, select_sql, keys, conditions=(), params=(), descending=False):
+        self.select_sql = select_sql
+        self.keys = list(keys)
+        self.conditions = list(conditions)
+        self.params = list(params)
+        self.descending = descending
+
+    def page_sql(self, after=False):
+        conditions = list(self.conditions)
+        expressions = [expression for expression, _ in self.keys]
+        if after:
+            placeholders = ", ".join("?" for _ in expressions)
+            conditions.append(f"({', '.join(expressions)}) {'<' if self.descending else '>'} ({placeholders})")
+
+        sql = self.select_sql
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        direction = " DESC" if self.descending else ""
+        sql += " ORDER BY " + ", ".join(expression + direction for expression in expressions) + " LIMIT ? "
+        return sql
+
+    def page(self, cursor=None, limit=PAGE_SIZE):
+        params = list(self.params)
+        if cursor is not None:
+            values = decode_cursor(cursor)
+            if len(values) != len(self.keys):
+                raise ValueError("Некорректный курсор страницы")
+            params += values
+
+        # Лишняя строка показывает, есть ли следующая страница, без отдельного COUNT
+        rows = get_connection().execute(self.page_sql(cursor is not None), params + [limit + 1]).fetchall()
+        if len(rows) <= limit:
+            return Page(rows, None)
+        rows = rows[:limit]
+        return Page(rows, encode_cursor(rows[-1][position] for _, position in self.keys))
+
+
+def catalog_query(category_id=None, seller_id=None):
+    # Каталог товаров по названию; индексы (title), (category_id, title) и (seller_id, title)
+    conditions = []
+    params = []
+    if category_id is not None:
+        conditions.append("p.category_id = ?")
+        params.append(category_id)
+    if seller_id is not None:
+        conditions.append("p.seller_id = ?")
+        params.append(seller_id)
+    return KeysetQuery(queries.PRODUCT_ROWS, [("p.title", 1), ("p.id", 0)], conditions, params)
+
+
+def order_query(buyer_id):
+    # Заказы покупателя, новые сверху; индекс (buyer_id, created_at)
+    return KeysetQuery(queries.ORDER_ROWS, [("o.created_at", 1), ("o.id", 0)], ["o.buyer_id = ?"], [buyer_id], descending=True)
+
+
+def sale_query(seller_id):
+    # История продаж продавца, новые сверху; индекс (seller_id, sale_date)
+    return KeysetQuery(queries.SALE_ROWS, [("s.sale_date", 4), ("s.id", 0)], ["s.seller_id = ?"], [seller_id], descending=True)
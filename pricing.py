@@ -0,0 +1,117 @@
+import json
+import threading
+from datetime import datetime, timezone
+
+from database import get_connection
+
+# Одним запросом получаем цену товара, самую выгодную действующую акцию и момент,
+# когда цена может измениться (ближайшее начало или окончание акции этого товара).
+# Идентификаторы передаются JSON-массивом, поэтому размер набора не ограничен числом параметров SQLite.
+BULK_PRICE_QUERY = """ SELECT p.id, p.price, best.promotion_id, best.discount_percent, bounds.next_change FROM products p
+    LEFT JOIN ( SELECT pi.product_id, pi.promotion_id, pr.discount_percent, ROW_NUMBER() OVER (PARTITION BY pi.product_id
+        ORDER BY pr.discount_percent DESC, pi.promotion_id) AS rn FROM promotion_items pi INNER JOIN promotions pr
+        ON pi.promotion_id = pr.id WHERE pi.product_id IN (SELECT value FROM json_each(?1)) AND ?2 BETWEEN pr.valid_from AND pr.valid_to
+    ) best ON best.product_id = p.id AND best.rn = 1
+    LEFT JOIN ( SELECT pi.product_id, MIN(CASE WHEN pr.valid_from > ?2 THEN pr.valid_from ELSE datetime(pr.valid_to, '+1 second') END)
+        AS next_change FROM promotion_items pi INNER JOIN promotions pr ON pi.promotion_id = pr.id
+        WHERE pi.product_id IN (SELECT value FROM json_each(?1)) AND pr.valid_to >= ?2 GROUP BY pi.product_id
+    ) bounds ON bounds.product_id = p.id
+    WHERE p.id IN (SELECT value FROM json_each(?1)) """
+
+
+def current_timestamp():
+    # Та же строка, что возвращает datetime('now') в SQLite
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def fetch_price_rows(product_ids, now=None):
+    # Возвращает {product_id: (исходная цена, id акции, процент скидки, момент следующего изменения цены)}
+    ids = list({int(product_id) for product_id in product_ids})
+    if not ids:
+        return {}
+
+    cursor = get_connection().cursor()
+    cursor.execute(BULK_PRICE_QUERY, (json.dumps(ids), now or current_timestamp()))
+    return {row[0]: row[1:] for row in cursor}
+
+
+def apply_discount(price, discount_percent):
+    if discount_percent:
+        return price * (1 - discount_percent / 100)
+    return price
+
+
+class PriceCache:
+    # Кэш итоговых цен по product_id. Запись живёт до ближайшей границы valid_from/valid_to
+    # акций товара или до явной инвалидации при изменении цены или состава акции.
+    # Цены читаются из базы вне блокировки: invalidate() увеличивает поколение (весь кэш) или версии
+    # товаров, и прочитанное попадает в кэш, только если они не изменились с начала чтения.
+    def __init__(self):
+        self._entries = {}  # product_id -> (итоговая цена, id акции, истекает в)
+        self._generation = 0
+        self._versions = {}  # product_id -> номер инвалидации товара
+        self._lock = threading.Lock()
+
+    def get_many(self, product_ids):
+        now = current_timestamp()
+        result = {}
+        missing = []
+        with self._lock:
+            for product_id in product_ids:
+                entry = self._entries.get(product_id)
+                if entry is not None and (entry[2] is None or now < entry[2]):
+                    result[product_id] = entry[:2]
+                else:
+                    missing.append(product_id)
+            generation = self._generation
+            versions = {product_id: self._versions.get(product_id, 0) for product_id in missing}
+
+        if missing:
+            fresh = {}
+            for product_id, (price, promo_id, discount, next_change) in fetch_price_rows(missing, now).items():
+                fresh[product_id] = (apply_discount(price, discount), promo_id, next_change)
+                result[product_id] = fresh[product_id][:2]
+            with self._lock:
+                # Цены, сброшенные во время чтения, вызывающему возвращаются, но в кэш не попадают
+                if generation == self._generation:
+                    self._entries.update((product_id, entry) for product_id, entry in fresh.items()
+                                         if self._versions.get(product_id, 0) == versions[product_id])
+        return result
+
+    def invalidate(self, product_ids=None):
+        with self._lock:
+            if product_ids is None:
+                self._entries.clear()
+                self._versions.clear()
+                self._generation += 1
+            else:
+                for product_id in product_ids:
+                    product_id = int(product_id)
+                    self._entries.pop(product_id, None)
+                    self._versions[product_id] = self._versions.get(product_id, 0) + 1
+
+
+price_cache = PriceCache()
+
+
+def invalidate_prices(product_ids=None):
+    # Сбрасывает кэш цен для указанных товаров (или целиком, если товары не указаны)
+    price_cache.invalidate(product_ids)
+
+
+def get_discounted_prices(product_ids):
+    # Итоговые цены для набора товаров: {product_id: (итоговая цена, id применённой акции или None)}
+    return price_cache.get_many({int(product_id) for product_id in product_ids})
+
+
+def get_discounted_price(product_id):
+    product_id = int(product_id)
+    return get_discounted_prices([product_id])[product_id][0]
+
+
+def find_applicable_promotion(product_id):
+    # Самая выгодная действующая акция в виде (promotion_id, discount_percent) или None
+    row = fetch_price_rows([product_id]).get(product_id)
+    if row and row[1] is not None:
+        return row[1], row[2]
+    return None
@@ -0,0 +1,133 @@
+import csv
+import itertools
+import multiprocessing
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import INSERT_PRODUCT, parse_product
+from categories import category_registry
+from database import get_connection
+
+# Сколько строк проверяется одной задачей и записывается одной транзакцией
+IMPORT_CHUNK_ROWS = 2000
+
+# Столбцы CSV и их допустимые названия в заголовке
+IMPORT_COLUMNS = {
+    "title": ("title", "название"),
+    "category": ("category", "категория"),
+    "description": ("description", "описание"),
+    "price": ("price", "цена"),
+    "quantity": ("quantity", "количество"),
+}
+REQUIRED_COLUMNS = ("title", "category", "price", "quantity")
+
+
+# Итог загрузки: прочитано строк, добавлено товаров, ошибки [(номер строки файла, текст)], время в секундах
+ImportReport = namedtuple("ImportReport", ["rows", "imported", "errors", "seconds"])
+
+
+def validate_rows(rows):
+    # Проверяет порцию строк [(номер строки, {столбец: значение})] по тем же правилам, что и добавление товара
+    # (catalog.parse_product). Выполняется в отдельном процессе, поэтому не обращается к базе.
+    # Возвращает (товары [(номер, название, категория, описание, цена, количество)], ошибки [(номер, текст)]).
+    valid = []
+    errors = []
+    for line_number, row in rows:
+        try:
+            fields = parse_product(row.get("title"), row.get("category"), row.get("description"), row.get("price"),
+                                   row.get("quantity"))
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+            continue
+        valid.append((line_number, *fields))
+    return valid, errors
+
+
+def read_chunks(file, chunk_rows=IMPORT_CHUNK_ROWS):
+    # Читает CSV построчно и отдаёт порции [(номер строки, {столбец: значение})]; весь файл в память не загружается
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("Файл пуст.")
+    columns = _map_header(header)
+
+    chunk = []
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue
+        chunk.append((reader.line_num, {column: values[index] for index, column in columns if index < len(values)}))
+        if len(chunk) == chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_products(seller_id, path, workers=None, progress=None, chunk_rows=IMPORT_CHUNK_ROWS):
+    # Загружает товары продавца из CSV. Строки проверяются в процессах-обработчиках, одновременно
+    # в работе не больше двух порций на процесс, так что память не зависит от размера файла.
+    # Каждая порция записывается своей транзакцией; progress((прочитано строк, ошибок)) вызывается после неё,
+    # исключение из progress останавливает загрузку (уже записанные порции остаются).
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    rows = imported = 0
+    errors = []
+
+    def store(result):
+        nonlocal imported
+        valid, chunk_errors = result
+        errors.extend(chunk_errors)
+        imported += _insert_products(seller_id, valid)
+        if progress is not None:
+            progress((rows, len(errors)))
+
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        chunks = read_chunks(file, chunk_rows)
+        head = list(itertools.islice(chunks, 2))
+        chunks = itertools.chain(head, chunks)
+
+        if len(head) < 2 or workers == 1:
+            # Небольшой файл: запуск процессов дольше самой проверки
+            for chunk in chunks:
+                rows += len(chunk)
+                store(validate_rows(chunk))
+        else:
+            # spawn: процесс интерфейса многопоточный, fork в нём небезопасен
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    rows += len(chunk)
+                    pending.append(pool.submit(validate_rows, chunk))
+                    if len(pending) >= workers * 2:
+                        store(pending.popleft().result())
+                while pending:
+                    store(pending.popleft().result())
+
+    errors.sort()
+    return ImportReport(rows, imported, errors, time.perf_counter() - started)
+
+
+def _insert_products(seller_id, valid):
+    # Одна транзакция на порцию, товары одним executemany. id категорий берутся из category_registry:
+    # к базе обращаются только новые категории, они создаются до транзакции с товарами.
+    if not valid:
+        return 0
+    categories = category_registry.get_or_create_many(row[2] for row in valid)
+    conn = get_connection()
+    with conn:
+        conn.executemany(INSERT_PRODUCT, [(categories[category], title, description, price, quantity, seller_id)
+                                          for _, title, category, description, price, quantity in valid])
+    return len(valid)
+
+
+def _map_header(header):
+    # [(номер столбца в файле, имя столбца)] по заголовку; названия сравниваются без учёта регистра
+    aliases = {alias: column for column, names in IMPORT_COLUMNS.items() for alias in names}
+    columns = [(index, aliases[name.strip().lower()]) for index, name in enumerate(header) if name.strip().lower() in aliases]
+    missing = [column for column in REQUIRED_COLUMNS if column not in {column for _, column in columns}]
+    if missing:
+        raise ValueError("В заголовке файла нет столбцов: " + ", ".join(missing))
+    return columns
+
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import queries
+from database import get_connection
+from pricing import invalidate_prices
+
+# Формат дат акций в базе
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+MAX_DISCOUNT_PERCENT = 99
+
+PROMOTION_CHOICES = "SELECT id, name FROM promotions"
+INSERT_PROMOTION = """ INSERT INTO promotions (name, discount_percent, valid_from, valid_to) VALUES (?, ?, ?, ?) """
+ASSIGN_PROMOTION = "INSERT OR REPLACE INTO promotion_items (promotion_id, product_id) VALUES (?, ?)"
+REMOVE_PROMOTIONS = "DELETE FROM promotion_items WHERE product_id=?"
+
+
+def list_promotions():
+    # [(id, название, процент скидки, начало, конец)], новые сначала
+    return get_connection().execute(queries.PROMOTIONS).fetchall()
+
+
+def promotion_choices():
+    # [(id, название)] для выбора акции товару
+    return get_connection().execute(PROMOTION_CHOICES).fetchall()
+
+
+def create_promotion(name, discount_percent, valid_from, valid_to, now=None):
+    # Даты — строки в DATE_FORMAT. Возвращает id акции, ошибка — ValueError с текстом для пользователя.
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Введите название акции.")
+    if not 0 <= discount_percent <= MAX_DISCOUNT_PERCENT:
+        raise ValueError(f"Скидка должна быть от 0 до {MAX_DISCOUNT_PERCENT}%.")
+    start_dt = datetime.strptime(valid_from, DATE_FORMAT)
+    end_dt = datetime.strptime(valid_to, DATE_FORMAT)
+    if start_dt > end_dt:
+        raise ValueError("Дата окончания должна быть позже даты начала.")
+    if (now or datetime.now()) > end_dt:
+        raise ValueError("Срок действия акции истекает до настоящего времени.")
+
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(INSERT_PROMOTION, (name, discount_percent, valid_from, valid_to))
+    invalidate_prices()
+    return cursor.lastrowid
+
+
+def assign_promotion(product_id, promotion_id):
+    # Назначает товару акцию; None снимает все акции товара
+    conn = get_connection()
+    with conn:
+        if promotion_id is None:
+            conn.execute(REMOVE_PROMOTIONS, (product_id,))
+        else:
+            conn.execute(ASSIGN_PROMOTION, (promotion_id, product_id))
+    # Состав акций товара изменился, закэшированная цена больше не актуальна
+    invalidate_prices([product_id])
@@ -0,0 +1,58 @@
+# Запросы загрузчиков таблиц. Собраны в одном месте, чтобы их планы выполнения
+# можно было проверить (см. migrations.check_query_plans).
+
+# Строка каталога: товар, категория, средняя оценка и название акции.
+# Оценка берётся из product_rating_stats (одна строка на товар), акция — подзапросом,
+# поэтому каждый товар даёт ровно одну строку без GROUP BY.
+PRODUCT_COLUMNS = """ SELECT p.id, p.title, c.name AS category_name, p.description, p.price, p.quantity,
+    COALESCE(rs.ratings_sum * 1.0 / NULLIF(rs.ratings_count, 0), 0) AS avg_rating,
+    (SELECT pr.name FROM promotion_items pi INNER JOIN promotions pr ON pi.promotion_id = pr.id WHERE pi.product_id = p.id
+        ORDER BY pr.discount_percent DESC LIMIT 1) AS promotion_name """
+PRODUCT_JOINS = " LEFT JOIN categories c ON p.category_id = c.id LEFT JOIN product_rating_stats rs ON rs.product_id = p.id "
+PRODUCT_ROWS = PRODUCT_COLUMNS + " FROM products p " + PRODUCT_JOINS
+
+PRODUCT_DETAILS = PRODUCT_ROWS + " WHERE p.id = ? "
+
+# Полнотекстовый поиск по названию и описанию (см. search.py). Условия фильтра дописываются
+# после MATCH, сортировка — SEARCH_ORDER: совпадение в названии весит больше, чем в описании.
+PRODUCT_SEARCH = PRODUCT_COLUMNS + " FROM products_fts INNER JOIN products p ON p.id = products_fts.rowid " + PRODUCT_JOINS + \
+    " WHERE products_fts MATCH ? "
+SEARCH_ORDER = " ORDER BY bm25(products_fts, 10.0, 1.0) "
+
+# Заказы покупателя (итоги хранятся в заголовке заказа) и история продаж продавца. Условия и сортировку
+# по (created_at, id) и (sale_date, id) добавляет paging.KeysetQuery; s.seller_id заполняется триггером при вставке продажи.
+ORDER_ROWS = "SELECT o.id, o.created_at, o.items_count, o.total_quantity, o.total_amount FROM orders o"
+
+# Строки заказа загружаются, только когда покупатель раскрывает заказ
+PURCHASE_ROWS = """ SELECT s.id, p.title, s.sold_quantity, s.sale_price, s.sale_date, pr.name AS promotion_name FROM sales
+    s LEFT JOIN products p ON s.product_id = p.id LEFT JOIN promotions pr ON s.applied_promotion_id = pr.id """
+ORDER_ITEMS = PURCHASE_ROWS + " WHERE s.order_id = ? ORDER BY s.id "
+
+# Число заказов и их сумма по дням за период [с, по)
+ORDERS_PER_DAY = """ SELECT date(created_at) AS day, COUNT(*), SUM(total_amount) FROM orders
+    WHERE created_at >= ? AND created_at < ? GROUP BY day ORDER BY day """
+
+SALE_ROWS = """SELECT s.id, p.title, s.sold_quantity, s.sale_price, s.sale_date,
+    s.sale_price * s.sold_quantity - COALESCE(s.commission, 0) AS net_revenue
+    FROM sales s JOIN products p ON s.product_id = p.id """
+
+# Отзывы покупателя и товары, на которые он может оставить отзыв
+REVIEWS_BY_BUYER = """ SELECT r.id, p.title, r.rating, r.comment FROM reviews r JOIN products p ON r.product_id = p.id WHERE r.buyer_id = ? """
+BUYER_PRODUCT_REVIEW = "SELECT id FROM reviews WHERE buyer_id=? AND product_id=?"
+PURCHASED_PRODUCTS = """ SELECT DISTINCT p.id, p.title FROM sales s JOIN products p ON s.product_id = p.id WHERE s.buyer_id = ? """
+
+# Сохранённая корзина покупателя (cart.ShoppingCart)
+CART_ITEMS = "SELECT product_id, quantity FROM cart_items WHERE buyer_id = ?"
+TOUCH_CART = """ INSERT INTO carts (buyer_id) VALUES (?) ON CONFLICT (buyer_id) DO UPDATE SET updated_at = CURRENT_TIMESTAMP """
+UPSERT_CART_ITEM = """ INSERT INTO cart_items (buyer_id, product_id, quantity) VALUES (?,?,?)
+    ON CONFLICT (buyer_id, product_id) DO UPDATE SET quantity = excluded.quantity """
+DELETE_CART_ITEM = "DELETE FROM cart_items WHERE buyer_id = ? AND product_id = ?"
+CLEAR_CART = "DELETE FROM cart_items WHERE buyer_id = ?"
+
+# Отзывы о товарах продавца
+REVIEWS_BY_SELLER = """ SELECT u.first_name || ' ' || u.last_name AS full_name, p.title, r.rating, r.comment,
+    r.id FROM reviews r INNER JOIN users u ON r.buyer_id=u.id INNER JOIN products p ON r.product_id=p.id WHERE p.seller_id=? """
+REVIEWS_BY_SELLER_AND_TITLE = REVIEWS_BY_SELLER + " AND p.title LIKE ? "
+
+# Список акций
+PROMOTIONS = "SELECT * FROM promotions ORDER BY valid_from DESC"
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+from database import get_connection
+from pricing import current_timestamp
+
+# Сколько живёт резерв товара, положенного в корзину
+HOLD_TTL_SECONDS = 15 * 60
+
+# Как часто удалять истёкшие резервы (они и так не учитываются, это только уборка таблицы)
+SWEEP_INTERVAL_MS = 60 * 1000
+
+# Доступный остаток: количество на складе минус действующие резервы других покупателей
+# (свой резерв не уменьшает доступное покупателю количество). Сумма считается по индексу (product_id, expires_at).
+AVAILABLE_QUANTITY = """ SELECT p.quantity - ( SELECT COALESCE(SUM(h.quantity), 0) FROM stock_holds h
+    WHERE h.product_id = p.id AND h.expires_at > ? AND h.buyer_id != ? ) FROM products p WHERE p.id = ? """
+
+UPSERT_HOLD = """ INSERT INTO stock_holds (buyer_id, product_id, quantity, expires_at) VALUES (?,?,?,?)
+    ON CONFLICT (buyer_id, product_id) DO UPDATE SET quantity = excluded.quantity, expires_at = excluded.expires_at """
+
+
+def hold_expiry(ttl_seconds=HOLD_TTL_SECONDS):
+    return (datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def available_quantity(product_id, buyer_id=None):
+    # Остаток товара за вычетом чужих действующих резервов; None, если товара нет
+    row = get_connection().execute(AVAILABLE_QUANTITY, (current_timestamp(), buyer_id or 0, product_id)).fetchone()
+    return None if row is None else max(row[0], 0)
+
+
+def hold(buyer_id, product_id, quantity, ttl_seconds=HOLD_TTL_SECONDS):
+    # Резервирует за покупателем quantity единиц товара (итоговое количество, а не прибавку)
+    # и продлевает срок резерва. ValueError, если свободного остатка не хватает.
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(AVAILABLE_QUANTITY, (current_timestamp(), buyer_id, product_id)).fetchone()
+        if row is None:
+            raise ValueError(f"Товар №{product_id} больше не продаётся.")
+        if row[0] < quantity:
+            raise ValueError(f"Недостаточно товара: свободно {max(row[0], 0)} шт., запрошено {quantity}.")
+        conn.execute(UPSERT_HOLD, (buyer_id, product_id, quantity, hold_expiry(ttl_seconds)))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def hold_many(buyer_id, quantities, ttl_seconds=HOLD_TTL_SECONDS):
+    # Резервирует или продлевает резервы сразу нескольких товаров ({product_id: количество}) одной транзакцией.
+    # Возвращает {product_id: свободный остаток} для товаров, которых не хватило; их резервы не меняются.
+    if not quantities:
+        return {}
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = current_timestamp()
+        expires_at = hold_expiry(ttl_seconds)
+        shortages = {}
+        for product_id, quantity in quantities.items():
+            row = conn.execute(AVAILABLE_QUANTITY, (now, buyer_id, product_id)).fetchone()
+            available = 0 if row is None else max(row[0], 0)
+            if available < quantity:
+                shortages[product_id] = available
+                continue
+            conn.execute(UPSERT_HOLD, (buyer_id, product_id, quantity, expires_at))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return shortages
+
+
+def release(buyer_id, product_ids=None):
+    # Снимает резервы покупателя: все или по указанным товарам
+    conn = get_connection()
+    with conn:
+        if product_ids is None:
+            conn.execute("DELETE FROM stock_holds WHERE buyer_id = ?", (buyer_id,))
+        else:
+            conn.executemany("DELETE FROM stock_holds WHERE buyer_id = ? AND product_id = ?",
+                             [(buyer_id, product_id) for product_id in product_ids])
+
+
+def sweep_expired(now=None):
+    # Удаляет истёкшие резервы; возвращает их число
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("DELETE FROM stock_holds WHERE expires_at <= ?", (now or current_timestamp(),))
+    return cursor.rowcount
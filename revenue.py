@@ -0,0 +1,29 @@
+import queries
+from database import get_connection
+
+# Комиссия маркетплейса с каждой продажи
+COMMISSION_RATE = 0.006
+
+
+def sale_commission(sale_price, quantity):
+    # Комиссия записывается в саму продажу в момент её оформления
+    return sale_price * quantity * COMMISSION_RATE
+
+
+def marketplace_commission():
+    # Доход маркетплейса — накопленная сумма комиссий (revenue_totals, одна строка).
+    # Итоги поддерживаются триггерами на sales, поэтому чтение не зависит от числа продаж.
+    row = get_connection().execute("SELECT commission FROM revenue_totals WHERE id = 1").fetchone()
+    return round(row[0], 2) if row else 0.0
+
+
+def seller_net_revenue(seller_id):
+    # Доход продавца за вычетом комиссии по всем его продажам
+    row = get_connection().execute(
+        "SELECT gross - commission FROM seller_revenue_totals WHERE seller_id = ?", (seller_id,)).fetchone()
+    return round(row[0], 2) if row else 0.0
+
+
+def orders_per_day(date_from, date_to):
+    # Число заказов и их сумма по дням: [(день, заказов, сумма)]. Даты — строки 'YYYY-MM-DD', date_to не включается.
+    return get_connection().execute(queries.ORDERS_PER_DAY, (date_from, date_to)).fetchall()
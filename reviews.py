@@ -0,0 +1,75 @@
+import queries
+from database import get_connection
+
+# Допустимые оценки
+MIN_RATING = 1
+MAX_RATING = 5
+
+INSERT_REVIEW = "INSERT INTO reviews (buyer_id, product_id, rating, comment) VALUES (?,?,?,?)"
+BUYER_REVIEW = "SELECT rating, comment FROM reviews WHERE id=? AND buyer_id=?"
+UPDATE_REVIEW = "UPDATE reviews SET rating=?, comment=? WHERE id=? AND buyer_id=?"
+DELETE_REVIEW = "DELETE FROM reviews WHERE id=? AND buyer_id=?"
+
+# Отзыв можно оставить только на купленный товар
+PURCHASED_PRODUCT = "SELECT 1 FROM sales WHERE buyer_id = ? AND product_id = ? LIMIT 1"
+
+
+def buyer_reviews(buyer_id):
+    # [(id отзыва, товар, оценка, комментарий)]
+    return get_connection().execute(queries.REVIEWS_BY_BUYER, (buyer_id,)).fetchall()
+
+
+def purchased_products(buyer_id):
+    # Товары, на которые покупатель может оставить отзыв: [(id товара, название)]
+    return get_connection().execute(queries.PURCHASED_PRODUCTS, (buyer_id,)).fetchall()
+
+
+def get_review(review_id, buyer_id):
+    # (оценка, комментарий) отзыва покупателя или None
+    return get_connection().execute(BUYER_REVIEW, (review_id, buyer_id)).fetchone()
+
+
+def add_review(buyer_id, product_id, rating, comment):
+    # Один отзыв покупателя на купленный товар. Возвращает id отзыва, ошибка — ValueError с текстом для пользователя.
+    if not product_id:
+        raise ValueError("Выберите товар для отзыва.")
+    _check_rating(rating)
+    conn = get_connection()
+    if conn.execute(PURCHASED_PRODUCT, (buyer_id, product_id)).fetchone() is None:
+        raise ValueError("Отзыв можно оставить только на купленный товар.")
+    if conn.execute(queries.BUYER_PRODUCT_REVIEW, (buyer_id, product_id)).fetchone():
+        raise ValueError("Вы уже оставили отзыв на этот товар.")
+    with conn:
+        cursor = conn.execute(INSERT_REVIEW, (buyer_id, product_id, rating, (comment or "").strip()))
+    return cursor.lastrowid
+
+
+def update_review(review_id, buyer_id, rating, comment):
+    # False, если у покупателя нет такого отзыва
+    _check_rating(rating)
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(UPDATE_REVIEW, (rating, (comment or "").strip(), review_id, buyer_id))
+    return cursor.rowcount > 0
+
+
+def delete_review(review_id, buyer_id):
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(DELETE_REVIEW, (review_id, buyer_id))
+    return cursor.rowcount > 0
+
+
+def seller_reviews(seller_id, product_title=None):
+    # Отзывы о товарах продавца, при необходимости — только по товарам с product_title в названии.
+    # [(имя покупателя, товар, оценка, комментарий, id отзыва)]
+    if product_title:
+        sql, params = queries.REVIEWS_BY_SELLER_AND_TITLE, (seller_id, '%' + product_title + '%')
+    else:
+        sql, params = queries.REVIEWS_BY_SELLER, (seller_id,)
+    return get_connection().execute(sql, params).fetchall()
+
+
+def _check_rating(rating):
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise ValueError(f"Оценка должна быть от {MIN_RATING} до {MAX_RATING}.")
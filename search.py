@@ -0,0 +1,60 @@
+import re
+
+import queries
+from database import get_connection
+from paging import PAGE_SIZE, catalog_query
+from pricing import get_discounted_prices
+
+# Слово запроса: последовательность букв и цифр в любом алфавите
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(text):
+    # Превращает строку поиска в выражение FTS5: каждое слово ищется по префиксу, все слова обязательны.
+    # Слова берутся в кавычки, поэтому операторы FTS5 (AND, NEAR, *) из ввода пользователя не интерпретируются.
+    tokens = _TOKEN.findall(text or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def product_pages(text=None, category_id=None, seller_id=None):
+    # Источник страниц каталога для ProductTableModel: fetch_page(after, limit) -> (строки, цены, after следующей страницы).
+    # Без строки поиска товары идут по названию и листаются курсором (paging.KeysetQuery).
+    # С поиском порядок задаёт bm25, который не индексируется, поэтому результаты листаются через OFFSET.
+    match_query = build_match_query(text)
+    if match_query is None:
+        query = catalog_query(category_id=category_id, seller_id=seller_id)
+
+        def fetch_page(cursor, limit):
+            page = query.page(cursor, limit)
+            return page.rows, get_discounted_prices(row[0] for row in page.rows), page.cursor
+
+        return fetch_page
+
+    sql = queries.PRODUCT_SEARCH
+    params = [match_query]
+    if category_id is not None:
+        sql += " AND p.category_id = ? "
+        params.append(category_id)
+    if seller_id is not None:
+        sql += " AND p.seller_id = ? "
+        params.append(seller_id)
+    sql += queries.SEARCH_ORDER + ", p.id LIMIT ? OFFSET ? "
+
+    def fetch_page(offset, limit):
+        offset = offset or 0
+        cursor = get_connection().cursor()
+        cursor.execute(sql, params + [limit, offset])
+        rows = cursor.fetchall()
+        next_offset = offset + len(rows) if len(rows) == limit else None
+        return rows, get_discounted_prices(row[0] for row in rows), next_offset
+
+    return fetch_page
+
+
+def search_catalog(text, category_id=None, seller_id=None, limit=PAGE_SIZE):
+    # Источник страниц для результата поиска и уже загруженная первая страница.
+    # Функция не трогает виджеты, поэтому её можно выполнять в рабочем потоке.
+    fetch_page = product_pages(text, category_id=category_id, seller_id=seller_id)
+    return fetch_page, fetch_page(None, limit)
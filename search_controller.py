@@ -0,0 +1,108 @@
+import threading
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from database import get_connection
+
+
+class _SearchSignals(QObject):
+    # Сигналы передают результат из рабочего потока в поток интерфейса вместе с номером запроса
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class _SearchTask(QRunnable):
+    def __init__(self, generation, search_func, args, is_current, signals):
+        super().__init__()
+        self.generation = generation
+        self.search_func = search_func
+        self.args = args
+        self.is_current = is_current
+        self.signals = signals
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        # Запрос мог устареть, пока ждал своей очереди
+        if not self.is_current(self.generation):
+            return
+        with self._lock:
+            self._conn = get_connection()
+        try:
+            result = self.search_func(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        finally:
+            with self._lock:
+                self._conn = None
+        self.signals.finished.emit(self.generation, result)
+
+    def interrupt(self):
+        # Прерываем выполняющийся SQL-запрос, если задача ещё работает
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+
+class SearchController(QObject):
+    # Откладывает поиск до паузы в наборе текста, выполняет его в рабочем потоке
+    # и отдаёт только результат самого последнего запроса
+    results_ready = pyqtSignal(object)
+    search_failed = pyqtSignal(str)
+
+    def __init__(self, search_func, delay_ms=250, parent=None):
+        super().__init__(parent)
+        self.search_func = search_func
+        self._generation = 0
+        self._pending_args = ()
+        self._running_task = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._start)
+
+        # Один поток: устаревшие запросы всё равно отбрасываются, параллельно их выполнять незачем
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+
+        self._signals = _SearchSignals()
+        self._signals.finished.connect(self._on_finished)
+        self._signals.failed.connect(self._on_failed)
+
+    def request(self, *args):
+        # Новый ввод делает устаревшими все предыдущие запросы
+        self._generation += 1
+        self._pending_args = args
+        self._interrupt_running()
+        self._timer.start()
+
+    def cancel(self):
+        self._generation += 1
+        self._timer.stop()
+        self._interrupt_running()
+
+    def _is_current(self, generation):
+        return generation == self._generation
+
+    def _interrupt_running(self):
+        if self._running_task is not None:
+            self._running_task.interrupt()
+            self._running_task = None
+
+    def _start(self):
+        task = _SearchTask(self._generation, self.search_func, self._pending_args, self._is_current, self._signals)
+        self._running_task = task
+        self._pool.start(task)
+
+    def _on_finished(self, generation, result):
+        if generation == self._generation:
+            self._running_task = None
+            self.results_ready.emit(result)
+
+    def _on_failed(self, generation, message):
+        # Ошибки устаревших запросов (в том числе прерванных) не показываем
+        if generation == self._generation:
+            self._running_task = None
+            self.search_failed.emit(message)
@@ -0,0 +1,394 @@
+import atexit
+import collections
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+# Трассировка SQL включается параметром database.configure(trace=True) или переменной окружения
+# MARKETPLACE_SQL_TRACE=1: соединения тогда открываются классом TracedConnection.
+# Для каждого запроса копятся число вызовов, строк, выполненных SQLite операторов (включая триггеры и BEGIN),
+# шагов виртуальной машины и гистограмма времени — отдельно для каждой цепочки вызывающих функций приложения.
+# Время запроса — это выполнение и чтение всех его строк. Отчёт пишется в REPORT_DIR при выходе или по dump().
+REPORT_DIR = os.environ.get('MARKETPLACE_SQL_TRACE_DIR', '.')
+# Раз во сколько инструкций виртуальной машины SQLite вызывается обработчик прогресса
+PROGRESS_STEPS = 1000
+MAX_STACK_DEPTH = 32
+# Границы корзин гистограммы в микросекундах: 16, 32, 64, ... (последняя корзина — всё, что дольше)
+HISTOGRAM_BUCKETS = 21
+FIRST_BUCKET_BITS = 4
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+# Собственные кадры трассировки и модуля соединений в цепочку вызовов не попадают
+_SKIPPED_MODULES = {"sql_trace", "database"}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w?])\d+(?:\.\d+)?")
+_SPACES = re.compile(r"\s+")
+
+_stats = {}  # (цепочка вызовов, запрос) -> QueryStats
+_lock = threading.Lock()
+# Завершённые вызовы, ещё не перенесённые в _stats. Вызов записывается без ожидания _lock:
+# TracedCursor.__del__ может сработать при сборке мусора в потоке, который сам держит _lock
+_pending = collections.deque()
+_local = threading.local()
+_labels = {}  # объект кода -> "модуль.Класс.функция" или None для кода вне приложения
+_started = datetime.now()
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql):
+    # Текст запроса без литералов и лишних пробелов: запросы с разными значениями попадают в одну строку отчёта
+    return _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()
+
+
+def _label(code):
+    try:
+        return _labels[code]
+    except KeyError:
+        pass
+    path = os.path.abspath(code.co_filename)
+    module = os.path.splitext(os.path.basename(path))[0]
+    label = None
+    if os.path.dirname(path) == _ROOT and module not in _SKIPPED_MODULES:
+        label = f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+    _labels[code] = label
+    return label
+
+
+def _caller_stack():
+    # Функции приложения от внешней к внутренней, например ("main.BuyerDashboard.loadAllProducts", "pricing.get_discounted_price")
+    stack = []
+    frame = sys._getframe(1)
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        label = _label(frame.f_code)
+        if label is not None:
+            stack.append(label)
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class QueryStats:
+    __slots__ = ("calls", "rows", "statements", "steps", "total", "max", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.statements = 0
+        self.steps = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, call):
+        self.calls += 1
+        self.rows += call.rows
+        self.statements += call.statements
+        self.steps += call.steps
+        self.total += call.elapsed
+        self.max = max(self.max, call.elapsed)
+        micros = int(call.elapsed * 1_000_000)
+        self.histogram[min(max(micros.bit_length() - FIRST_BUCKET_BITS, 0), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.rows += other.rows
+        self.statements += other.statements
+        self.steps += other.steps
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def percentile(self, fraction):
+        # Верхняя граница корзины, в которую попадает нужная доля вызовов, в секундах
+        needed = self.calls * fraction
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= needed:
+                return min(2 ** (bucket + FIRST_BUCKET_BITS) / 1_000_000, self.max)
+        return self.max
+
+
+class _Call:
+    # Один вызов запроса: копит время выполнения и чтения строк, пока курсор не дочитан или не закрыт
+    __slots__ = ("key", "elapsed", "rows", "statements", "steps", "_start", "_outer")
+
+    def __init__(self, sql):
+        self.key = (_caller_stack(), normalize(sql))
+        self.elapsed = 0.0
+        self.rows = 0
+        self.statements = 0
+        self.steps = 0
+
+    def __enter__(self):
+        # Операторы SQLite и шаги виртуальной машины в это время засчитываются этому вызову
+        self._outer = getattr(_local, 'call', None)
+        _local.call = self
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed += time.perf_counter() - self._start
+        _local.call = self._outer
+        return False
+
+
+def _record(call):
+    _pending.append(call)
+    # Занятую блокировку не ждём: очередь разберёт следующий вызов или snapshot()
+    if _lock.acquire(blocking=False):
+        try:
+            _drain()
+        finally:
+            _lock.release()
+
+
+def _drain():
+    # Переносит очередь в _stats; вызывается под _lock
+    while _pending:
+        call = _pending.popleft()
+        stats = _stats.get(call.key)
+        if stats is None:
+            stats = _stats[call.key] = QueryStats()
+        stats.add(call)
+
+
+def _on_statement(sql):
+    call = getattr(_local, 'call', None)
+    if call is not None:
+        call.statements += 1
+
+
+def _on_progress():
+    call = getattr(_local, 'call', None)
+    if call is not None:
+        call.steps += PROGRESS_STEPS
+    # Ноль — продолжить выполнение запроса
+    return 0
+
+
+class TracedCursor(sqlite3.Cursor):
+    _call = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        call = self._call = _Call(sql)
+        with call:
+            super().execute(sql, parameters)
+        if self.description is None:
+            # Запрос без результата (INSERT, UPDATE, ...) завершён сразу
+            call.rows = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        call = self._call = _Call(sql)
+        with call:
+            super().executemany(sql, seq_of_parameters)
+        call.rows = max(self.rowcount, 0)
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        call = self._call = _Call(sql_script)
+        with call:
+            super().executescript(sql_script)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._fetch(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        elif self._call is not None:
+            self._call.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._fetch(sqlite3.Cursor.fetchmany, size)
+        self._count(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(sqlite3.Cursor.fetchall)
+        self._count(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._fetch(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._call is not None:
+            self._call.rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Недочитанный курсор (например, после одного fetchone) засчитывается, когда его выбросили
+        self._finish()
+
+    def _fetch(self, fetch, *args):
+        call = self._call
+        if call is None:
+            return fetch(self, *args)
+        with call:
+            return fetch(self, *args)
+
+    def _count(self, rows):
+        if self._call is not None:
+            self._call.rows += len(rows)
+
+    def _finish(self):
+        call = self._call
+        if call is not None:
+            self._call = None
+            _record(call)
+
+
+class TracedConnection(sqlite3.Connection):
+    # Соединение, все запросы которого идут через TracedCursor; фиксация и откат тоже учитываются
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_on_statement)
+        self.set_progress_handler(_on_progress, PROGRESS_STEPS)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        self._end_transaction("COMMIT", super().commit)
+
+    def rollback(self):
+        self._end_transaction("ROLLBACK", super().rollback)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Выход из with фиксирует или откатывает транзакцию сам, не через commit()/rollback()
+        exit = super().__exit__
+        return self._end_transaction("COMMIT" if exc_type is None else "ROLLBACK",
+                                     lambda: exit(exc_type, exc_value, traceback))
+
+    def _end_transaction(self, name, end):
+        if not self.in_transaction:
+            return end()
+        call = _Call(name)
+        try:
+            with call:
+                return end()
+        finally:
+            _record(call)
+
+
+def snapshot():
+    # Копия накопленной статистики: {(цепочка вызовов, запрос): QueryStats}
+    with _lock:
+        _drain()
+        copies = {}
+        for key, stats in _stats.items():
+            copy = copies[key] = QueryStats()
+            copy.merge(stats)
+        return copies
+
+
+def reset():
+    global _started
+    with _lock:
+        _pending.clear()
+        _stats.clear()
+        _started = datetime.now()
+
+
+def _caller_name(stack):
+    # Вызывающая функция и та, что вызвала её: "main.BuyerDashboard.loadAllProducts → pricing.get_discounted_price"
+    return " → ".join(stack[-2:]) if stack else "<вне приложения>"
+
+
+def _grouped(items, key):
+    groups = {}
+    for (stack, sql), stats in items:
+        name = key(stack, sql)
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = QueryStats()
+        group.merge(stats)
+    return sorted(groups.items(), key=lambda item: item[1].total, reverse=True)
+
+
+def _stats_line(stats):
+    return (f"{stats.total * 1000:>11.1f}{stats.calls:>9}{stats.rows:>10}{stats.statements:>9}{stats.steps:>12}"
+            f"{stats.total / stats.calls * 1000:>10.3f}{stats.percentile(0.5) * 1000:>10.3f}"
+            f"{stats.percentile(0.95) * 1000:>10.3f}{stats.max * 1000:>10.3f}")
+
+
+def summary():
+    # Текстовый отчёт: запросы и вызывающие функции по суммарному времени
+    items = list(snapshot().items())
+    header = (f"{'всего, мс':>11}{'вызовов':>9}{'строк':>10}{'операт.':>9}{'шагов ВМ':>12}"
+              f"{'сред, мс':>10}{'p50, мс':>10}{'p95, мс':>10}{'макс, мс':>10}")
+    total = sum(stats.total for _, stats in items)
+    lines = [f"Трассировка SQL с {_started:%Y-%m-%d %H:%M:%S}: {sum(stats.calls for _, stats in items)} вызовов, "
+             f"{total * 1000:.1f} мс", "", "Запросы", header]
+    for sql, stats in _grouped(items, lambda stack, sql: sql):
+        lines.append(f"{_stats_line(stats)}  {sql}")
+        callers = _grouped([item for item in items if item[0][1] == sql], lambda stack, sql: _caller_name(stack))
+        for caller, caller_stats in callers:
+            lines.append(f"{'':>11}{caller_stats.calls:>9}{'':>10}{'':>9}{'':>12}"
+                         f"{caller_stats.total / caller_stats.calls * 1000:>10.3f}{'':>30}  ← {caller}")
+    lines += ["", "Вызывающие функции", header]
+    for caller, stats in _grouped(items, lambda stack, sql: _caller_name(stack)):
+        lines.append(f"{_stats_line(stats)}  {caller}")
+    return "\n".join(lines) + "\n"
+
+
+def folded():
+    # Свёрнутые стеки для flamegraph.pl / speedscope: "функция;функция;запрос микросекунды"
+    lines = []
+    for (stack, sql), stats in snapshot().items():
+        frames = [frame.replace(";", ",") for frame in stack]
+        frames.append(sql.replace(";", ",")[:200])
+        lines.append(f"{';'.join(frames)} {int(stats.total * 1_000_000)}")
+    return "\n".join(sorted(lines)) + "\n"
+
+
+def dump(directory=None):
+    # Записывает отчёт и свёрнутые стеки рядом; возвращает пути к файлам
+    directory = REPORT_DIR if directory is None else directory
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"sql_trace-{datetime.now():%Y%m%d-%H%M%S}")
+    paths = (base + ".txt", base + ".folded")
+    for path, text in zip(paths, (summary(), folded())):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(text)
+    return paths
+
+
+def _dump_at_exit():
+    if _stats or _pending:
+        for path in dump():
+            print(f"Трассировка SQL: {path}")
+
+
+atexit.register(_dump_at_exit)